@@ -4,10 +4,68 @@
 """
 import streamlit as st
 import requests
-from datetime import datetime
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import os
+import io
+import time
+import base64
+import hashlib
+import atexit
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from datetime import datetime, date, timedelta
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit, unquote
+from PIL import Image
+from frontend.api_client import CircuitBreaker, new_session
 
 # ============== API 設定 ==============
-API_BASE_URL = "https://sax-b2b-platform.zeabur.app"
+API_BASE_URL = os.environ.get("API_BASE_URL", "https://sax-b2b-platform.zeabur.app")
+# 內嵌模式：同一行程載入 backend.main，請求直接交給 ASGI app，不經網路
+EMBEDDED_BACKEND = os.environ.get("EMBEDDED_BACKEND", "").lower() in ("1", "true", "yes")
+
+# 各端點快取秒數；未列出的端點不快取
+CACHE_TTL = {
+    "/api/products": 60,
+    "/api/categories": 3600,
+    "/api/inventory": 15,
+    "/api/inventory/low-stock": 15,
+    "/api/finance/summary": 30,
+    "/api/finance/analytics": 30,
+    "/api/cart": 30,
+    "/api/quote": 30,
+    "/api/orders": 30,
+    "/api/recommendations": 300,
+}
+# 依登入使用者區分快取的端點
+USER_SCOPED = {"/api/cart", "/api/quote", "/api/orders", "/api/recommendations"}
+# api_post 成功後需要失效的快取
+INVALIDATES = {
+    "/api/cart": ["/api/cart", "/api/quote", "/api/recommendations"],
+    "/api/orders": ["/api/cart", "/api/quote", "/api/recommendations", "/api/orders", "/api/finance/summary", "/api/finance/analytics", "/api/inventory", "/api/inventory/low-stock"],
+    "/api/products": ["/api/products", "/api/inventory", "/api/inventory/low-stock", "/api/quote"],
+}
+CACHE_MAX_ENTRIES = 512
+
+# (連線, 讀取) 逾時秒數
+GET_TIMEOUT = (3.05, 10)
+POST_TIMEOUT = (3.05, 30)
+FETCH_WORKERS = 8
+
+# 商品格線縮圖
+THUMB_SIZE = 480
+THUMB_CACHE_MAX = 1000
+
+# 商品列表分頁：每頁卡片數選項，一次最多產生 PRODUCTS_PAGE_MAX 張卡片
+PRODUCTS_PAGE_SIZES = [12, 24, 48]
+PRODUCTS_PAGE_MAX = 48
+
+# 低庫存通知：輪詢 /api/changes 的秒數
+LOW_STOCK_POLL = 15
 
 # ============== 亮色奢華 CSS 風格 ==============
 st.markdown("""
@@ -117,21 +175,341 @@ if 'page' not in st.session_state:
     st.session_state.page = 'home'
 if 'user' not in st.session_state: 
     st.session_state.user = None
+if 'api_calls' not in st.session_state:
+    st.session_state.api_calls = 0
+# 整支腳本執行次數；fragment 局部重跑不會經過這裡
+st.session_state.script_runs = st.session_state.get('script_runs', 0) + 1
+if 'products_page' not in st.session_state:
+    st.session_state.products_page = 1
+st.session_state.degraded = False
+
+# ============== HTTP 連線 ==============
+class ASGIAdapter(BaseAdapter):
+    """requests 轉接器：把請求交給同一行程內的 ASGI app。
+    app 在背景執行緒的事件迴圈上執行，啟動時先跑 lifespan startup"""
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="asgi", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._startup(), self.loop).result()
+        atexit.register(self.close)
+
+    async def _startup(self):
+        self.inbox, started = asyncio.Queue(), asyncio.get_running_loop().create_future()
+        await self.inbox.put({"type": "lifespan.startup"})
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup") and not started.done():
+                started.set_result(message)
+
+        # lifespan 協程保持執行，直到 close() 送出 shutdown
+        self.lifespan = asyncio.ensure_future(self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, self.inbox.get, send))
+        message = await started
+        if message["type"] == "lifespan.startup.failed":
+            raise RuntimeError(message.get("message", "backend startup failed"))
+
+    async def _shutdown(self):
+        await self.inbox.put({"type": "lifespan.shutdown"})
+        await asyncio.wait_for(self.lifespan, 5)
+
+    async def _call(self, scope, body):
+        response = {"status": 500, "headers": [], "body": []}
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"], response["headers"] = message["status"], message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # 例外已由 app 轉成 500 回應時照常回傳，否則視為連線失敗
+            if not response["body"]:
+                raise
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": request.method,
+            "scheme": url.scheme, "path": unquote(url.path), "raw_path": url.path.encode(), "root_path": "",
+            "query_string": url.query.encode(), "client": ("127.0.0.1", 0), "server": (url.hostname, url.port or 80),
+            "headers": [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in request.headers.items()],
+        }
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        future = asyncio.run_coroutine_threadsafe(self._call(scope, body), self.loop)
+        try:
+            result = future.result(read_timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise requests.ReadTimeout(f"embedded backend timed out after {read_timeout}s", request=request)
+        except Exception as e:
+            raise requests.ConnectionError(str(e), request=request)
+
+        response = requests.Response()
+        response.status_code = result["status"]
+        response.reason = HTTPStatus(result["status"]).phrase
+        response.headers = CaseInsensitiveDict({k.decode("latin-1"): v.decode("latin-1") for k, v in result["headers"]})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = b"".join(result["body"])
+        response.url, response.request = request.url, request
+        return response
+
+    def close(self):
+        if self.loop.is_running() and not self.lifespan.done():
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(10)
+            except Exception:
+                pass
+
+@st.cache_resource
+def http_session():
+    """共用 keep-alive 連線池，重試設定見 api_client.new_session"""
+    session = new_session()
+    if EMBEDDED_BACKEND:
+        from backend.main import app as backend_app
+        session.mount(API_BASE_URL, ASGIAdapter(backend_app))
+    return session
+
+@st.cache_resource
+def backend_breaker():
+    return CircuitBreaker()
+
+@st.cache_resource
+def fetch_pool():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="api")
+
+# ============== API 快取 ==============
+@st.cache_resource
+def api_cache():
+    """跨 session 共用的快取：key -> (到期時間, 資料)"""
+    return {"lock": threading.Lock(), "entries": {}}
+
+def current_user_id():
+    return st.session_state.user['id'] if st.session_state.user else None
+
+def cache_key(url, params=None):
+    path, _, query = url.partition("?")
+    args = tuple(sorted(parse_qsl(query) + [(k, str(v)) for k, v in (params or {}).items()]))
+    return (path, args, current_user_id() if path in USER_SCOPED else None)
+
+def invalidate(url):
+    """依 INVALIDATES 移除受影響的快取"""
+    drop_cached(INVALIDATES.get(url.partition("?")[0], []))
+
+def drop_cached(targets):
+    """移除指定端點的快取；使用者專屬端點只清目前使用者"""
+    user_id = current_user_id()
+    cache = api_cache()
+    with cache["lock"]:
+        for key in [k for k in cache["entries"] if k[0] in targets and (k[0] not in USER_SCOPED or k[2] == user_id)]:
+            del cache["entries"][key]
+
+def cache_put(key, data):
+    cache = api_cache()
+    with cache["lock"]:
+        entries = cache["entries"]
+        if len(entries) >= CACHE_MAX_ENTRIES:
+            now_ts = time.time()
+            for k in [k for k, (expires, _) in entries.items() if expires <= now_ts] or list(entries)[:len(entries) // 4]:
+                del entries[k]
+        entries[key] = (time.time() + CACHE_TTL[key[0]], data)
 
 # ============== API 函數 ==============
-def api_get(url, params=None):
+def stale(key):
+    """後端異常時改用已過期的快取，並標記頁面為降級模式"""
+    st.session_state.degraded = True
+    hit = api_cache()["entries"].get(key)
+    return hit[1] if hit else None
+
+def cached(key):
+    if key[0] in CACHE_TTL:
+        hit = api_cache()["entries"].get(key)
+        if hit and hit[0] > time.time():
+            return hit[1]
+    return None
+
+def fetch(session, url, params=None):
+    """只做 HTTP 請求，可在工作執行緒執行；回傳 (狀態碼, 資料)，連線失敗或回應非 JSON 時狀態碼為 None"""
     try:
-        r = requests.get(f"{API_BASE_URL}{url}", params=params, timeout=10)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
+        r = session.get(f"{API_BASE_URL}{url}", params=params, timeout=GET_TIMEOUT)
+        return r.status_code, r.json() if r.status_code == 200 else None
+    except (requests.RequestException, ValueError):
+        return None, None
+
+def settle(key, outcome):
+    """在主執行緒依結果更新斷路器與快取"""
+    status, data = outcome
+    breaker = backend_breaker()
+    if status is None or status >= 500:
+        breaker.failure()
+        return stale(key)
+    breaker.success()
+    if data is not None and key[0] in CACHE_TTL:
+        cache_put(key, data)
+    return data
+
+def api_get(url, params=None):
+    key = cache_key(url, params)
+    hit = cached(key)
+    if hit is not None:
+        return hit
+    if not backend_breaker().allow():
+        return stale(key)
+    st.session_state.api_calls += 1
+    return settle(key, fetch(http_session(), url, params))
+
+def api_get_many(needs):
+    """同時抓取頁面宣告的資料 {名稱: (url, params)}，依完成順序 yield (名稱, 資料)"""
+    session, pending = http_session(), {}
+    for name, (url, params) in needs.items():
+        key = cache_key(url, params)
+        hit = cached(key)
+        if hit is not None:
+            yield name, hit
+        elif not backend_breaker().allow():
+            yield name, stale(key)
+        else:
+            st.session_state.api_calls += 1
+            pending[fetch_pool().submit(fetch, session, url, params)] = (name, key)
+    for future in as_completed(pending):
+        name, key = pending[future]
+        yield name, settle(key, future.result())
 
 def api_post(url, data=None, files=None):
+    breaker = backend_breaker()
+    if not breaker.allow():
+        st.session_state.degraded = True
+        return {"error": "後端暫時無法連線，請稍後再試"}
+    st.session_state.api_calls += 1
     try:
-        r = requests.post(f"{API_BASE_URL}{url}", data=data, files=files, timeout=30)
-        return r.json() if r.status_code == 200 else {"error": r.text}
-    except Exception as e:
+        r = http_session().post(f"{API_BASE_URL}{url}", data=data, files=files, timeout=POST_TIMEOUT)
+    except requests.RequestException as e:
+        breaker.failure()
         return {"error": str(e)}
+    if r.status_code >= 500:
+        breaker.failure()
+    else:
+        breaker.success()
+    if r.status_code != 200:
+        return {"error": r.text}
+    invalidate(url)
+    try:
+        return r.json()
+    except ValueError:
+        # 200 但非 JSON（多半是代理或閘道的錯誤頁），視同後端失敗
+        breaker.failure()
+        return {"error": "後端回應格式錯誤"}
+
+# ============== 商品圖片 ==============
+@st.cache_resource
+def thumbnail_cache():
+    """跨 session 共用的縮圖 LRU：內容雜湊 -> 縮圖 data URI"""
+    return {"lock": threading.Lock(), "entries": OrderedDict()}
+
+def downscale(data_uri):
+    header, _, payload = data_uri.partition(",")
+    with Image.open(io.BytesIO(base64.b64decode(payload))) as img:
+        img = img.convert("RGB")
+        img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=80, optimize=True)
+    return f"data:image/jpeg;base64,{base64.b64encode(buf.getvalue()).decode('utf-8')}"
+
+def fetch_image(url):
+    """後端縮圖為網址；經共用連線取回後轉成 data URI（內嵌模式下瀏覽器連不到後端）"""
+    try:
+        r = http_session().get(f"{API_BASE_URL}{url}", timeout=GET_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if r.status_code != 200:
+        return None
+    mime = r.headers.get("content-type", "image/jpeg")
+    return f"data:{mime};base64,{base64.b64encode(r.content).decode('utf-8')}"
+
+def product_thumbnail(p):
+    """取得商品第一張圖的縮圖；優先用後端產生的縮圖，舊商品才在前端縮一次"""
+    if not p.get('images'):
+        return None
+    variant = (p.get('image_variants') or [None])[0]
+    if variant:
+        key = variant['sha256']
+    else:
+        key = hashlib.sha1(p['images'][0].encode()).hexdigest()
+    cache = thumbnail_cache()
+    with cache["lock"]:
+        if key in cache["entries"]:
+            cache["entries"].move_to_end(key)
+            return cache["entries"][key]
+    if variant:
+        thumb = fetch_image(variant['thumbnails'].get(str(THUMB_SIZE)) or variant['webp'])
+        if not thumb:
+            return None
+    else:
+        try:
+            thumb = downscale(p['images'][0])
+        except Exception:
+            return None
+    with cache["lock"]:
+        cache["entries"][key] = thumb
+        while len(cache["entries"]) > THUMB_CACHE_MAX:
+            cache["entries"].popitem(last=False)
+    return thumb
+
+def product_card_html(p):
+    thumb = product_thumbnail(p)
+    img_html = ""
+    if thumb:
+        img_html = f'<img src="{thumb}" loading="lazy" decoding="async" style="width: 100%; height: 180px; object-fit: cover; margin-bottom: 15px;">'
+    elif p.get('image_status') == "processing":
+        img_html = '<div style="height: 180px; margin-bottom: 15px; line-height: 180px; color: #999; background: #F5F5F5;">圖片處理中</div>'
+    return f"""
+    <div class="product-item">
+        {img_html}
+        <h4 style="color: #B8860B !important; font-size: 16px; margin-bottom: 10px;">{p['name']}</h4>
+        <p style="color: #666; font-size: 13px;">{p.get('brand', '')} • {p.get('category', '')}</p>
+        <p style="color: #1A1A1A; font-size: 18px; margin-top: 10px;">${p.get('price', 'N/A')}</p>
+    </div>
+    """
+
+def show_product(product_id):
+    st.session_state.page = "product"
+    st.session_state.product_id = product_id
+
+@st.fragment
+def cart_action(product_id, key):
+    """加入購物車按鈕；點擊只重跑這個區塊"""
+    if st.button("加入購物車", key=key):
+        res = api_post("/api/cart", {"buyer_id": st.session_state.user['id'], "product_id": product_id})
+        if res and "error" not in res:
+            st.success("已加入!")
+
+def recommendations_row(params, key):
+    """經常一起購買；沒有共購紀錄時不顯示"""
+    data = api_get("/api/recommendations", params)
+    recs = data.get('recommendations') if data else None
+    if not recs:
+        return
+    st.markdown("#### 經常一起購買")
+    cols = st.columns(len(recs))
+    for col, rec in zip(cols, recs):
+        p = rec['product']
+        with col:
+            st.markdown(product_card_html(p), unsafe_allow_html=True)
+            st.button("查看詳情", key=f"{key}_{p['id']}", on_click=show_product, args=(p['id'],))
 
 # ============== 頁面：首頁 ==============
 def page_home():
@@ -193,33 +571,30 @@ def page_home():
         cols = st.columns(4)
         for i, p in enumerate(result['products']):
             with cols[i]:
-                img_html = ""
-                if p.get('images'):
-                    img_html = f'<img src="{p["images"][0]}" style="width: 100%; height: 180px; object-fit: cover; margin-bottom: 15px;">'
-                
-                st.markdown(f"""
-                <div class="product-item">
-                    {img_html}
-                    <h4 style="color: #B8860B !important; font-size: 16px; margin-bottom: 10px;">{p['name']}</h4>
-                    <p style="color: #666; font-size: 13px;">{p.get('brand', '')} • {p.get('category', '')}</p>
-                    <p style="color: #1A1A1A; font-size: 18px; margin-top: 10px;">${p.get('price', 'N/A')}</p>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(product_card_html(p), unsafe_allow_html=True)
+                st.button("查看詳情", key=f"home_detail_{p['id']}", on_click=show_product, args=(p['id'],))
 
 # ============== 頁面：商品 ==============
+def set_products_page(page):
+    st.session_state.products_page = page
+
 def page_products():
     st.markdown('<div class="section-title">全部商品</div>', unsafe_allow_html=True)
     
-    # 篩選
-    c1, c2, c3 = st.columns([1, 1, 1])
+    # 篩選（變更時回到第一頁）
+    reset = dict(on_change=set_products_page, args=(1,))
+    c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
     with c1:
-        cat = st.selectbox("類型", ["全部", "Alto", "Tenor", "Soprano", "Baritone"])
+        cat = st.selectbox("類型", ["全部", "Alto", "Tenor", "Soprano", "Baritone"], **reset)
     with c2:
-        brand = st.selectbox("品牌", ["全部", "Selmer", "Yamaha", "Yanagisawa", "Keilwerth"])
+        brand = st.selectbox("品牌", ["全部", "Selmer", "Yamaha", "Yanagisawa", "Keilwerth"], **reset)
     with c3:
-        status = st.selectbox("庫存", ["active", "inactive"])
+        status = st.selectbox("庫存", ["active", "inactive"], **reset)
+    with c4:
+        limit = min(st.selectbox("每頁", PRODUCTS_PAGE_SIZES, **reset), PRODUCTS_PAGE_MAX)
     
-    params = {}
+    # 只向後端要目前這一頁
+    params = {"page": st.session_state.products_page, "limit": limit}
     if cat != "全部": params["category"] = cat
     if brand != "全部": params["brand"] = brand
     params["status"] = status
@@ -227,34 +602,63 @@ def page_products():
     result = api_get("/api/products", params)
     
     if result and result.get('products'):
+        pages = max(1, -(-result.get('total', 0) // limit))
         # 網格顯示
         for i in range(0, len(result['products']), 4):
             row = result['products'][i:i+4]
             cols = st.columns(4)
             for j, p in enumerate(row):
                 with cols[j]:
-                    img_html = ""
-                    if p.get('images'):
-                        img_html = f'<img src="{p["images"][0]}" style="width: 100%; height: 180px; object-fit: cover; margin-bottom: 15px;">'
-                    
                     with st.container():
-                        st.markdown(f"""
-                        <div class="product-item">
-                            {img_html}
-                            <h4 style="color: #B8860B !important; font-size: 16px; margin-bottom: 10px;">{p['name']}</h4>
-                            <p style="color: #666; font-size: 13px;">{p.get('brand', '')} • {p.get('category', '')}</p>
-                            <p style="color: #1A1A1A; font-size: 18px; margin-top: 10px;">${p.get('price', 'N/A')}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+                        st.markdown(product_card_html(p), unsafe_allow_html=True)
+                        st.button("查看詳情", key=f"detail_{p['id']}", on_click=show_product, args=(p['id'],))
                         
                         if st.session_state.user:
-                            if st.button(f"加入購物車", key=f"add_{p['id']}"):
-                                res = api_post("/api/cart", {"buyer_id": st.session_state.user['id'], "product_id": p['id']})
-                                if res and "error" not in res:
-                                    st.success("已加入!")
+                            cart_action(p['id'], f"add_{p['id']}")
+        
+        # 分頁控制
+        page = st.session_state.products_page
+        p1, p2, p3 = st.columns([1, 2, 1])
+        with p1:
+            st.button("上一頁", key="products_prev", disabled=page <= 1, on_click=set_products_page, args=(page - 1,))
+        with p2:
+            st.markdown(f'<p style="text-align: center; color: #666;">第 {page} / {pages} 頁 • 共 {result.get("total", 0)} 件</p>', unsafe_allow_html=True)
+        with p3:
+            st.button("下一頁", key="products_next", disabled=page >= pages, on_click=set_products_page, args=(page + 1,))
+    elif result and st.session_state.products_page > 1:
+        # 商品減少導致頁碼超出範圍
+        set_products_page(1)
+        st.rerun()
     else:
         st.info("尚無商品")
 
+# ============== 頁面：商品詳情 ==============
+def page_product_detail():
+    product_id = st.session_state.get('product_id')
+    p = api_get(f"/api/products/{product_id}") if product_id else None
+    if not p:
+        st.info("商品不存在")
+        return
+    
+    st.markdown(f'<div class="section-title">{p["name"]}</div>', unsafe_allow_html=True)
+    c1, c2 = st.columns([3, 2])
+    with c1:
+        # 詳情頁才載入原圖
+        for img in p.get('images', []):
+            st.markdown(f'<img src="{img}" style="width: 100%; margin-bottom: 15px;">', unsafe_allow_html=True)
+        if p.get('image_status') == "processing":
+            st.caption("圖片處理中")
+    with c2:
+        st.write(f"**{p.get('brand', '')}** • {p.get('category', '')}")
+        if p.get('model'): st.write(f"型號: {p['model']}")
+        st.write(f"### ${p.get('price', 'N/A')}")
+        st.write(f"庫存: {p.get('stock', 0)}")
+        if p.get('description'): st.write(p['description'])
+        if st.session_state.user:
+            cart_action(p['id'], f"detail_add_{p['id']}")
+    
+    recommendations_row({"product_id": p['id']}, "rec_detail")
+
 # ============== 頁面：購物車 ==============
 def page_cart():
     st.markdown('<div class="section-title">購物車</div>', unsafe_allow_html=True)
@@ -263,28 +667,36 @@ def page_cart():
         st.warning("請先登入")
         return
     
-    result = api_get(f"/api/cart?buyer_id={st.session_state.user['id']}")
-    
+    cart_summary()
+    recommendations_row({"buyer_id": st.session_state.user['id']}, "rec_cart")
+
+@st.fragment
+def cart_summary():
+    """購物車明細與結帳；結帳只重跑這個區塊"""
+    # 單價與總計以後端報價為準（含數量級距、合約價、品牌折扣）
+    data = dict(api_get_many({
+        "quote": ("/api/quote", {"buyer_id": st.session_state.user['id']}),
+    }))
+    result = data["quote"]
+    
+    if result and result.get('unavailable'):
+        st.warning(f"購物車內有 {len(result['unavailable'])} 項商品已下架，結帳前請先移除")
     if not result or not result.get('items'):
         st.info("購物車是空的")
         return
     
-    total = 0
     for item in result['items']:
         p = item['product']
-        qty = item['quantity']
-        price = p.get('price', 0)
-        subtotal = price * qty
-        total += subtotal
+        price, list_price = item['unit_price'], item['list_price']
         
         c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
         with c1: st.write(f"**{p['name']}**")
-        with c2: st.write(f"x{qty}")
-        with c3: st.write(f"${price}")
-        with c4: st.write(f"${subtotal}")
+        with c2: st.write(f"x{item['quantity']}")
+        with c3: st.write(f"${price}" if price == list_price else f"${price} ~~${list_price}~~")
+        with c4: st.write(f"${item['subtotal']}")
     
     st.markdown("---")
-    st.write(f"### 總計: ${total}")
+    st.write(f"### 總計: ${result['total']}")
     
     with st.form("checkout"):
         payment = st.selectbox("付款方式", ["bank_transfer", "credit_card", "cod", "installment"])
@@ -296,6 +708,8 @@ def page_cart():
                 res = api_post("/api/orders", {"buyer_id": st.session_state.user['id'], "seller_id": 2, "payment_method": payment, "shipping_address": address})
                 if res and "error" not in res:
                     st.success("訂單建立成功!")
+                else:
+                    st.error(res["error"])
 
 # ============== 頁面：後台 ==============
 def page_admin():
@@ -306,53 +720,155 @@ def page_admin():
         return
     
     tabs = st.tabs(["商品管理", "新增商品", "庫存", "帳務"])
+    low_stock_alerts()
     
-    # 商品列表
-    with tabs[0]:
-        result = api_get("/api/products")
-        if result and result.get('products'):
-            for p in result['products']:
-                c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
-                with c1: st.write(f"**{p['name']}**")
-                with c2: st.write(f"庫存:{p.get('stock', 0)}")
-                with c3: st.write(f"${p.get('price', 0)}")
-    
-    # 新增商品
     with tabs[1]:
-        with st.form("new_product"):
-            name = st.text_input("商品名稱")
-            brand = st.selectbox("品牌", ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth"])
-            category = st.selectbox("類型", ["Alto", "Tenor", "Soprano", "Baritone"])
-            price = st.number_input("價格", 0.0, 100000.0, 0.0)
-            stock = st.number_input("庫存", 0, 10000, 0)
-            files = st.file_uploader("圖片", type=['png','jpg','jpeg'])
-            
-            if st.form_submit_button("建立", type="primary"):
-                if name:
-                    form_data = {"name": name, "brand": brand, "category": category, "price": price, "stock": stock}
-                    file_data = None
-                    if files:
-                        file_data = [("files", (files.name, files.getvalue(), files.type))]
-                    res = api_post("/api/products", data=form_data, files=file_data)
-                    if res and "error" not in res:
-                        st.success("建立成功!")
-                        st.rerun()
-    
-    # 庫存
-    with tabs[2]:
-        result = api_get("/api/inventory")
-        if result and result.get('inventory'):
-            for inv in result['inventory']:
-                st.write(f"{inv['product_id']}. {inv['name']} - 庫存: {inv['stock']}")
-    
-    # 帳務
-    with tabs[3]:
-        result = api_get("/api/finance/summary")
-        if result:
-            c1, c2, c3 = st.columns(3)
-            with c1: st.metric("總營收", f"${result.get('total_sales', 0)}")
-            with c2: st.metric("總訂單", result.get('total_orders', 0))
-            with c3: st.metric("待處理", result.get('pending_orders', 0))
+        admin_new_product()
+    
+    # 其餘分頁的資料同時抓取並寫入快取，先回來的先畫；各分頁之後可各自重跑
+    panels = {
+        "products": (tabs[0], admin_products_tab),
+        "inventory": (tabs[2], admin_inventory_tab),
+        "finance": (tabs[3], admin_finance_tab),
+    }
+    for name, _ in api_get_many(admin_needs()):
+        tab, render = panels[name]
+        with tab:
+            render()
+
+def admin_needs():
+    return {
+        "products": ("/api/products", None),
+        "inventory": ("/api/inventory/low-stock", seller_params()),
+        "finance": ("/api/finance/analytics", finance_params()),
+    }
+
+def seller_params():
+    """賣家只看自己的商品"""
+    if st.session_state.user and st.session_state.user.get('role') == "seller":
+        return {"seller_id": st.session_state.user['id']}
+    return {}
+
+# 帳務分析期間 -> 往前天數
+FINANCE_PERIODS = {"全部": None, "近 30 天": 30, "近 12 個月": 365}
+
+def finance_params(period="全部"):
+    """賣家只看自己的銷售，其餘角色看全平台"""
+    params = seller_params()
+    if FINANCE_PERIODS[period]:
+        params["date_from"] = (date.today() - timedelta(days=FINANCE_PERIODS[period])).isoformat()
+    return params
+
+def refresh_button(path, key):
+    st.button("重新整理", key=key, on_click=drop_cached, args=([path],))
+
+@st.fragment
+def admin_new_product():
+    with st.form("new_product", clear_on_submit=True):
+        name = st.text_input("商品名稱")
+        brand = st.selectbox("品牌", ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth"])
+        category = st.selectbox("類型", ["Alto", "Tenor", "Soprano", "Baritone"])
+        price = st.number_input("價格", 0.0, 100000.0, 0.0)
+        stock = st.number_input("庫存", 0, 10000, 0)
+        reorder_level = st.number_input("補貨點", 0, 10000, value=None, placeholder="使用分類預設")
+        files = st.file_uploader("圖片", type=['png','jpg','jpeg'], accept_multiple_files=True)
+        
+        if st.form_submit_button("建立", type="primary"):
+            if name:
+                form_data = {"name": name, "brand": brand, "category": category, "price": price, "stock": stock,
+                             "seller_id": st.session_state.user['id']}
+                if reorder_level is not None:
+                    form_data["reorder_level"] = reorder_level
+                file_data = [("files", (f.name, f, f.type)) for f in files] or None
+                res = api_post("/api/products", data=form_data, files=file_data)
+                if res and "error" not in res:
+                    st.success("建立成功!")
+
+@st.fragment
+def admin_products_tab():
+    refresh_button("/api/products", "refresh_admin_products")
+    result = api_get(*admin_needs()["products"])
+    if result and result.get('products'):
+        for p in result['products']:
+            c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+            with c1: st.write(f"**{p['name']}**")
+            with c2: st.write(f"庫存:{p.get('stock', 0)}")
+            with c3: st.write(f"${p.get('price', 0)}")
+
+@st.fragment
+def admin_inventory_tab():
+    refresh_button("/api/inventory/low-stock", "refresh_admin_inventory")
+    result = api_get(*admin_needs()["inventory"])
+    if not result:
+        return
+    if not result['items']:
+        st.success("沒有低於補貨點的商品")
+        return
+    st.write(f"**需補貨 {result['total']} 項**（依缺口排序，顯示前 {len(result['items'])} 項）")
+    for inv in result['items']:
+        c1, c2, c3 = st.columns([3, 1, 1])
+        with c1: st.write(f"{inv['product_id']}. {inv['name']}")
+        with c2: st.write(f"庫存: {inv['stock']}")
+        with c3: st.write(f"補貨點: {inv['reorder_level']}")
+
+@st.fragment(run_every=LOW_STOCK_POLL)
+def low_stock_alerts():
+    """輪詢變更紀錄，商品跌破補貨點時跳出通知並讓低庫存清單重抓"""
+    seq = st.session_state.get('low_stock_seq')
+    if seq is None:
+        result = api_get(*admin_needs()["inventory"])
+        st.session_state.low_stock_seq = result['seq'] if result else None
+        return
+    result = api_get("/api/changes", {"since": seq, "kinds": "low_stock"})
+    if result is None:
+        # 落後超過保留範圍：下次從低庫存清單重新取得起點
+        st.session_state.low_stock_seq = None
+        drop_cached(["/api/inventory/low-stock"])
+        return
+    mine = seller_params().get("seller_id")
+    alerts = [c['data'] for c in result['changes'] if c['op'] == "upsert" and (mine is None or c['data']['seller_id'] == mine)]
+    for a in alerts:
+        st.toast(f"{a['name']} 庫存剩 {a['stock']}，已低於補貨點 {a['reorder_level']}")
+    if result['changes']:
+        drop_cached(["/api/inventory/low-stock"])
+    st.session_state.low_stock_seq = result['seq']
+
+@st.fragment
+def admin_finance_tab():
+    c1, c2 = st.columns([3, 1])
+    with c1: period = st.selectbox("期間", list(FINANCE_PERIODS), key="finance_period")
+    with c2: refresh_button("/api/finance/analytics", "refresh_admin_finance")
+    result = api_get("/api/finance/analytics", finance_params(period))
+    if not result:
+        return
+    
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("營收", f"${result.get('revenue', 0):,.0f}")
+    with c2: st.metric("訂單", result.get('orders', 0))
+    with c3: st.metric("平均客單價", f"${result.get('average_order_value', 0):,.0f}")
+    with c4: st.metric("待處理", result.get('pending_orders', 0))
+    
+    if not result.get('orders'):
+        st.info("期間內尚無已付款訂單")
+        return
+    
+    st.write("**每月營收**")
+    st.bar_chart({"營收": {m['month']: m['revenue'] for m in result['by_month']}})
+    c1, c2 = st.columns(2)
+    with c1:
+        st.write("**依品牌**")
+        st.bar_chart({"營收": {g['name']: g['revenue'] for g in result['by_brand']}})
+    with c2:
+        st.write("**依類型**")
+        st.bar_chart({"營收": {g['name']: g['revenue'] for g in result['by_category']}})
+    c1, c2 = st.columns(2)
+    with c1:
+        st.write("**主要買家**")
+        st.bar_chart({"營收": {b['name']: b['revenue'] for b in result['top_buyers']}}, horizontal=True)
+    with c2:
+        st.write("**熱銷商品**")
+        st.dataframe([{"商品": p['name'], "數量": p['quantity'], "營收": p['revenue']} for p in result['top_skus']],
+                     hide_index=True, use_container_width=True)
 
 # ============== 頁面：登入 ==============
 def page_login():
@@ -382,6 +898,12 @@ def page_login():
     """, unsafe_allow_html=True)
 
 # ============== 側邊欄 ==============
+def go_to(page):
+    st.session_state.page = page
+
+def logout():
+    st.session_state.user = None
+
 def render_sidebar():
     with st.sidebar:
         st.markdown("""
@@ -397,25 +919,23 @@ def render_sidebar():
             "login": "🔐 登入"
         }
         
+        # 以 callback 切換頁面，點擊只需一次重跑
         for key, label in pages.items():
-            if st.button(label, key=f"nav_{key}", use_container_width=True):
-                st.session_state.page = key
-                st.rerun()
+            st.button(label, key=f"nav_{key}", use_container_width=True, on_click=go_to, args=(key,))
         
         st.markdown("---")
         
         # 用戶資訊
         if st.session_state.user:
             st.write(f"👤 {st.session_state.user.get('company_name', '')}")
-            if st.button("登出"):
-                st.session_state.user = None
-                st.rerun()
+            st.button("登出", on_click=logout)
         else:
             st.warning("未登入")
 
 # ============== 主程式 ==============
 def main():
     render_sidebar()
+    notice = st.empty()
     
     page = st.session_state.page
     
@@ -423,6 +943,8 @@ def main():
         page_home()
     elif page == "products":
         page_products()
+    elif page == "product":
+        page_product_detail()
     elif page == "cart":
         page_cart()
     elif page == "admin":
@@ -431,6 +953,9 @@ def main():
         page_login()
     else:
         page_home()
+    
+    if st.session_state.degraded:
+        notice.warning("後端服務暫時無法連線，目前顯示的是快取資料")
 
 if __name__ == "__main__":
     main()
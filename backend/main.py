@@ -3,16 +3,45 @@
 完整版 API（包含所有功能）
 """
 import os
+import io
+import sys
+import json
+import math
+import time
+import zlib
 import uuid
+import struct
 import base64
+import bisect
+import heapq
+import inspect
+import hashlib
+import asyncio
+import threading
+import unicodedata
+import multiprocessing
 from pathlib import Path
-from datetime import datetime
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from datetime import datetime, date, timedelta
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, create_model
+from typing import Optional, List, Dict, Union, Literal, Annotated
 from dotenv import load_dotenv
+from PIL import Image, ImageOps
+import numpy as np
+import msgpack
 
 load_dotenv()
 
@@ -21,14 +50,6 @@ app = FastAPI(
     version="1.0.0"
 )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # ============== 資料模型 ==============
 class User(BaseModel):
     id: Optional[int] = None
@@ -43,14 +64,18 @@ class Product(BaseModel):
     name: str
     brand: str
     category: str
+    seller_id: Optional[int] = None
     model: Optional[str] = None
     year: Optional[int] = None
     material: Optional[str] = None
     condition: str = "New"
     price: Optional[float] = None
     stock: int = 0
+    reorder_level: Optional[int] = None  # 補貨點；未設定時用分類門檻
     description: Optional[str] = None
     images: List[str] = []  # 改為 base64 編碼的圖片數據
+    image_status: str = "ready"  # processing / ready / failed
+    image_variants: List[dict] = []  # 每張圖的 WebP 與縮圖
     status: str = "active"
     created_at: Optional[str] = None
 
@@ -58,9 +83,21 @@ class Inquiry(BaseModel):
     id: Optional[int] = None
     product_id: int
     buyer_id: int
+    seller_id: Optional[int] = None
     message: str
     status: str = "pending"
+    reply: Optional[str] = None
     created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class InquiryUpdate(BaseModel):
+    id: int
+    status: str = "answered"
+    reply: Optional[str] = None
+
+class InquiryBulkUpdate(BaseModel):
+    seller_id: int
+    updates: List[InquiryUpdate]
 
 class CartItem(BaseModel):
     id: Optional[int] = None
@@ -68,6 +105,26 @@ class CartItem(BaseModel):
     product_id: int
     quantity: int = 1
 
+class PriceRule(BaseModel):
+    """定價規則：product_id 或 brand 擇一為範圍，price（單價）或 discount（折扣 %）擇一；
+    有 buyer_id 為該買家的合約價，min_qty 為數量級距下限"""
+    id: Optional[int] = None
+    product_id: Optional[int] = None
+    brand: Optional[str] = None
+    buyer_id: Optional[int] = None
+    min_qty: int = 1
+    price: Optional[float] = None
+    discount: Optional[float] = None
+    created_at: Optional[str] = None
+
+class QuoteLine(BaseModel):
+    product_id: int
+    quantity: int = 1
+
+class QuoteRequest(BaseModel):
+    buyer_id: Optional[int] = None
+    items: List[QuoteLine]
+
 class Order(BaseModel):
     id: Optional[int] = None
     order_number: str
@@ -96,16 +153,135 @@ class Review(BaseModel):
     comment: Optional[str] = None
     created_at: Optional[str] = None
 
+# ============== 精簡紀錄 ==============
+# 大量存放的商品、訂單、購物車、訊息以 __slots__ 物件保存，不帶每筆的 __dict__：
+# 品牌、分類、狀態等低基數字串 intern 成同一個物件，清單欄位存為 tuple，建立時間存為 epoch 微秒整數。
+# 欄位與預設值取自對應的 Pydantic 模型，dict() 輸出與模型相同，只在回應時才組出
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DAY = EPOCH.toordinal()
+DAY_US = 86_400_000_000
+MICROSECOND = timedelta(microseconds=1)
+
+def parse_time(value: str) -> datetime:
+    """ISO 時間轉為與 now() 相同的本地時間；帶時區的輸入先換算成本地時間再去掉時區"""
+    dt = datetime.fromisoformat(value)
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+
+def to_ts(value: Optional[str]) -> Optional[int]:
+    """ISO 時間轉 epoch 微秒"""
+    return None if value is None else (parse_time(value) - EPOCH) // MICROSECOND
+
+def from_ts(ts: Optional[int]) -> Optional[str]:
+    return None if ts is None else (EPOCH + timedelta(microseconds=ts)).isoformat()
+
+class CompactRecord:
+    """子類別宣告 MODEL、__slots__（created_at 存於 created_ts）與要 intern 的欄位"""
+    __slots__ = ()
+    MODEL = BaseModel
+    INTERNED = frozenset()
+
+    def __init_subclass__(cls):
+        cls.DEFAULTS = {name: f.get_default(call_default_factory=True) for name, f in cls.MODEL.model_fields.items()}
+        cls.TUPLES = frozenset(name for name, default in cls.DEFAULTS.items() if isinstance(default, list))
+        cls.PLAIN = tuple(name for name in cls.DEFAULTS if name not in cls.TUPLES | cls.INTERNED | {"created_at"})
+
+    def __init__(self, **values):
+        unknown = values.keys() - self.DEFAULTS.keys()
+        if unknown:
+            raise TypeError(f"{type(self).__name__} 沒有欄位 {sorted(unknown)}")
+        # 與 __setattr__ 相同的轉換，逐類欄位直接寫入 slot 以加快大量建立
+        put, get, defaults = object.__setattr__, values.get, self.DEFAULTS
+        for name in self.PLAIN:
+            put(self, name, get(name, defaults[name]))
+        for name in self.INTERNED:
+            value = get(name, defaults[name])
+            put(self, name, value if value is None else sys.intern(value))
+        for name in self.TUPLES:
+            put(self, name, tuple(get(name, ())))
+        if "created_at" in defaults:
+            put(self, "created_ts", to_ts(get("created_at")))
+
+    @classmethod
+    def validated(cls, **values):
+        """請求與日誌等外部資料先經 MODEL 驗證、轉型再建立"""
+        return cls(**cls.MODEL(**values).dict())
+
+    def __setattr__(self, name, value):
+        # 只有寫入經過這裡，讀取仍是一般 slot 存取
+        if name == "created_at":
+            name, value = "created_ts", to_ts(value)
+        elif name in self.TUPLES:
+            value = tuple(value)
+        elif name in self.INTERNED and value is not None:
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+
+    @property
+    def created_at(self) -> Optional[str]:
+        return from_ts(self.created_ts)
+
+    def dict(self, exclude=None) -> dict:
+        out = {}
+        for name in self.DEFAULTS:
+            if exclude and name in exclude:
+                continue
+            value = self.created_at if name == "created_at" else getattr(self, name)
+            out[name] = list(value) if name in self.TUPLES else value
+        return out
+
+class ProductRecord(CompactRecord):
+    __slots__ = ("id", "name", "brand", "category", "seller_id", "model", "year", "material", "condition", "price",
+                 "stock", "reorder_level", "description", "images", "image_status", "image_variants", "status", "created_ts")
+    MODEL = Product
+    INTERNED = frozenset({"brand", "category", "material", "condition", "image_status", "status"})
+
+class OrderRecord(CompactRecord):
+    __slots__ = ("id", "order_number", "buyer_id", "seller_id", "items", "total_amount", "status", "payment_method",
+                 "shipping_address", "created_ts")
+    MODEL = Order
+    INTERNED = frozenset({"status", "payment_method"})
+
+class CartRecord(CompactRecord):
+    __slots__ = ("id", "buyer_id", "product_id", "quantity")
+    MODEL = CartItem
+
+class MessageRecord(CompactRecord):
+    __slots__ = ("id", "sender_id", "receiver_id", "content", "read", "created_ts")
+    MODEL = Message
+
 # ============== 模擬資料庫 ==============
 users_db: List[User] = []
-products_db: List[Product] = []
+products_db: List[ProductRecord] = []
 inquiries_db: List[Inquiry] = []
-cart_db: List[CartItem] = []
-orders_db: List[Order] = []
-messages_db: List[Message] = []
+orders_db: List[OrderRecord] = []
+messages_db: List[MessageRecord] = []
 reviews_db: List[Review] = []
 
-next_id = {"user": 1, "product": 1, "inquiry": 1, "cart": 1, "order": 1, "message": 1, "review": 1}
+next_id = {"user": 1, "product": 1, "inquiry": 1, "cart": 1, "order": 1, "message": 1, "review": 1, "price_rule": 1}
+
+# 訂單索引：鍵為 (created_ts, order_id)，各清單依時間排序
+ORDER_STATUSES = ["pending", "paid", "shipped", "completed", "cancelled"]
+PRODUCT_CATEGORIES = ["Alto", "Tenor", "Soprano", "Baritone"]
+PRODUCT_BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth", "其他"]
+orders_by_id: Dict[int, OrderRecord] = {}
+orders_by_buyer: Dict[int, "SortedKeys"] = {}
+orders_by_seller: Dict[int, Dict[str, "SortedKeys"]] = {}
+orders_by_status: Dict[str, "SortedKeys"] = {}
+
+products_by_id: Dict[int, ProductRecord] = {}
+
+# 購物車索引：buyer_id -> {product_id: 項目}；寫入與到期回收都在 carts_lock 內
+carts_by_buyer: Dict[int, Dict[int, CartRecord]] = {}
+carts_by_id: Dict[int, CartRecord] = {}
+carts_lock = threading.Lock()
+
+# 詢價索引：各清單存放遞增的 inquiry_id
+INQUIRY_STATUSES = ["pending", "answered", "closed"]
+inquiries_by_id: Dict[int, Inquiry] = {}
+inquiries_by_buyer: Dict[int, List[int]] = {}
+inquiries_by_seller: Dict[int, Dict[str, "SortedKeys"]] = {}
+inquiries_by_status: Dict[str, "SortedKeys"] = {}
+open_inquiries: Dict[int, int] = {}  # seller_id -> 待回覆詢價數
 
 def now():
     return datetime.now().isoformat()
@@ -119,11 +295,383 @@ def seed_data():
         User(id=2, email="seller@sax.com", password="seller123", company_name="薩克斯風工廠", role="seller", created_at=now()),
         User(id=3, email="buyer@sax.com", password="buyer123", company_name="音樂教室", role="buyer", created_at=now()),
     ])
-    next_id = {"user": 4, "product": 1, "inquiry": 1, "cart": 1, "order": 1, "message": 1, "review": 1}
+    next_id = {"user": 4, "product": 1, "inquiry": 1, "cart": 1, "order": 1, "message": 1, "review": 1, "price_rule": 1}
     # 不建立範例商品，讓用戶自己上傳
 
 seed_data()
 
+# ============== 背景工作 ==============
+loop_lag = {"last_ms": 0.0, "max_ms": 0.0}
+
+async def monitor_loop_lag(interval: float = 0.05):
+    """量測事件迴圈卡頓：sleep 實際醒來時間與預期的差距"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, (loop.time() - start - interval) * 1000)
+        loop_lag["last_ms"] = round(lag, 2)
+        loop_lag["max_ms"] = max(loop_lag["max_ms"], loop_lag["last_ms"])
+
+background_tasks = set()
+
+def spawn(coro):
+    """建立背景工作並保留參照，避免被回收"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@app.on_event("startup")
+async def start_background_tasks():
+    spawn(monitor_loop_lag())
+    # 預先啟動圖片處理子行程，避免第一次上傳等待行程啟動
+    asyncio.get_running_loop().run_in_executor(image_pool(), sniff_image_type, b"")
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+
+# ============== 請求合併 ==============
+# 同一 key 的並行讀取只計算一次：第一個請求在執行緒池計算並序列化，其餘請求等待同一個 future。
+# 只合併進行中的計算，完成後即移除，不當作快取
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT", "1") != "0"
+SINGLEFLIGHT_TIMEOUTS = {"product": 5.0, "products": 10.0}  # 各類 key 的等待上限（秒）
+
+class SingleFlight:
+    def __init__(self):
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, field: str):
+        stats = self.stats.setdefault(kind, {"leaders": 0, "coalesced": 0, "timeouts": 0})
+        stats[field] += 1
+
+    def _done(self, key: tuple, future: asyncio.Future):
+        """移除進行中的 key；等待者都已逾時或斷線時由這裡取走例外，非預期的錯誤印出"""
+        if self.inflight.get(key) is future:
+            self.inflight.pop(key)
+        if future.cancelled():
+            return
+        e = future.exception()
+        if e is not None and not isinstance(e, HTTPException):
+            print(f"Error: {key[0]} 讀取失敗：{e!r}")
+
+    async def do(self, key: tuple, fn, *args):
+        """key[0] 為種類，決定逾時；逾時只影響該等待者，計算繼續供其他人使用"""
+        kind = key[0]
+        if not SINGLEFLIGHT_ENABLED:
+            return await run_in_threadpool(fn, *args)
+        future = self.inflight.get(key)
+        if future is None:
+            self._count(kind, "leaders")
+            future = self.inflight[key] = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            future.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self._count(kind, "coalesced")
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), SINGLEFLIGHT_TIMEOUTS.get(kind, 5.0))
+        except asyncio.TimeoutError:
+            self._count(kind, "timeouts")
+            raise HTTPException(status_code=504, detail="讀取逾時，請稍後再試")
+
+    def metrics(self):
+        return {"enabled": SINGLEFLIGHT_ENABLED, "inflight": len(self.inflight), **self.stats}
+
+singleflight = SingleFlight()
+
+def json_body(data) -> bytes:
+    """序列化一次，合併的請求共用同一份位元組"""
+    return JSONResponse(content=data).body
+
+# ============== 圖片上傳 ==============
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "uploads"))
+UPLOAD_CHUNK = 1024 * 1024
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(25 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(250 * 1024 * 1024)))
+MAX_IMAGES_PER_REQUEST = int(os.environ.get("MAX_IMAGES_PER_REQUEST", "20"))
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+class UploadLimitMiddleware:
+    """商品上傳的早期限制：Content-Length 超過總量直接拒絕；讀取本文時邊收邊計，
+    總量超過 MAX_UPLOAD_BYTES 或任一 part 超過 MAX_IMAGE_BYTES 就立即回 413 並中止請求，
+    不等 Starlette 把整個本文暫存到磁碟"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT") or not scope["path"].startswith("/api/products"):
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"")
+        if not content_type.startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+        length = headers.get(b"content-length")
+        error = None
+        if length is None:
+            error = (411, "缺少 Content-Length")
+        elif not length.isdigit():
+            error = (400, "Content-Length 格式錯誤")
+        elif int(length) > MAX_UPLOAD_BYTES:
+            error = (413, f"上傳總量超過 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        if error:
+            return await JSONResponse({"detail": error[1]}, status_code=error[0])(scope, receive, send)
+
+        state = {"total": 0, "part": 0, "responded": False}
+        parser = None
+        boundary = parse_options_header(content_type.decode("latin-1"))[1].get(b"boundary")
+        if boundary:
+            def on_part_begin():
+                state["part"] = 0
+
+            def on_part_data(data, start, end):
+                state["part"] += end - start
+
+            parser = multipart.MultipartParser(boundary, {"on_part_begin": on_part_begin, "on_part_data": on_part_data})
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] != "http.request" or state["responded"]:
+                return message
+            body = message.get("body", b"")
+            state["total"] += len(body)
+            if parser is not None:
+                try:
+                    parser.write(body)
+                except Exception:
+                    pass  # 格式錯誤交給 Starlette 回報
+            error = None
+            if state["total"] > MAX_UPLOAD_BYTES:
+                error = f"上傳總量超過 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+            elif state["part"] > MAX_IMAGE_BYTES:
+                error = f"單檔超過上限 {MAX_IMAGE_BYTES // (1024 * 1024)} MB"
+            if error is None:
+                return message
+            state["responded"] = True
+            await JSONResponse({"detail": error}, status_code=413)(scope, receive, send)
+            return {"type": "http.disconnect"}
+
+        async def guarded_send(message):
+            if not state["responded"]:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not state["responded"]:
+                raise
+
+app.add_middleware(UploadLimitMiddleware)
+# CORS 最後加入、位於最外層，上傳限制的錯誤回應也帶 CORS 標頭
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def store_upload(src, filename: str) -> dict:
+    """以固定大小區塊將上傳檔寫入磁碟並同時計算 SHA-256，記憶體用量與檔案大小無關"""
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = UPLOAD_DIR / f".upload-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size, mime = 0, None
+    try:
+        with open(tmp, "wb") as out:
+            while chunk := src.read(UPLOAD_CHUNK):
+                if mime is None:
+                    mime = sniff_image_type(chunk[:16])
+                    if not mime:
+                        raise HTTPException(status_code=415, detail=f"{filename} 不是支援的圖片格式")
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{filename} 超過單檔上限 {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        if mime is None:
+            raise HTTPException(status_code=400, detail=f"{filename} 是空檔案")
+        sha256 = digest.hexdigest()
+        path = UPLOAD_DIR / f"{sha256}{IMAGE_EXTENSIONS[mime]}"
+        created = not path.exists()
+        os.replace(tmp, path)  # 相同內容只保留一份
+        return {"path": str(path), "sha256": sha256, "mime": mime, "size": size, "created": created}
+    finally:
+        tmp.unlink(missing_ok=True)
+
+async def store_uploads(files: Optional[List[UploadFile]]) -> List[dict]:
+    files = [f for f in files or [] if f and f.filename]
+    if len(files) > MAX_IMAGES_PER_REQUEST:
+        raise HTTPException(status_code=413, detail=f"每次最多上傳 {MAX_IMAGES_PER_REQUEST} 張圖片")
+    if files and image_jobs["pending"] >= IMAGE_QUEUE_LIMIT:
+        raise HTTPException(status_code=503, detail="圖片處理佇列已滿，請稍後再試")
+    stored = []
+    try:
+        for f in files:
+            stored.append(await run_in_threadpool(store_upload, f.file, f.filename))
+    except BaseException:
+        # 後面的檔案失敗時移除本次新寫入的檔案；已存在的相同內容可能屬於其他商品，保留
+        for u in stored:
+            if u["created"]:
+                Path(u["path"]).unlink(missing_ok=True)
+        raise
+    return stored
+
+# ============== 圖片處理 ==============
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_LIMIT = int(os.environ.get("IMAGE_QUEUE_LIMIT", "32"))
+THUMBNAIL_SIZES = (160, 480, 1024)
+IMAGE_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG", "image/gif": "GIF", "image/webp": "WEBP"}
+ORIGINAL_QUALITY = 95  # 原圖只為移除中繼資料而重新編碼，有損格式用固定高品質
+# WebP 與縮圖以內容雜湊命名存放在磁碟，商品資料只帶網址；原始上傳檔含 EXIF，不對外提供
+IMAGE_VARIANT_DIR = UPLOAD_DIR / "variants"
+IMAGE_URL = "/api/images"
+image_jobs = {"pending": 0, "done": 0, "failed": 0}
+_image_pool = None
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """依檔頭 magic bytes 判斷實際圖片格式，不信任副檔名"""
+    if head.startswith(b"\xff\xd8\xff"): return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"): return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"): return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP": return "image/webp"
+    return None
+
+def _data_uri(img, fmt: str, **params) -> str:
+    buf = io.BytesIO()
+    img.save(buf, fmt, **params)
+    mime = "image/jpeg" if fmt == "JPEG" else f"image/{fmt.lower()}"
+    return f"data:{mime};base64,{base64.b64encode(buf.getvalue()).decode('utf-8')}"
+
+def _save_image(img, path: Path, fmt: str, **params):
+    """先寫暫存檔再改名，讀取端不會拿到寫到一半的檔案"""
+    tmp = path.with_name(f".{path.name}-{uuid.uuid4().hex}")
+    try:
+        img.save(tmp, fmt, **params)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def process_image(path: str, sha256: str, out_dir: str) -> dict:
+    """在子行程中執行：驗證格式、移除中繼資料、產生 WebP 與多尺寸縮圖並寫入 out_dir"""
+    with open(path, "rb") as f:
+        mime = sniff_image_type(f.read(16))
+    if not mime:
+        raise ValueError("不支援的圖片格式")
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src)  # 先套用 EXIF 方向再丟棄 EXIF
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    img.info = {}
+    rgb = img.convert("RGBA" if has_alpha else "RGB")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        thumb = rgb.convert("RGB")
+        thumb.thumbnail((size, size))
+        _save_image(thumb, out / f"{sha256}-{size}.jpg", "JPEG", quality=82, optimize=True)
+        thumbnails[str(size)] = f"{IMAGE_URL}/{sha256}-{size}.jpg"
+    _save_image(rgb, out / f"{sha256}.webp", "WEBP", quality=80)
+    fmt = IMAGE_FORMATS[mime]
+    params = {"quality": ORIGINAL_QUALITY} if fmt in ("JPEG", "WEBP") else {}
+    return {
+        "mime": mime, "width": img.width, "height": img.height,
+        "original": _data_uri(img if fmt != "JPEG" else img.convert("RGB"), fmt, **params),
+        "webp": f"{IMAGE_URL}/{sha256}.webp",
+        "thumbnails": thumbnails,
+    }
+
+def image_pool() -> ProcessPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        # spawn：子行程不繼承伺服器的監聽 socket 與訊號處理
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _image_pool
+
+async def run_image_job(product: ProductRecord, uploads: List[dict]):
+    """將圖片交給行程池處理，完成後更新商品的圖片狀態"""
+    loop = asyncio.get_running_loop()
+    try:
+        results = await asyncio.gather(*[loop.run_in_executor(image_pool(), process_image, u["path"], u["sha256"], str(IMAGE_VARIANT_DIR))
+                                         for u in uploads], return_exceptions=True)
+        ok = []
+        for u, r in zip(uploads, results):
+            if isinstance(r, BaseException):
+                print(f"Error: {r}")
+            else:
+                r.update(sha256=u["sha256"], size=u["size"])
+                ok.append(r)
+        product.images = [*product.images, *(r.pop("original") for r in ok)]
+        product.image_variants = [*product.image_variants, *ok]
+        product.image_status = "ready" if ok else "failed"
+        image_jobs["done" if ok else "failed"] += 1
+        record_change("product", product.id)
+    finally:
+        image_jobs["pending"] -= 1
+
+def schedule_image_job(product: ProductRecord, uploads: List[dict]):
+    product.image_status = "processing"
+    image_jobs["pending"] += 1
+    spawn(run_image_job(product, uploads))
+
+# 縮圖與 WebP 依內容雜湊命名、內容不變，由 StaticFiles 提供 ETag / Last-Modified
+app.mount(IMAGE_URL, StaticFiles(directory=IMAGE_VARIANT_DIR, check_dir=False), name="images")
+
+# ============== 變更紀錄 ==============
+CHANGE_LOG_RETENTION = int(os.environ.get("CHANGE_LOG_RETENTION", "10000"))
+CHANGE_KINDS = ("product", "stock", "order", "cart", "low_stock")
+change_log = deque(maxlen=CHANGE_LOG_RETENTION)  # (seq, kind, entity_id, op, buyer_id)
+change_seq = 0
+
+def record_change(kind: str, entity_id: int, op: str = "upsert", buyer_id: int = None):
+    """為每次異動配發遞增序號；只保留最近 CHANGE_LOG_RETENTION 筆"""
+    global change_seq
+    change_seq += 1
+    change_log.append((change_seq, kind, entity_id, op, buyer_id))
+
+def _change_data(kind: str, entity_id: int, carts: Dict[int, CartRecord]):
+    if kind == "product":
+        p = products_by_id.get(entity_id)
+        return p.dict() if p else None
+    if kind == "stock":
+        p = products_by_id.get(entity_id)
+        return {"product_id": p.id, "stock": p.stock, "status": p.status} if p else None
+    if kind == "low_stock":
+        p = products_by_id.get(entity_id)
+        return low_stock_item(p) if p else None
+    if kind == "order":
+        o = orders_by_id.get(entity_id)
+        return o.dict() if o else None
+    c = carts.get(entity_id)
+    return c.dict() if c else None
+
+@app.get("/api/changes")
+def get_changes(since: int = 0, limit: int = 500, kinds: str = None, buyer_id: int = None):
+    """回傳 since 之後異動過的實體（同一實體只回最新狀態）；落後超過保留範圍時回 410 要求重新同步。
+    購物車只回給指定的 buyer_id，未指定時不含購物車"""
+    oldest = change_log[0][0] if change_log else change_seq + 1
+    if since < oldest - 1 or since > change_seq:
+        return JSONResponse(status_code=410, content={"resync_required": True, "seq": change_seq})
+    wanted = set(kinds.split(",")) if kinds else set(CHANGE_KINDS)
+    latest: Dict[tuple, str] = {}
+    cursor, has_more = since, False
+    for seq, kind, entity_id, op, owner in islice(change_log, since - oldest + 1, None):
+        if len(latest) >= limit and (kind, entity_id) not in latest:
+            has_more = True
+            break
+        cursor = seq
+        if kind not in wanted or (kind == "cart" and owner != buyer_id):
+            continue
+        latest[(kind, entity_id)] = op
+    cart_ids = {eid for kind, eid in latest if kind == "cart"}
+    carts = {cid: carts_by_id[cid] for cid in cart_ids if cid in carts_by_id}
+    changes = []
+    for (kind, entity_id), op in latest.items():
+        data = _change_data(kind, entity_id, carts) if op != "delete" else None
+        changes.append({"kind": kind, "id": entity_id, "op": op if data is not None else "delete", "data": data})
+    return {"seq": cursor, "changes": changes, "has_more": has_more}
+
 # ============== 根路由 ==============
 @app.get("/")
 def root():
@@ -133,6 +681,12 @@ def root():
 def health():
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+def get_metrics():
+    return {"event_loop": loop_lag, "image_jobs": image_jobs, "singleflight": singleflight.metrics(),
+            "journal": journal.metrics(), "duplicates": duplicates.metrics(), "low_stock": low_stock.metrics(),
+            "expiry": {"scheduled": expiry_wheel.size, **{name: t.metrics() for name, t in expiry_trackers.items()}}}
+
 # ============== 會員系統 ==============
 @app.post("/api/auth/register")
 def register(email: str = Form(...), password: str = Form(...), company_name: str = Form(...), role: str = Form("buyer")):
@@ -157,58 +711,88 @@ def get_users():
     return {"users": [{"id": u.id, "email": u.email, "company_name": u.company_name, "role": u.role} for u in users_db]}
 
 # ============== 商品管理 ==============
-@app.get("/api/products")
-def get_products(page: int = 1, limit: int = 20, category: str = None, brand: str = None, status: str = "active"):
+# 單頁商品數上限，避免前端一次要求整個目錄
+PRODUCTS_MAX_LIMIT = 100
+
+def products_page(page: int = 1, limit: int = 20, category: str = None, brand: str = None, status: str = "active") -> dict:
+    """商品列表；內部呼叫端（批次 API 等）直接取 dict，HTTP 端點另經請求合併與序列化"""
+    page, limit = max(page, 1), min(max(limit, 1), PRODUCTS_MAX_LIMIT)
     filtered = [p for p in products_db if p.status == status]
     if category: filtered = [p for p in filtered if p.category == category]
     if brand: filtered = [p for p in filtered if p.brand == brand]
     start = (page - 1) * limit
     return {"products": [p.dict() for p in filtered[start:start+limit]], "total": len(filtered), "page": page, "limit": limit}
 
+def product_detail(product_id: int) -> dict:
+    p = products_by_id.get(product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    return p.dict()
+
+def _serialized(fn, *args) -> bytes:
+    return json_body(fn(*args))
+
+@app.get("/api/products")
+async def get_products(page: int = 1, limit: int = 20, category: str = None, brand: str = None, status: str = "active"):
+    page, limit = max(page, 1), min(max(limit, 1), PRODUCTS_MAX_LIMIT)
+    body = await singleflight.do(("products", page, limit, category, brand, status), _serialized, products_page, page, limit, category, brand, status)
+    return Response(content=body, media_type="application/json")
+
 @app.get("/api/products/{product_id}")
-def get_product(product_id: int):
-    for p in products_db:
-        if p.id == product_id:
-            return p.dict()
-    raise HTTPException(status_code=404, detail="商品不存在")
+async def get_product(product_id: int):
+    body = await singleflight.do(("product", product_id), _serialized, product_detail, product_id)
+    return Response(content=body, media_type="application/json")
 
 @app.post("/api/products")
 async def create_product(name: str = Form(...), brand: str = Form(...), category: str = Form(...),
     model: str = Form(None), year: int = Form(None), material: str = Form(None),
-    condition: str = Form("New"), price: float = Form(None), stock: int = Form(0),
-    description: str = Form(None), files: UploadFile = File(None)):
+    condition: str = Form("New"), price: float = Form(None), stock: int = Form(0), reorder_level: int = Form(None),
+    description: str = Form(None), seller_id: int = Form(None), files: List[UploadFile] = File(None)):
     
-    # 處理圖片（轉為 base64）
-    image_b64 = []
-    if files and files.filename:
-        try:
-            content = await files.read()
-            b64 = base64.b64encode(content).decode('utf-8')
-            ext = os.path.splitext(files.filename)[1].lower()
-            mime = "image/jpeg" if ext in ['.jpg', '.jpeg'] else "image/png" if ext == '.png' else "image/gif"
-            image_b64.append(f"data:{mime};base64,{b64}")
-        except Exception as e:
-            print(f"Error: {e}")
+    if reorder_level is not None and reorder_level < 0:
+        raise HTTPException(status_code=400, detail="補貨點不可為負數")
+    # 圖片串流寫入磁碟，轉檔交由背景行程池處理，請求不等待
+    uploads = await store_uploads(files)
     
-    product = Product(
-        id=next_id["product"], name=name, brand=brand, category=category, model=model,
-        year=year, material=material, condition=condition, price=price, stock=stock,
-        description=description, images=image_b64, status="active", created_at=now()
+    product = ProductRecord.validated(
+        id=next_id["product"], name=name, brand=brand, category=category, seller_id=seller_id, model=model,
+        year=year, material=material, condition=condition, price=price, stock=stock, reorder_level=reorder_level,
+        description=description, status="active", created_at=now()
     )
     products_db.append(product)
+    products_by_id[product.id] = product
     next_id["product"] += 1
-    return {"message": "商品建立成功", "product": product.dict()}
+    pricing.refresh([product.id])
+    suggester.index_product(product)
+    low_stock.update(product)
+    found = await run_in_threadpool(duplicates.index, product, [u["sha256"] for u in uploads])
+    record_change("product", product.id)
+    if uploads:
+        schedule_image_job(product, uploads)
+    return {"message": "商品建立成功", "product": product.dict(), "duplicates": found}
 
 @app.put("/api/products/{product_id}")
-def update_product(product_id: int, name: str = Form(None), price: float = Form(None), stock: int = Form(None), status: str = Form(None)):
-    for p in products_db:
-        if p.id == product_id:
-            if name: p.name = name
-            if price: p.price = price
-            if stock is not None: p.stock = stock
-            if status: p.status = status
-            return {"message": "更新成功", "product": p.dict()}
-    raise HTTPException(status_code=404, detail="商品不存在")
+async def update_product(product_id: int, name: str = Form(None), price: float = Form(None), stock: int = Form(None),
+    status: str = Form(None), reorder_level: int = Form(None), files: List[UploadFile] = File(None)):
+    p = products_by_id.get(product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    if reorder_level is not None and reorder_level < 0:
+        raise HTTPException(status_code=400, detail="補貨點不可為負數")
+    uploads = await store_uploads(files)
+    if name: p.name = name
+    if price: p.price = price
+    if stock is not None: p.stock = stock
+    if status: p.status = status
+    if reorder_level is not None: p.reorder_level = reorder_level
+    if uploads: schedule_image_job(p, uploads)
+    if price: pricing.refresh([p.id])
+    if name or status: suggester.index_product(p)
+    found = await run_in_threadpool(duplicates.index, p, [u["sha256"] for u in uploads], bool(name)) if name or uploads else []
+    record_change("product", p.id)
+    if stock is not None or status or reorder_level is not None:
+        stock_changed([p])
+    return {"message": "更新成功", "product": p.dict(), "duplicates": found}
 
 @app.delete("/api/products/{product_id}")
 def delete_product(product_id: int):
@@ -216,99 +800,1606 @@ def delete_product(product_id: int):
     for i, p in enumerate(products_db):
         if p.id == product_id:
             products_db.pop(i)
+            products_by_id.pop(product_id, None)
+            pricing.refresh([product_id])
+            suggester.remove_product(product_id)
+            duplicates.remove(product_id)
+            low_stock.update(p, removed=True)
+            record_change("product", product_id, "delete")
+            record_change("stock", product_id, "delete")
             return {"message": "刪除成功"}
     raise HTTPException(status_code=404, detail="商品不存在")
 
+# ============== 搜尋建議 ==============
+# 字元前綴樹：每個詞從開頭、每個單字開頭與每個 CJK 字元起建立路徑（最深 SUGGEST_MAX_DEPTH 字），
+# 每個節點保留依熱門度排序的前 SUGGEST_TOP_K 個詞，查詢只需走到前綴節點
+SUGGEST_TOP_K = 10
+SUGGEST_MAX_DEPTH = 12
+SUGGEST_MAX_LIMIT = 10
+CJK_RANGES = ((0x3040, 0x30FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xAC00, 0xD7AF), (0xF900, 0xFAFF))
+
+def normalize_text(text: str) -> str:
+    """全形轉半形、不分大小寫、空白合併"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return any(lo <= code <= hi for lo, hi in CJK_RANGES)
+
+def _word_starts(key: str) -> List[int]:
+    """詞首、單字開頭與 CJK 字元；結尾的單一字元不當起點，避免所有同結尾的詞擠在同一節點"""
+    return [i for i, ch in enumerate(key) if ch.isalnum() and (i == 0 or (
+        (not key[i - 1].isalnum() or _is_cjk(ch)) and i < len(key) - 1))]
+
+class _TrieNode:
+    __slots__ = ("children", "here", "top")
+
+    def __init__(self):
+        self.children = None  # 字元 -> 子節點
+        self.here = None      # 路徑在此結束的詞，依熱門度排序
+        self.top = []         # 子樹中最熱門的詞
+
+class _Term:
+    __slots__ = ("text", "kind", "key", "starts", "weight", "refs")
+
+    def __init__(self, text: str, kind: str, key: str):
+        self.text, self.kind, self.key = text, kind, key
+        self.starts, self.weight, self.refs = _word_starts(key), 0, 0
+
+def _rank(term: _Term):
+    return -term.weight, term.text
+
+class Suggester:
+    """詞的權重為引用它的上架商品數加上這些商品的售出數量；brand 清單常駐"""
+    def __init__(self):
+        self.root = _TrieNode()
+        self.terms: Dict[tuple, _Term] = {}         # (種類, 正規化文字) -> 詞
+        self.product_terms: Dict[int, list] = {}    # product_id -> 該商品引用的詞
+        self.sold: Dict[int, int] = {}              # product_id -> 售出數量
+        self.lock = threading.Lock()
+
+    def _paths(self, term: _Term, create: bool = False):
+        """每個起點一條路徑，回傳 [(節點串列, 字元串列)]，節點串列含根節點"""
+        paths = []
+        for start in term.starts:
+            chars, nodes, node = term.key[start:start + SUGGEST_MAX_DEPTH], [self.root], self.root
+            for ch in chars:
+                child = node.children.get(ch) if node.children else None
+                if child is None:
+                    if not create:
+                        break
+                    if node.children is None:
+                        node.children = {}
+                    child = node.children[ch] = _TrieNode()
+                nodes.append(child)
+                node = child
+            paths.append((nodes, chars))
+        return paths
+
+    def _raise(self, term: _Term, paths):
+        for nodes, _ in paths:
+            for node in nodes[1:]:
+                top = node.top
+                if term in top:
+                    top.sort(key=_rank)
+                elif len(top) < SUGGEST_TOP_K or _rank(term) < _rank(top[-1]):
+                    top.append(term)
+                    top.sort(key=_rank)
+                    del top[SUGGEST_TOP_K:]
+
+    def _lower(self, term: _Term, paths, removed: bool = False):
+        """由下往上重算含有該詞的節點：候選只需 here 的前 K 個與各子節點的 top；移除時順便剪掉空節點"""
+        for nodes, chars in paths:
+            for depth in range(len(nodes) - 1, 0, -1):
+                node = nodes[depth]
+                if term not in node.top:
+                    continue
+                candidates = set((node.here or [])[:SUGGEST_TOP_K])
+                for child in (node.children or {}).values():
+                    candidates.update(child.top)
+                if removed:
+                    candidates.discard(term)
+                node.top = heapq.nsmallest(SUGGEST_TOP_K, candidates, key=_rank)
+                if removed and not node.top and not node.children and not node.here:
+                    parent = nodes[depth - 1]
+                    del parent.children[chars[depth - 1]]
+                    if not parent.children:
+                        parent.children = None
+
+    def _adjust(self, kind: str, text: str, weight: int, refs: int):
+        key = normalize_text(text)
+        if not key:
+            return None
+        term = self.terms.get((kind, key))
+        new = term is None
+        if new:
+            if refs <= 0:
+                return None
+            term = self.terms[(kind, key)] = _Term(" ".join(unicodedata.normalize("NFKC", text).split()), kind, key)
+            paths = self._paths(term, create=True)
+        else:
+            paths = self._paths(term)
+        # 路徑終點的 here 依權重排序，以二分搜尋取出，再依新權重放回
+        ends = list({id(nodes[-1]): nodes[-1] for nodes, _ in paths}.values())
+        if not new:
+            for node in ends:
+                i = bisect.bisect_left(node.here, _rank(term), key=_rank)
+                while node.here[i] is not term:
+                    i += 1
+                del node.here[i]
+        term.weight += weight
+        term.refs += refs
+        for node in ends:
+            if term.refs > 0:
+                if node.here is None:
+                    node.here = []
+                bisect.insort(node.here, term, key=_rank)
+            elif not node.here:
+                node.here = None
+        if term.refs <= 0:
+            del self.terms[(kind, key)]
+            self._lower(term, paths, removed=True)
+        elif weight >= 0:
+            self._raise(term, paths)
+        else:
+            self._lower(term, paths)
+        return term
+
+    @staticmethod
+    def _product_keys(p: ProductRecord):
+        if p.status != "active":
+            return []
+        return [(kind, text) for kind, text in (("name", p.name), ("model", p.model), ("brand", p.brand)) if text]
+
+    def add_static(self, kind: str, text: str):
+        with self.lock:
+            self._adjust(kind, text, 1, 1)
+
+    def index_product(self, p: ProductRecord):
+        """商品建立、改名或上下架時呼叫；引用的詞沒有變動時不做事"""
+        keys = self._product_keys(p)
+        with self.lock:
+            old = self.product_terms.get(p.id, [])
+            if [(t.kind, t.key) for t in old] == [(kind, normalize_text(text)) for kind, text in keys]:
+                return
+            weight = 1 + self.sold.get(p.id, 0)
+            for t in old:
+                self._adjust(t.kind, t.text, -weight, -1)
+            self.product_terms[p.id] = [t for t in (self._adjust(kind, text, weight, 1) for kind, text in keys) if t]
+
+    def remove_product(self, product_id: int):
+        with self.lock:
+            weight = 1 + self.sold.pop(product_id, 0)
+            for t in self.product_terms.pop(product_id, []):
+                self._adjust(t.kind, t.text, -weight, -1)
+
+    def record_sale(self, product_id: int, quantity: int):
+        with self.lock:
+            self.sold[product_id] = self.sold.get(product_id, 0) + quantity
+            for t in self.product_terms.get(product_id, []):
+                self._adjust(t.kind, t.text, quantity, 0)
+
+    def suggest(self, query: str, limit: int):
+        key = normalize_text(query)
+        if not key:
+            return []
+        with self.lock:
+            node = self.root
+            for ch in key[:SUGGEST_MAX_DEPTH]:
+                node = node.children.get(ch) if node.children else None
+                if node is None:
+                    return []
+            top = list(node.top)
+        # 超過樹深的查詢再以完整前綴過濾
+        if len(key) > SUGGEST_MAX_DEPTH:
+            top = [t for t in top if any(t.key.startswith(key, i) for i in t.starts)]
+        return [{"text": t.text, "kind": t.kind, "weight": t.weight} for t in top[:limit]]
+
+suggester = Suggester()
+for brand in PRODUCT_BRANDS:
+    suggester.add_static("brand", brand)
+
+@app.get("/api/suggest")
+def get_suggestions(q: str = "", limit: int = 8):
+    """搜尋框即時建議：商品名稱、型號與品牌，依熱門度排序"""
+    return {"query": q, "suggestions": suggester.suggest(q, min(max(limit, 1), SUGGEST_MAX_LIMIT))}
+
+# ============== 重複商品偵測 ==============
+# 名稱、型號、品牌與描述正規化後取字元 3-gram，以 MinHash 壓成 DUPLICATE_HASHES 個值，切成 DUPLICATE_BANDS 段做 LSH：
+# 任一段完全相同即為候選，再以簽章相同的比例估計 Jaccard 相似度。建立商品時段鍵混入 seller_id，只會撞到同一賣家的商品；
+# 全站分群由管理員以批次工作執行。圖片另以上傳時算出的 SHA-256 比對完全相同的檔案
+DUPLICATE_HASHES = 32
+DUPLICATE_BANDS = 8                 # 每段 4 個值：相似度 0.8 的商品有 98.5% 機率成為候選
+DUPLICATE_SIMILARITY = float(os.environ.get("DUPLICATE_SIMILARITY", "0.8"))
+DUPLICATE_DESCRIPTION_CHARS = 1000  # 描述只取開頭，避免長篇制式說明蓋過名稱與型號
+DUPLICATE_BUCKET_CAP = 32           # 每個段鍵最多取出的候選數，同一賣家大量重複上架時單筆成本仍有上限
+DUPLICATE_MERGE_KEYS = 1 << 16      # 待合併段鍵達此數量時併入排序陣列
+DUPLICATE_REPORT = 10               # 回應中最多列出的疑似重複商品數
+U64 = (1 << 64) - 1
+
+def _hash_params(seed: int, n: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(1, 2**63, n, dtype=np.uint64) | np.uint64(1)
+
+MINHASH_A, MINHASH_B = _hash_params(1, DUPLICATE_HASHES), _hash_params(2, DUPLICATE_HASHES)
+BAND_MIX = _hash_params(3, DUPLICATE_HASHES // DUPLICATE_BANDS)
+BAND_SALT = _hash_params(4, DUPLICATE_BANDS)
+SELLER_MIX = 0x9E3779B97F4A7C15
+
+def shingles(p: ProductRecord) -> np.ndarray:
+    """正規化文字的字元 3-gram，三個 21 位元碼位組成一個整數"""
+    fields = (p.name, p.model, p.brand, (p.description or "")[:DUPLICATE_DESCRIPTION_CHARS])
+    text = "\x1f".join(normalize_text(f) for f in fields if f)
+    codes = np.frombuffer(text.encode("utf-32-le"), np.uint32).astype(np.uint64)
+    if not len(codes):
+        return codes
+    codes = np.pad(codes, (0, max(0, 3 - len(codes))))
+    return np.unique(codes[:-2] << np.uint64(42) | codes[1:-1] << np.uint64(21) | codes[2:])
+
+def minhash(grams: np.ndarray) -> np.ndarray:
+    """multiply-shift 雜湊族，每個雜湊取最小值"""
+    return ((MINHASH_A[:, None] * grams + MINHASH_B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+def band_keys(sigs: np.ndarray, seller_id: int = None, per_seller: bool = False) -> np.ndarray:
+    """(n, 簽章) -> (n, 段) 段鍵；per_seller 時混入賣家，不同賣家的商品不會相撞"""
+    parts = sigs.reshape(len(sigs), DUPLICATE_BANDS, -1).astype(np.uint64)
+    keys = (parts * BAND_MIX).sum(axis=2, dtype=np.uint64) + BAND_SALT
+    if per_seller:
+        keys ^= np.uint64(((seller_id or 0) + 1) * SELLER_MIX & U64)
+    return keys
+
+class DuplicateIndex:
+    """簽章以 product_id 為列存放。段鍵分成已排序的陣列與待合併的 dict：查詢對陣列做二分搜尋，
+    待合併量達 DUPLICATE_MERGE_KEYS 時由觸發的請求在鎖外以 np.insert 併入，順便清掉已刪除商品的段鍵；
+    併入期間其餘請求照常寫入新的 dict，查詢同時看三者"""
+    def __init__(self, capacity: int = 1024):
+        self.sigs = np.zeros((capacity, DUPLICATE_HASHES), np.uint32)
+        self.alive = np.zeros(capacity, np.bool_)
+        self.keys = np.zeros(0, np.uint64)
+        self.key_rows = np.zeros(0, np.intp)
+        self.pending: Dict[int, List[int]] = {}          # 段鍵 -> product_id
+        self.pending_keys = 0
+        self.merging: Optional[Dict[int, List[int]]] = None
+        self.images: Dict[tuple, List[int]] = {}         # (seller_id, sha256) -> product_id
+        self.product_images: Dict[int, List[tuple]] = {}
+        self.removed = 0
+        self.stats = {"indexed": 0, "flagged": 0, "merges": 0, "merge_ms": 0.0, "merge_max_ms": 0.0}
+        self.lock = threading.Lock()
+
+    def _reserve(self, product_id: int):
+        capacity = len(self.alive)
+        if product_id >= capacity:
+            capacity = max(capacity * 2, product_id + 1)
+            sigs = np.zeros((capacity, DUPLICATE_HASHES), np.uint32)
+            sigs[:len(self.sigs)] = self.sigs
+            alive = np.zeros(capacity, np.bool_)
+            alive[:len(self.alive)] = self.alive
+            self.sigs, self.alive = sigs, alive
+
+    def _candidates(self, keys: np.ndarray) -> np.ndarray:
+        lo = np.searchsorted(self.keys, keys, "left").tolist()
+        hi = np.searchsorted(self.keys, keys, "right").tolist()
+        parts = [self.key_rows[a:min(b, a + DUPLICATE_BUCKET_CAP)] for a, b in zip(lo, hi) if b > a]
+        for k in keys.tolist():
+            for table in (self.pending, self.merging or {}):
+                rows = table.get(k)
+                if rows:
+                    parts.append(np.array(rows[:DUPLICATE_BUCKET_CAP], np.intp))
+        return np.unique(np.concatenate(parts)) if parts else self.key_rows[:0]
+
+    def _merge(self, count: int):
+        """在鎖外將 merging 併入排序陣列；同一時間只有一個併入，排序陣列只在此替換"""
+        start = time.perf_counter()
+        with self.lock:
+            merging, alive, removed = self.merging, self.alive, self.removed
+            self.removed = 0
+        keys = np.fromiter((k for k, rows in merging.items() for _ in rows), np.uint64, count)
+        rows = np.fromiter((r for rs in merging.values() for r in rs), np.intp, count)
+        live = alive[rows]
+        keys, rows = keys[live], rows[live]
+        order = np.argsort(keys, kind="stable")
+        keys, rows = keys[order], rows[order]
+        old_keys, old_rows = self.keys, self.key_rows
+        if removed:
+            live = alive[old_rows]
+            old_keys, old_rows = old_keys[live], old_rows[live]
+        at = np.searchsorted(old_keys, keys, "right")
+        keys, rows = np.insert(old_keys, at, keys), np.insert(old_rows, at, rows)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.keys, self.key_rows, self.merging = keys, rows, None
+            self.stats["merges"] += 1
+            self.stats["merge_ms"] = round(self.stats["merge_ms"] + elapsed, 1)
+            self.stats["merge_max_ms"] = round(max(self.stats["merge_max_ms"], elapsed), 1)
+
+    def index(self, p: ProductRecord, image_hashes=(), text: bool = True) -> List[dict]:
+        """商品建立、改名或上傳圖片時呼叫；回傳同一賣家中疑似重複的既有商品，依相似度排序"""
+        sig = None
+        if text:
+            grams = shingles(p)
+            sig = minhash(grams) if len(grams) else None
+        found, merge = {}, 0
+        with self.lock:
+            self._reserve(p.id)
+            if sig is not None:
+                keys = band_keys(sig[None], p.seller_id, per_seller=True)[0]
+                rows = self._candidates(keys)
+                rows = rows[(rows != p.id) & self.alive[rows]]
+                similarity = (self.sigs[rows] == sig).mean(axis=1)
+                hit = similarity >= DUPLICATE_SIMILARITY
+                for pid, score in zip(rows[hit].tolist(), similarity[hit].tolist()):
+                    found[pid] = ("text", score)
+                self.sigs[p.id] = sig
+                self.alive[p.id] = True
+                for k in keys.tolist():
+                    self.pending.setdefault(k, []).append(p.id)
+                self.pending_keys += len(keys)
+                if self.pending_keys >= DUPLICATE_MERGE_KEYS and self.merging is None:
+                    merge, self.merging, self.pending, self.pending_keys = self.pending_keys, self.pending, {}, 0
+            for sha in image_hashes:
+                key = (p.seller_id, sha)
+                owners = self.images.setdefault(key, [])
+                found.update((pid, ("image", 1.0)) for pid in owners[:DUPLICATE_BUCKET_CAP] if pid != p.id)
+                if p.id not in owners:
+                    owners.append(p.id)
+                    self.product_images.setdefault(p.id, []).append(key)
+            self.stats["indexed"] += 1
+            self.stats["flagged"] += bool(found)
+        if merge:
+            self._merge(merge)
+        ranked = sorted(found.items(), key=lambda kv: (-kv[1][1], kv[0]))
+        return [{"product_id": pid, "name": products_by_id[pid].name, "similarity": round(score, 3), "reason": reason}
+                for pid, (reason, score) in ranked if pid in products_by_id][:DUPLICATE_REPORT]
+
+    def remove(self, product_id: int):
+        with self.lock:
+            if product_id < len(self.alive) and self.alive[product_id]:
+                self.alive[product_id] = False
+                self.removed += 1
+            for key in self.product_images.pop(product_id, []):
+                owners = self.images[key]
+                owners.remove(product_id)
+                if not owners:
+                    del self.images[key]
+
+    def cluster(self) -> List[List[int]]:
+        """全站分群：各段排序後段鍵相同的相鄰商品、相似度達門檻者連邊，圖片雜湊相同者也連邊，取連通元件"""
+        with self.lock:
+            ids = np.flatnonzero(self.alive)
+            sigs = self.sigs[ids]
+            size = len(self.alive)
+            same_image = {}
+            for (_, sha), owners in self.images.items():
+                same_image.setdefault(sha, []).extend(owners)
+        src, dst = [], []
+        keys = band_keys(sigs)
+        for b in range(DUPLICATE_BANDS):
+            order = np.argsort(keys[:, b], kind="stable")
+            k = keys[order, b]
+            same = np.flatnonzero(k[1:] == k[:-1])
+            x, y = order[same], order[same + 1]
+            close = (sigs[x] == sigs[y]).mean(axis=1) >= DUPLICATE_SIMILARITY
+            src.append(ids[x[close]])
+            dst.append(ids[y[close]])
+        for owners in same_image.values():
+            if len(owners) > 1:
+                src.append(np.array(owners[:-1], np.intp))
+                dst.append(np.array(owners[1:], np.intp))
+        src, dst = np.concatenate(src), np.concatenate(dst)
+        if not len(src):
+            return []
+        # 標籤傳遞加指標跳躍：每條邊兩端取較小標籤，直到所有邊兩端標籤相同
+        labels = np.arange(size)
+        while True:
+            low = np.minimum(labels[src], labels[dst])
+            np.minimum.at(labels, src, low)
+            np.minimum.at(labels, dst, low)
+            labels = labels[labels]
+            if (labels[src] == labels[dst]).all():
+                break
+        members = np.unique(np.concatenate([src, dst]))
+        members = members[np.argsort(labels[members], kind="stable")]
+        cuts = np.flatnonzero(np.diff(labels[members])) + 1
+        clusters = [c.tolist() for c in np.split(members, cuts)]
+        clusters.sort(key=lambda c: (-len(c), c[0]))
+        return clusters
+
+    def metrics(self) -> dict:
+        with self.lock:
+            merging = sum(map(len, self.merging.values())) if self.merging else 0
+            return {"products": int(self.alive.sum()), "keys": len(self.keys) + self.pending_keys + merging,
+                    "images": len(self.images), **self.stats}
+
+duplicates = DuplicateIndex()
+duplicate_scan = {"status": "idle", "started_at": None, "finished_at": None, "elapsed_ms": None, "clusters": []}
+
+async def run_duplicate_scan():
+    start = time.perf_counter()
+    try:
+        clusters = await run_in_threadpool(duplicates.cluster)
+        duplicate_scan.update(status="done", clusters=clusters)
+    except Exception as e:
+        print(f"Error: {e}")
+        duplicate_scan.update(status="failed")
+    finally:
+        duplicate_scan.update(finished_at=now(), elapsed_ms=round((time.perf_counter() - start) * 1000, 1))
+
+@app.post("/api/duplicates/scan")
+async def scan_duplicates():
+    """管理員批次工作：將全站商品依文字與圖片分群，結果以 GET /api/duplicates 查詢"""
+    if duplicate_scan["status"] == "running":
+        return {"message": "分群進行中", "status": "running"}
+    duplicate_scan.update(status="running", started_at=now(), finished_at=None, elapsed_ms=None)
+    spawn(run_duplicate_scan())
+    return {"message": "已開始分群", "status": "running"}
+
+@app.get("/api/duplicates")
+def get_duplicates(limit: int = 50, seller_id: int = None):
+    """最近一次分群結果，依群組大小排序；已刪除的商品不列出"""
+    groups = []
+    for cluster in duplicate_scan["clusters"]:
+        items = [products_by_id[pid] for pid in cluster if pid in products_by_id]
+        if len(items) < 2 or (seller_id is not None and all(p.seller_id != seller_id for p in items)):
+            continue
+        groups.append([{"id": p.id, "name": p.name, "brand": p.brand, "model": p.model, "seller_id": p.seller_id,
+                        "price": p.price, "status": p.status} for p in items])
+        if len(groups) >= limit:
+            break
+    info = {k: v for k, v in duplicate_scan.items() if k != "clusters"}
+    return {**info, "total_clusters": len(duplicate_scan["clusters"]),
+            "duplicate_products": sum(len(c) for c in duplicate_scan["clusters"]), "clusters": groups}
+
+# ============== 詢價索引 ==============
+SORTED_CHUNK = 1000
+
+class SortedKeys:
+    """分段的排序清單：每段最多 2 * SORTED_CHUNK 個鍵，插入與刪除只搬動所在的一段，
+    避免在百萬筆的 list 上 insort / pop 整段搬移。支援 len、迭代、依位置切片與二分搜尋"""
+    __slots__ = ("chunks", "maxes", "size")
+
+    def __init__(self):
+        self.chunks: List[list] = []
+        self.maxes: list = []  # 各段最大鍵
+        self.size = 0
+
+    def add(self, key):
+        if not self.chunks:
+            self.chunks.append([key])
+            self.maxes.append(key)
+        else:
+            i = min(bisect.bisect_left(self.maxes, key), len(self.maxes) - 1)
+            chunk = self.chunks[i]
+            bisect.insort(chunk, key)
+            self.maxes[i] = chunk[-1]
+            if len(chunk) > 2 * SORTED_CHUNK:
+                self.chunks[i:i + 1] = [chunk[:SORTED_CHUNK], chunk[SORTED_CHUNK:]]
+                self.maxes[i:i + 1] = [chunk[SORTED_CHUNK - 1], chunk[-1]]
+        self.size += 1
+
+    def remove(self, key):
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, key)
+        if j < len(chunk) and chunk[j] == key:
+            chunk.pop(j)
+            self.size -= 1
+            if chunk:
+                self.maxes[i] = chunk[-1]
+            else:
+                del self.chunks[i], self.maxes[i]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def bisect_left(self, key) -> int:
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return self.size
+        return sum(len(c) for c in self.chunks[:i]) + bisect.bisect_left(self.chunks[i], key)
+
+    def irange(self, start: int, stop: int):
+        """依位置 [start, stop) 逐一產生，不先組成 list"""
+        for chunk in self.chunks:
+            if start >= stop:
+                return
+            if start < len(chunk):
+                yield from chunk[start:stop]
+            start, stop = max(start - len(chunk), 0), stop - len(chunk)
+
+    def __getitem__(self, s: slice) -> list:
+        start, stop, _ = s.indices(self.size)
+        out = []
+        for chunk in self.chunks:
+            if start >= stop:
+                break
+            if start < len(chunk):
+                out.extend(chunk[start:stop])
+            start, stop = max(start - len(chunk), 0), stop - len(chunk)
+        return out
+
+def index_inquiry(q: Inquiry):
+    """將詢價加入買家、(賣家, 狀態)、狀態索引，並維護賣家待回覆計數"""
+    inquiries_by_id[q.id] = q
+    bisect.insort(inquiries_by_buyer.setdefault(q.buyer_id, []), q.id)
+    inquiries_by_status.setdefault(q.status, SortedKeys()).add(q.id)
+    if q.seller_id is not None:
+        inquiries_by_seller.setdefault(q.seller_id, {}).setdefault(q.status, SortedKeys()).add(q.id)
+        if q.status == "pending":
+            open_inquiries[q.seller_id] = open_inquiries.get(q.seller_id, 0) + 1
+
+def reindex_inquiry_status(q: Inquiry, old_status: str):
+    inquiries_by_status[old_status].remove(q.id)
+    inquiries_by_status.setdefault(q.status, SortedKeys()).add(q.id)
+    if q.seller_id is not None:
+        by_status = inquiries_by_seller[q.seller_id]
+        by_status[old_status].remove(q.id)
+        by_status.setdefault(q.status, SortedKeys()).add(q.id)
+        delta = (q.status == "pending") - (old_status == "pending")
+        if delta:
+            open_inquiries[q.seller_id] = open_inquiries.get(q.seller_id, 0) + delta
+
 # ============== 詢價系統 ==============
 @app.post("/api/inquiries")
 def create_inquiry(product_id: int = Form(...), buyer_id: int = Form(...), message: str = Form(...)):
-    inquiry = Inquiry(id=next_id["inquiry"], product_id=product_id, buyer_id=buyer_id, message=message, status="pending", created_at=now())
+    product = products_by_id.get(product_id)
+    seller_id = product.seller_id if product else None
+    inquiry = Inquiry(id=next_id["inquiry"], product_id=product_id, buyer_id=buyer_id, seller_id=seller_id, message=message, status="pending", created_at=now())
     inquiries_db.append(inquiry)
+    index_inquiry(inquiry)
     next_id["inquiry"] += 1
     return {"message": "詢價已發送", "inquiry": inquiry.dict()}
 
 @app.get("/api/inquiries")
-def get_inquiries(buyer_id: int = None):
-    result = inquiries_db
-    if buyer_id: result = [i for i in result if i.buyer_id == buyer_id]
-    return {"inquiries": [i.dict() for i in result]}
+def get_inquiries(buyer_id: int = None, seller_id: int = None, status: str = None, page: int = 1, limit: int = None):
+    """未指定 limit 時回傳全部符合的詢價；分頁時以 total / has_more 判斷是否還有下一頁"""
+    # 選擇最窄的索引：買家 > (賣家, 狀態) > 賣家全部狀態 > 全域狀態
+    match = None
+    if buyer_id:
+        lists = [inquiries_by_buyer.get(buyer_id, [])]
+        if seller_id or status:
+            match = lambda q: (not seller_id or q.seller_id == seller_id) and (not status or q.status == status)
+    elif seller_id:
+        by_status = inquiries_by_seller.get(seller_id, {})
+        lists = [by_status.get(status, [])] if status else list(by_status.values())
+    elif status:
+        lists = [inquiries_by_status.get(status, [])]
+    else:
+        lists = [[q.id for q in inquiries_db]]
+
+    start = (max(page, 1) - 1) * limit if limit else 0
+    stop = start + limit if limit else None
+    if match is None:
+        total = sum(len(ids) for ids in lists)
+        if len(lists) == 1:
+            page_ids = lists[0][start:stop]
+        else:
+            page_ids = list(islice(heapq.merge(*lists), start, stop))
+    else:
+        hits = [i for i in lists[0] if match(inquiries_by_id[i])]
+        total = len(hits)
+        page_ids = hits[start:stop]
+    result = {"inquiries": [inquiries_by_id[i].dict() for i in page_ids], "total": total, "page": page, "limit": limit,
+              "has_more": start + len(page_ids) < total}
+    if seller_id:
+        result["open_count"] = open_inquiries.get(seller_id, 0)
+    return result
+
+@app.get("/api/inquiries/open-count")
+def get_open_inquiry_count(seller_id: int):
+    return {"seller_id": seller_id, "open_count": open_inquiries.get(seller_id, 0)}
+
+@app.post("/api/inquiries/bulk")
+def bulk_update_inquiries(body: InquiryBulkUpdate):
+    """賣家一次回覆或結案多筆詢價；不屬於該賣家的詢價會列在 failed"""
+    updated, failed = 0, []
+    ts = now()
+    for u in body.updates:
+        q = inquiries_by_id.get(u.id)
+        if not q or q.seller_id != body.seller_id:
+            failed.append({"id": u.id, "detail": "詢價不存在"})
+            continue
+        if u.status not in INQUIRY_STATUSES:
+            failed.append({"id": u.id, "detail": "無效的詢價狀態"})
+            continue
+        if u.reply is not None:
+            q.reply = u.reply
+        if u.status != q.status:
+            old_status = q.status
+            q.status = u.status
+            reindex_inquiry_status(q, old_status)
+        q.updated_at = ts
+        updated += 1
+    return {"message": "批次處理完成", "updated": updated, "failed": failed,
+            "open_count": open_inquiries.get(body.seller_id, 0)}
+
+# ============== 到期回收 ==============
+# 購物車等暫存紀錄記下最後存取時間，由階層式時間輪在閒置超過 TTL 後回收。
+# 存取只更新時間戳記；計時器到期時才比對，仍在使用就依最後存取時間重新排程，不掃描整個集合
+CART_TTL = float(os.environ.get("CART_TTL", str(7 * 86400)))
+EXPIRY_TICK = 1.0   # 時間輪刻度（秒），也是回收的最大延遲
+EXPIRY_SLOTS = 64
+EXPIRY_LEVELS = 4   # 64^4 刻約 194 天；更遠的到期時間先放在最高層，下放時重新定位
+
+class TimingWheel:
+    """第 n 層每格 EXPIRY_SLOTS**n 刻。項目放在能容納剩餘刻數的最低層，
+    該格的區間開始時下放到較低層，最底層的格子輪到即到期；每個項目最多下放 EXPIRY_LEVELS 次"""
+    def __init__(self, tick: float, slots: int, levels: int):
+        self.tick, self.slots, self.levels = tick, slots, levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.now_tick = int(time.monotonic() / tick)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _place(self, due: int, item):
+        delta, unit = due - self.now_tick, 1
+        for level in range(self.levels):
+            if delta < unit * self.slots or level == self.levels - 1:
+                self.wheels[level][due // unit % self.slots].append((due, item))
+                return
+            unit *= self.slots
+
+    def schedule(self, deadline: float, item):
+        with self.lock:
+            self._place(max(math.ceil(deadline / self.tick), self.now_tick + 1), item)
+            self.size += 1
+
+    def advance(self, now: float) -> list:
+        """推進到 now，回傳到期的項目"""
+        expired = []
+        with self.lock:
+            target = int(now / self.tick)
+            while self.now_tick < target:
+                self.now_tick += 1
+                # 高層先下放，同一刻到期的項目才會落到接著處理的最底層格子
+                for level in range(self.levels - 1, 0, -1):
+                    unit = self.slots ** level
+                    if self.now_tick % unit == 0:
+                        wheel, slot = self.wheels[level], self.now_tick // unit % self.slots
+                        bucket, wheel[slot] = wheel[slot], []
+                        for due, item in bucket:
+                            self._place(due, item)
+                slot = self.now_tick % self.slots
+                if self.wheels[0][slot]:
+                    expired += [item for _, item in self.wheels[0][slot]]
+                    self.wheels[0][slot] = []
+            self.size -= len(expired)
+        return expired
+
+expiry_wheel = TimingWheel(EXPIRY_TICK, EXPIRY_SLOTS, EXPIRY_LEVELS)
+
+class ExpiryTracker:
+    """每個 key 同時只有一個計時器；on_expire 在 lock 內呼叫，與一般寫入互斥"""
+    def __init__(self, name: str, ttl: float, on_expire, lock: threading.Lock):
+        self.name, self.ttl, self.on_expire, self.lock = name, ttl, on_expire, lock
+        self.touched: Dict = {}
+        self.scheduled: set = set()  # 輪上仍有計時器的 key；forget 後計時器留在輪上，再次 touch 不重複排程
+        self.evicted = 0
+
+    def touch(self, key):
+        """呼叫端須持有 lock"""
+        now = time.monotonic()
+        self.touched[key] = now
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            expiry_wheel.schedule(now + self.ttl, (self, key))
+
+    def forget(self, key):
+        """呼叫端須持有 lock；計時器仍在輪上，到期時找不到 key 即略過"""
+        self.touched.pop(key, None)
+
+    def check(self, key, now: float):
+        with self.lock:
+            self.scheduled.discard(key)
+            touched = self.touched.get(key)
+            if touched is None:
+                return
+            if now - touched < self.ttl:
+                self.scheduled.add(key)
+                expiry_wheel.schedule(touched + self.ttl, (self, key))
+                return
+            del self.touched[key]
+            self.on_expire(key)
+            self.evicted += 1
+
+    def metrics(self):
+        return {"ttl": self.ttl, "tracked": len(self.touched), "scheduled": len(self.scheduled), "evicted": self.evicted}
+
+expiry_trackers: Dict[str, ExpiryTracker] = {}
+
+def sweep_expired(now: float = None):
+    now = time.monotonic() if now is None else now
+    for tracker, key in expiry_wheel.advance(now):
+        tracker.check(key, now)
+
+async def expiry_sweeper():
+    # 回收在執行緒池進行，等待 carts_lock 不會卡住事件迴圈
+    while True:
+        await asyncio.sleep(EXPIRY_TICK)
+        await run_in_threadpool(sweep_expired)
+
+@app.on_event("startup")
+async def start_expiry_sweeper():
+    spawn(expiry_sweeper())
 
 # ============== 購物車 ==============
+def buyer_cart(buyer_id: int) -> List[CartRecord]:
+    return list(carts_by_buyer.get(buyer_id, {}).values())
+
+def _drop_cart(buyer_id: int) -> List[CartRecord]:
+    """移除買家整個購物車；呼叫端須持有 carts_lock"""
+    items = list(carts_by_buyer.pop(buyer_id, {}).values())
+    for c in items:
+        carts_by_id.pop(c.id, None)
+    cart_expiry.forget(buyer_id)
+    return items
+
+def _expire_cart(buyer_id: int):
+    for c in _drop_cart(buyer_id):
+        record_change("cart", c.id, "delete", buyer_id)
+
+cart_expiry = expiry_trackers["cart"] = ExpiryTracker("cart", CART_TTL, _expire_cart, carts_lock)
+
 @app.get("/api/cart")
 def get_cart(buyer_id: int):
-    items = [c for c in cart_db if c.buyer_id == buyer_id]
+    items = buyer_cart(buyer_id)
+    if items:
+        with carts_lock:
+            if buyer_id in carts_by_buyer:
+                cart_expiry.touch(buyer_id)
     result = []
     for c in items:
-        for p in products_db:
-            if p.id == c.product_id:
-                result.append({"cart_id": c.id, "product": p.dict(), "quantity": c.quantity})
+        p = products_by_id.get(c.product_id)
+        if p:
+            result.append({"cart_id": c.id, "product": p.dict(), "quantity": c.quantity})
     return {"items": result}
 
 @app.post("/api/cart")
 def add_to_cart(buyer_id: int = Form(...), product_id: int = Form(...), quantity: int = Form(1)):
-    for c in cart_db:
-        if c.buyer_id == buyer_id and c.product_id == product_id:
+    with carts_lock:
+        items = carts_by_buyer.setdefault(buyer_id, {})
+        c = items.get(product_id)
+        existed = c is not None
+        if existed:
             c.quantity += quantity
-            return {"message": "數量更新", "cart": c.dict()}
-    item = CartItem(id=next_id["cart"], buyer_id=buyer_id, product_id=product_id, quantity=quantity)
-    cart_db.append(item)
-    next_id["cart"] += 1
-    return {"message": "已加入購物車", "cart": item.dict()}
+        else:
+            c = CartRecord.validated(id=next_id["cart"], buyer_id=buyer_id, product_id=product_id, quantity=quantity)
+            items[product_id] = carts_by_id[c.id] = c
+            next_id["cart"] += 1
+        cart_expiry.touch(buyer_id)
+    record_change("cart", c.id, buyer_id=buyer_id)
+    if existed:
+        return {"message": "數量更新", "cart": c.dict()}
+    return {"message": "已加入購物車", "cart": c.dict()}
 
 @app.delete("/api/cart/{cart_id}")
 def remove_from_cart(cart_id: int):
-    global cart_db
-    for i, c in enumerate(cart_db):
-        if c.id == cart_id:
-            cart_db.pop(i)
-            return {"message": "已移除"}
-    raise HTTPException(status_code=404, detail="購物車項目不存在")
+    with carts_lock:
+        c = carts_by_id.pop(cart_id, None)
+        if c:
+            items = carts_by_buyer[c.buyer_id]
+            items.pop(c.product_id, None)
+            if items:
+                cart_expiry.touch(c.buyer_id)
+            else:
+                carts_by_buyer.pop(c.buyer_id)
+                cart_expiry.forget(c.buyer_id)
+    if not c:
+        raise HTTPException(status_code=404, detail="購物車項目不存在")
+    record_change("cart", cart_id, "delete", c.buyer_id)
+    return {"message": "已移除"}
 
 @app.delete("/api/cart")
 def clear_cart(buyer_id: int):
-    global cart_db
-    cart_db = [c for c in cart_db if c.buyer_id != buyer_id]
+    with carts_lock:
+        items = _drop_cart(buyer_id)
+    for c in items:
+        record_change("cart", c.id, "delete", buyer_id)
     return {"message": "購物車已清空"}
 
+# ============== 定價 ==============
+# 規則編譯成每個 SKU 的級距表 (數量下限, 單價（分）, 規則 id, 定價)；報價時每行只做一次二分搜尋，
+# 金額以整數分計算，不累積浮點誤差。
+# 規則或商品異動時只重新編譯受影響的 SKU
+class PriceBook:
+    def __init__(self):
+        self.rules: Dict[int, PriceRule] = {}
+        self.by_product: Dict[int, List[int]] = {}   # product_id -> 規則 id
+        self.by_brand: Dict[str, List[int]] = {}     # brand -> 規則 id
+        self.brand_products: Dict[str, set] = {}     # brand -> product_id
+        self.public: Dict[int, tuple] = {}           # product_id -> 級距表
+        self.contracts: Dict[int, Dict[int, tuple]] = {}  # buyer_id -> product_id -> 級距表
+        self.contract_buyers: Dict[int, set] = {}    # product_id -> 有合約表的 buyer_id
+        self.brands: Dict[int, str] = {}             # product_id -> 編譯時的 brand
+        self.lock = threading.Lock()
+
+    def _applicable(self, p: ProductRecord):
+        ids = self.by_product.get(p.id, []) + self.by_brand.get(p.brand, [])
+        return [self.rules[i] for i in ids]
+
+    @staticmethod
+    def _compile(base: float, rules: List[PriceRule]) -> tuple:
+        """各級距取目前為止最低的單價；第一級從定價開始"""
+        rules = sorted(rules, key=lambda r: r.min_qty)
+        qtys, prices, rule_ids = [1], [round(base * 100)], [None]
+        for r in rules:
+            unit = round((r.price if r.price is not None else base * (1 - r.discount / 100)) * 100)
+            if unit >= prices[-1]:
+                continue
+            if r.min_qty == qtys[-1]:
+                prices[-1], rule_ids[-1] = unit, r.id
+            else:
+                qtys.append(r.min_qty)
+                prices.append(unit)
+                rule_ids.append(r.id)
+        return qtys, prices, rule_ids, base
+
+    def refresh(self, product_ids):
+        """重新編譯指定 SKU 的公開表與合約表；商品已刪除時移除"""
+        with self.lock:
+            for pid in product_ids:
+                old_brand = self.brands.pop(pid, None)
+                if old_brand is not None:
+                    self.brand_products[old_brand].discard(pid)
+                p = products_by_id.get(pid)
+                old_buyers = self.contract_buyers.pop(pid, set())
+                if not p:
+                    self.public.pop(pid, None)
+                    for b in old_buyers:
+                        self.contracts[b].pop(pid, None)
+                    continue
+                self.brands[pid] = p.brand
+                self.brand_products.setdefault(p.brand, set()).add(pid)
+                rules, base = self._applicable(p), p.price or 0
+                self.public[pid] = self._compile(base, [r for r in rules if r.buyer_id is None])
+                buyers = {r.buyer_id for r in rules if r.buyer_id is not None}
+                for b in old_buyers - buyers:
+                    self.contracts[b].pop(pid, None)
+                for b in buyers:
+                    self.contracts.setdefault(b, {})[pid] = self._compile(base, [r for r in rules if r.buyer_id in (None, b)])
+                if buyers:
+                    self.contract_buyers[pid] = buyers
+
+    def _scope(self, rule: PriceRule):
+        return [rule.product_id] if rule.product_id is not None else list(self.brand_products.get(rule.brand, ()))
+
+    def add_rule(self, rule: PriceRule):
+        self.rules[rule.id] = rule
+        if rule.product_id is not None:
+            self.by_product.setdefault(rule.product_id, []).append(rule.id)
+        else:
+            self.by_brand.setdefault(rule.brand, []).append(rule.id)
+        self.refresh(self._scope(rule))
+
+    def remove_rule(self, rule_id: int):
+        rule = self.rules.pop(rule_id)
+        ids = self.by_product[rule.product_id] if rule.product_id is not None else self.by_brand[rule.brand]
+        ids.remove(rule_id)
+        self.refresh(self._scope(rule))
+
+    def quote(self, buyer_id: Optional[int], lines):
+        """lines 為 (product_id, 數量)；回傳 (逐行報價, 總計)，不存在的商品為 None"""
+        contracts = self.contracts.get(buyer_id, {}) if buyer_id is not None else {}
+        public, out, total = self.public, [], 0
+        for pid, qty in lines:
+            table = contracts.get(pid) or public.get(pid)
+            if table is None:
+                out.append(None)
+                continue
+            qtys, prices, rule_ids, base = table
+            i = bisect.bisect_right(qtys, qty) - 1 if qty > 1 else 0
+            subtotal = prices[i] * qty
+            total += subtotal
+            out.append({"product_id": pid, "quantity": qty, "list_price": base, "unit_price": prices[i] / 100,
+                        "subtotal": subtotal / 100, "rule_id": rule_ids[i]})
+        return out, total / 100
+
+pricing = PriceBook()
+
+@app.get("/api/pricing/rules")
+def get_price_rules(product_id: int = None, brand: str = None, buyer_id: int = None):
+    rules = pricing.rules.values()
+    if product_id is not None: rules = [r for r in rules if r.product_id == product_id]
+    if brand: rules = [r for r in rules if r.brand == brand]
+    if buyer_id is not None: rules = [r for r in rules if r.buyer_id == buyer_id]
+    return {"rules": [r.dict() for r in rules]}
+
+@app.post("/api/pricing/rules")
+def create_price_rule(product_id: int = Form(None), brand: str = Form(None), buyer_id: int = Form(None),
+    min_qty: int = Form(1), price: float = Form(None), discount: float = Form(None)):
+    if (product_id is None) == (not brand):
+        raise HTTPException(status_code=400, detail="product_id 與 brand 須擇一")
+    if (price is None) == (discount is None):
+        raise HTTPException(status_code=400, detail="price 與 discount 須擇一")
+    if min_qty < 1 or (price is not None and price < 0) or (discount is not None and not 0 < discount < 100):
+        raise HTTPException(status_code=400, detail="無效的定價規則")
+    if product_id is not None and product_id not in products_by_id:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    rule = PriceRule(id=next_id["price_rule"], product_id=product_id, brand=brand or None, buyer_id=buyer_id,
+                     min_qty=min_qty, price=price, discount=discount, created_at=now())
+    next_id["price_rule"] += 1
+    pricing.add_rule(rule)
+    return {"message": "定價規則已建立", "rule": rule.dict()}
+
+@app.delete("/api/pricing/rules/{rule_id}")
+def delete_price_rule(rule_id: int):
+    if rule_id not in pricing.rules:
+        raise HTTPException(status_code=404, detail="定價規則不存在")
+    pricing.remove_rule(rule_id)
+    return {"message": "刪除成功"}
+
+@app.get("/api/quote")
+def quote_cart(buyer_id: int):
+    """買家目前購物車的報價；商品已刪除的明細列在 unavailable，不計入總計"""
+    cart_items = buyer_cart(buyer_id)
+    lines, total = pricing.quote(buyer_id, [(c.product_id, c.quantity) for c in cart_items])
+    items, unavailable = [], []
+    for c, line in zip(cart_items, lines):
+        if line:
+            items.append({**line, "cart_id": c.id, "product": products_by_id[c.product_id].dict()})
+        else:
+            unavailable.append({"cart_id": c.id, "product_id": c.product_id, "quantity": c.quantity})
+    return {"buyer_id": buyer_id, "items": items, "unavailable": unavailable, "total": total}
+
+@app.post("/api/quote")
+def quote_items(body: QuoteRequest):
+    """批次報價：一次計算整張清單"""
+    lines, total = pricing.quote(body.buyer_id, [(i.product_id, max(i.quantity, 1)) for i in body.items])
+    missing = [i.product_id for i, line in zip(body.items, lines) if line is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"商品不存在: {missing}")
+    return {"buyer_id": body.buyer_id, "items": lines, "total": total}
+
+# ============== 訂單索引 ==============
+def _remove_key(keys, key):
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        keys.pop(i)
+
+def index_order(o: OrderRecord):
+    """將訂單加入 (buyer, created_ts)、(seller, status, created_ts)、(status, created_ts) 索引"""
+    key = (o.created_ts, o.id)
+    orders_by_id[o.id] = o
+    orders_by_buyer.setdefault(o.buyer_id, SortedKeys()).add(key)
+    orders_by_seller.setdefault(o.seller_id, {}).setdefault(o.status, SortedKeys()).add(key)
+    orders_by_status.setdefault(o.status, SortedKeys()).add(key)
+
+def reindex_order_status(o: OrderRecord, old_status: str):
+    """狀態變更時只搬移該筆訂單的索引鍵"""
+    key = (o.created_ts, o.id)
+    orders_by_seller[o.seller_id][old_status].remove(key)
+    orders_by_status[old_status].remove(key)
+    orders_by_seller[o.seller_id].setdefault(o.status, SortedKeys()).add(key)
+    orders_by_status.setdefault(o.status, SortedKeys()).add(key)
+
+def _time_bound(value: str, end: bool = False) -> int:
+    """date_to 為含括：只給日期時含當天整天"""
+    try:
+        ts = to_ts(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式錯誤")
+    return ts + (DAY_US if len(value) <= 10 else 1) if end else ts
+
+def _time_slice(keys: SortedKeys, date_from=None, date_to=None):
+    """以二分搜尋取出時間區間內的鍵"""
+    lo = keys.bisect_left((_time_bound(date_from),)) if date_from else 0
+    hi = keys.bisect_left((_time_bound(date_to, True),)) if date_to else len(keys)
+    return keys, lo, max(lo, hi)
+
+def _order_out(o: OrderRecord, include_items: bool = True):
+    if include_items:
+        return o.dict()
+    d = o.dict(exclude={"items"})
+    d["item_count"] = len(o.items)
+    return d
+
+# ============== 銷售明細 ==============
+# 訂單明細以欄式陣列保存，分析時以 bincount / reduceat 向量化分組加總
+REVENUE_STATUSES = {"paid", "shipped", "completed"}
+SALES_BLOCK = 1 << 20  # 分組結果以區塊快取，區塊內有寫入才重算
+
+class SalesColumns:
+    """訂單明細欄位；依建立時間附加，同一訂單的明細連續存放。
+    net / net_qty 只計入已認列營收的訂單，狀態變更時改寫該訂單的區段"""
+    FIELDS = {"day": np.int32, "seller": np.int32, "buyer": np.intp, "product": np.intp,
+              "net": np.float64, "net_qty": np.float64, "first": np.bool_}
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.cols = {name: np.zeros(capacity, dtype) for name, dtype in self.FIELDS.items()}
+        self.order_rows: Dict[int, tuple] = {}  # order_id -> (起, 迄)
+        self.skus: Dict[int, tuple] = {}        # product_id -> (名稱, 品牌, 類型)
+        self.versions: Dict[int, int] = {}      # 區塊 -> 寫入次數
+        self.block_cache: Dict[int, tuple] = {} # 區塊 -> (版本, 分組結果)
+        self.lock = threading.Lock()
+
+    def _touch(self, lo: int, hi: int):
+        for b in range(lo // SALES_BLOCK, (hi - 1) // SALES_BLOCK + 1):
+            self.versions[b] = self.versions.get(b, 0) + 1
+
+    def _reserve(self, extra: int):
+        capacity = len(self.cols["day"])
+        if self.size + extra > capacity:
+            capacity = max(capacity * 2, self.size + extra)
+            for name, col in self.cols.items():
+                grown = np.zeros(capacity, col.dtype)
+                grown[:self.size] = col[:self.size]
+                self.cols[name] = grown
+
+    def _net(self, o: OrderRecord):
+        recognized = o.status in REVENUE_STATUSES
+        amounts = [(i.get("price") or 0) * i["quantity"] if recognized else 0.0 for i in o.items]
+        quantities = [i["quantity"] if recognized else 0 for i in o.items]
+        return amounts, quantities, recognized
+
+    def append(self, o: OrderRecord):
+        if not o.items:
+            return
+        for i in o.items:
+            p = products_by_id.get(i["product_id"])
+            # 舊訂單的明細沒有品牌、類型時才查目前的商品
+            self.skus[i["product_id"]] = (i.get("name"), i.get("brand") or (p.brand if p else "未知"),
+                                          i.get("category") or (p.category if p else "未知"))
+        amounts, quantities, recognized = self._net(o)
+        count = len(o.items)
+        with self.lock:
+            self._reserve(count)
+            lo, hi = self.size, self.size + count
+            # 時鐘回撥時沿用前一筆日期，維持 day 遞增以便二分搜尋
+            day = o.created_ts // DAY_US + EPOCH_DAY
+            c = self.cols
+            c["day"][lo:hi] = max(day, int(c["day"][lo - 1])) if lo else day
+            c["seller"][lo:hi] = o.seller_id
+            c["buyer"][lo:hi] = o.buyer_id
+            c["product"][lo:hi] = [i["product_id"] for i in o.items]
+            c["net"][lo:hi] = amounts
+            c["net_qty"][lo:hi] = quantities
+            c["first"][lo:hi] = False
+            c["first"][lo] = recognized
+            self.order_rows[o.id] = (lo, hi)
+            self.size = hi
+            self._touch(lo, hi)
+
+    def update_status(self, o: OrderRecord):
+        rows = self.order_rows.get(o.id)
+        if not rows:
+            return
+        amounts, quantities, recognized = self._net(o)
+        lo, hi = rows
+        with self.lock:
+            self.cols["net"][lo:hi] = amounts
+            self.cols["net_qty"][lo:hi] = quantities
+            self.cols["first"][lo] = recognized
+            self._touch(lo, hi)
+
+    def snapshot(self, date_from: str = None, date_to: str = None):
+        """依日期二分搜尋取出列範圍；回傳欄位 view 與 (起, 迄)"""
+        with self.lock:
+            n, cols = self.size, dict(self.cols)
+        day = cols["day"][:n]
+        lo = int(np.searchsorted(day, parse_time(date_from).toordinal(), "left")) if date_from else 0
+        hi = int(np.searchsorted(day, parse_time(date_to).toordinal(), "right")) if date_to else n
+        return cols, lo, max(lo, hi)
+
+    def grouped(self, cols, lo: int, hi: int):
+        """[lo, hi) 的 (商品營收, 商品數量, 買家營收)；完整落在範圍內的區塊沿用快取"""
+        parts = []
+        for b in range(lo // SALES_BLOCK, -(-hi // SALES_BLOCK)):
+            start, end = max(lo, b * SALES_BLOCK), min(hi, (b + 1) * SALES_BLOCK)
+            whole = end - start == SALES_BLOCK
+            version = self.versions.get(b, 0)
+            hit = self.block_cache.get(b) if whole else None
+            if hit and hit[0] == version:
+                parts.append(hit[1])
+                continue
+            part = _bincounts({name: col[start:end] for name, col in cols.items()})
+            if whole:
+                self.block_cache[b] = (version, part)
+            parts.append(part)
+        return tuple(_add_padded([p[i] for p in parts]) for i in range(3))
+
+sales = SalesColumns()
+
+def _bincounts(cols):
+    by_product = np.bincount(cols["product"], weights=cols["net"])
+    qty_by_product = np.bincount(cols["product"], weights=cols["net_qty"], minlength=len(by_product))
+    return by_product, qty_by_product, np.bincount(cols["buyer"], weights=cols["net"])
+
+def _add_padded(arrays):
+    out = np.zeros(max((len(a) for a in arrays), default=0))
+    for a in arrays:
+        out[:len(a)] += a
+    return out
+
+def _top(values: np.ndarray, k: int):
+    """取最大的 k 個非零索引，依值遞減"""
+    nonzero = np.flatnonzero(values)
+    if len(nonzero) > k:
+        nonzero = nonzero[np.argpartition(values[nonzero], -k)[-k:]]
+    return nonzero[np.argsort(values[nonzero])[::-1]]
+
+def _group(names: List[str], codes: np.ndarray, weights: np.ndarray):
+    sums = np.bincount(codes, weights=weights, minlength=len(names))
+    return [{"name": names[i], "revenue": round(float(sums[i]), 2)} for i in np.argsort(sums)[::-1] if sums[i]]
+
+# ============== 共購推薦 ==============
+# 每個商品以 Space-Saving 保留固定數量的共購計數器，記憶體與商品數成正比；
+# 建立訂單時只更新該訂單內商品兩兩之間的計數
+RECOMMEND_CAPACITY = int(os.environ.get("RECOMMEND_CAPACITY", "32"))
+RECOMMEND_MAX_ITEMS = 50  # 單筆訂單最多取前 50 個商品配對，避免大單 O(n²) 更新
+RECOMMEND_MAX_LIMIT = 20
+
+class CoPurchaseIndex:
+    """counts[a][b] 為 a、b 同時出現在訂單中的次數（可能高估，高估上限記在 errors[a][b]）。
+    計數器滿了時淘汰最小者，新商品從被淘汰的計數 + 1 開始"""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[int, Dict[int, int]] = {}
+        self.errors: Dict[int, Dict[int, int]] = {}
+        self.orders = 0
+        self.lock = threading.Lock()
+
+    def _bump(self, pid: int, other: int):
+        counts = self.counts.get(pid)
+        if counts is None:
+            counts = self.counts[pid] = {}
+            self.errors[pid] = {}
+        if other in counts:
+            counts[other] += 1
+        elif len(counts) < self.capacity:
+            counts[other] = 1
+        else:
+            errors = self.errors[pid]
+            victim = min(counts, key=counts.get)
+            floor = counts.pop(victim)
+            errors.pop(victim, None)
+            counts[other] = floor + 1
+            errors[other] = floor
+
+    def record(self, product_ids):
+        ids = list(dict.fromkeys(product_ids))[:RECOMMEND_MAX_ITEMS]
+        with self.lock:
+            self.orders += 1
+            for a in ids:
+                for b in ids:
+                    if a != b:
+                        self._bump(a, b)
+
+    def ranked(self, product_ids):
+        """合併各商品的共購計數，依次數遞減回傳 [(product_id, 次數)]"""
+        scores: Dict[int, int] = {}
+        with self.lock:
+            for pid in product_ids:
+                for other, n in self.counts.get(pid, {}).items():
+                    scores[other] = scores.get(other, 0) + n
+        return sorted(scores.items(), key=lambda kv: -kv[1])
+
+copurchase = CoPurchaseIndex(RECOMMEND_CAPACITY)
+
+@app.get("/api/recommendations")
+def get_recommendations(product_id: int = None, buyer_id: int = None, limit: int = 6):
+    """經常一起購買：product_id 為單一商品；buyer_id 則合併該買家購物車內所有商品"""
+    if product_id is not None:
+        seeds = [product_id]
+    elif buyer_id is not None:
+        seeds = [c.product_id for c in buyer_cart(buyer_id)]
+    else:
+        raise HTTPException(status_code=400, detail="需指定 product_id 或 buyer_id")
+    limit, exclude, result = min(max(limit, 1), RECOMMEND_MAX_LIMIT), set(seeds), []
+    for other, count in copurchase.ranked(seeds):
+        p = products_by_id.get(other)
+        if other in exclude or not p or p.status != "active":
+            continue
+        result.append({"product": p.dict(), "count": count})
+        if len(result) >= limit:
+            break
+    return {"recommendations": result}
+
+# ============== 訂單日誌 ==============
+# 訂單建立與狀態變更寫入只附加的日誌檔，每筆為 [長度][CRC32][LSN] + JSON。
+# 寫入執行緒把同時到達的記錄合併成一次 write + fsync（group commit），請求等記錄落盤才回應；
+# 記錄落盤後才套用到記憶體，鎖內只先保留訂單編號與庫存，失敗時歸還；寫入失敗後日誌停用，之後的寫入直接回 503。
+# 啟動時載入最新快照再重播之後的記錄，定期重寫快照並刪除已被涵蓋的日誌段
+JOURNAL_ENABLED = os.environ.get("JOURNAL", "1") != "0"
+JOURNAL_DIR = Path(os.environ.get("JOURNAL_DIR", "data/journal"))
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "1") != "0"  # 0：只寫入作業系統快取，當機可能遺失最後幾筆
+JOURNAL_SEGMENT_BYTES = 64 << 20
+JOURNAL_COMPACT_INTERVAL = float(os.environ.get("JOURNAL_COMPACT_INTERVAL", "300"))
+JOURNAL_COMPACT_RECORDS = 10_000  # 上次快照後累積這麼多筆才重寫快照
+JOURNAL_TIMEOUT = 10.0
+JOURNAL_HEADER = struct.Struct("<IIQ")  # 長度、CRC32(LSN + 內容)、LSN
+
+orders_lock = threading.Lock()  # 訂單編號、記憶體狀態與日誌順序在同一把鎖內決定
+unsettled_lsns: set = set()     # 已寫入日誌佇列、尚未套用或放棄的 LSN；快照只涵蓋最小值之前
+settling_orders: set = set()    # 狀態變更尚未落盤的訂單，期間拒絕再次變更
+
+class OrderJournal:
+    def __init__(self, directory: Path, fsync: bool):
+        self.dir = directory
+        self.fsync = fsync
+        self.cond = threading.Condition()
+        self.pending: List[tuple] = []  # (lsn, 內容)
+        self.next_lsn = 1
+        self.durable_lsn = 0
+        self.snapshot_lsn = 0
+        self.error: Optional[Exception] = None
+        self.roll = False
+        self.stopping = False
+        self.file = None
+        self.thread: Optional[threading.Thread] = None
+        self.stats = {"records": 0, "batches": 0, "max_batch": 0, "bytes": 0, "recovered": 0, "recovery_ms": 0.0}
+
+    def _files(self, prefix: str, suffix: str):
+        return sorted((int(p.name[len(prefix):-len(suffix)]), p) for p in self.dir.glob(f"{prefix}*{suffix}"))
+
+    def _sync_dir(self):
+        if self.fsync:
+            fd = os.open(self.dir, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _read_segment(self, path: Path, last: bool):
+        """逐筆讀出 (lsn, 記錄)。最後一個非空段尾端不完整或校驗失敗視為寫到一半當機，截斷後結束；
+        較早的段損毀則拒絕啟動"""
+        data = path.read_bytes()
+        pos = 0
+        while pos < len(data):
+            start = pos + JOURNAL_HEADER.size
+            if start <= len(data):
+                length, crc, lsn = JOURNAL_HEADER.unpack_from(data, pos)
+                end = start + length
+                if end <= len(data) and zlib.crc32(data[pos + 8:end]) == crc:
+                    yield lsn, json.loads(data[start:end])
+                    pos = end
+                    continue
+            if not last:
+                raise RuntimeError(f"訂單日誌損毀：{path.name} 位移 {pos}")
+            with open(path, "r+b") as f:
+                f.truncate(pos)
+                os.fsync(f.fileno())
+            print(f"訂單日誌 {path.name} 尾端不完整，已截斷 {len(data) - pos} bytes")
+            return
+
+    def recover(self, apply):
+        """載入最新快照並重播其後的記錄，apply(記錄) 套用到記憶體"""
+        started = time.perf_counter()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        last = count = 0
+        snapshots = self._files("snapshot-", ".json")
+        if snapshots:
+            with open(snapshots[-1][1], encoding="utf-8") as f:
+                snapshot = json.load(f)
+            last = snapshot["lsn"]
+            for order in snapshot["orders"]:
+                apply({"op": "order", "order": order})
+            count = len(snapshot["orders"])
+        self.snapshot_lsn = last
+        segments = self._files("journal-", ".log")
+        tail = max((n for n, (_, path) in enumerate(segments) if path.stat().st_size), default=0)
+        for n, (_, path) in enumerate(segments):
+            for lsn, record in self._read_segment(path, n >= tail):
+                if lsn > last:
+                    apply(record)
+                    last, count = lsn, count + 1
+        self.durable_lsn, self.next_lsn = last, last + 1
+        self.stats["recovered"] = count
+        self.stats["recovery_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _open(self, first_lsn: int):
+        if self.file:
+            self.file.close()
+        self.file = open(self.dir / f"journal-{first_lsn:016d}.log", "ab")
+        self._sync_dir()
+
+    def start(self):
+        self._open(self.next_lsn)
+        self.thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+        self.thread.start()
+
+    def append(self, record: dict) -> int:
+        """須在 orders_lock 內呼叫，記錄順序才與記憶體一致；回傳 LSN，未啟動時回傳 0。
+        寫入執行緒已因錯誤停止時直接拋出該錯誤"""
+        if self.thread is None:
+            return 0
+        payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+        with self.cond:
+            if self.error:
+                raise self.error
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.pending.append((lsn, payload))
+            self.cond.notify_all()
+        return lsn
+
+    def wait(self, lsn: int, timeout: float = JOURNAL_TIMEOUT):
+        """等到 lsn 以前的記錄都已落盤。逾時時記錄若仍在佇列中就撤回；
+        已交給寫入執行緒則等該批寫完或失敗，呼叫端拿到的結果與磁碟一致"""
+        if not lsn:
+            return
+        done = lambda: self.durable_lsn >= lsn or self.error
+        with self.cond:
+            if not self.cond.wait_for(done, timeout):
+                for n, (queued, _) in enumerate(self.pending):
+                    if queued == lsn:
+                        del self.pending[n]
+                        raise TimeoutError("訂單日誌寫入逾時")
+                self.cond.wait_for(done)
+            if self.durable_lsn < lsn:
+                raise self.error
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.stopping)
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                roll, self.roll = self.roll, False
+            try:
+                if roll or self.file.tell() >= JOURNAL_SEGMENT_BYTES:
+                    self._open(batch[0][0])
+                buf = bytearray()
+                for lsn, payload in batch:
+                    crc = zlib.crc32(payload, zlib.crc32(lsn.to_bytes(8, "little")))
+                    buf += JOURNAL_HEADER.pack(len(payload), crc, lsn)
+                    buf += payload
+                self.file.write(buf)
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+            except OSError as e:
+                # 寫入失敗後停止接受新記錄，等待中的請求全部回報錯誤
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            with self.cond:
+                self.durable_lsn = batch[-1][0]
+                self.stats["records"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+                self.stats["bytes"] += len(buf)
+                self.cond.notify_all()
+
+    def write_snapshot(self, lsn: int, orders: list):
+        """寫入快照後刪除舊快照，以及所有記錄都 <= lsn 的日誌段（下一段起點 - 1 <= lsn）"""
+        path = self.dir / f"snapshot-{lsn:016d}.json"
+        tmp = self.dir / f"snapshot-{lsn:016d}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"lsn": lsn, "orders": orders}, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._sync_dir()
+        self.snapshot_lsn = lsn
+        for old, p in self._files("snapshot-", ".json"):
+            if old < lsn:
+                p.unlink()
+        segments = self._files("journal-", ".log")
+        for (_, p), (following, _) in zip(segments, segments[1:]):
+            if following - 1 <= lsn:
+                p.unlink()
+
+    def close(self):
+        if self.thread is None:
+            return
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join(JOURNAL_TIMEOUT)
+        self.thread = None
+        self.file.close()
+
+    def metrics(self):
+        with self.cond:
+            return {"enabled": self.thread is not None, "fsync": self.fsync, "durable_lsn": self.durable_lsn,
+                    "snapshot_lsn": self.snapshot_lsn, "pending": len(self.pending),
+                    "avg_batch": round(self.stats["records"] / max(self.stats["batches"], 1), 2),
+                    "error": str(self.error) if self.error else None, **self.stats}
+
+journal = OrderJournal(JOURNAL_DIR, JOURNAL_FSYNC)
+
+def apply_order(order: OrderRecord):
+    """新訂單加入記憶體與衍生索引；建立訂單與重播日誌共用"""
+    orders_db.append(order)
+    index_order(order)
+    sales.append(order)
+    copurchase.record([i["product_id"] for i in order.items])
+
+def apply_order_status(o: OrderRecord, status: str):
+    old_status = o.status
+    o.status = status
+    reindex_order_status(o, old_status)
+    sales.update_status(o)
+
+def replay_order_record(record: dict):
+    """快照可能已含 LSN 較大的記錄（較早落盤先套用），重播時略過已存在的訂單"""
+    if record["op"] == "order":
+        if record["order"]["id"] in orders_by_id:
+            return
+        order = OrderRecord.validated(**record["order"])
+        apply_order(order)
+        next_id["order"] = max(next_id["order"], order.id + 1)
+    elif record["op"] == "status":
+        o = orders_by_id.get(record["order_id"])
+        if o and o.status != record["status"]:
+            apply_order_status(o, record["status"])
+
+def append_journal(record: dict) -> int:
+    """須在 orders_lock 內呼叫；日誌已停用時在改動任何狀態前回 503"""
+    try:
+        lsn = journal.append(record)
+    except OSError:
+        raise HTTPException(status_code=503, detail="訂單寫入失敗，請稍後再試")
+    if lsn:
+        unsettled_lsns.add(lsn)
+    return lsn
+
+def commit_journal(lsn: int, apply, rollback):
+    """等記錄落盤後在 orders_lock 內 apply()；失敗或逾時則 rollback() 歸還保留的資源並回 503"""
+    try:
+        journal.wait(lsn)
+    except (OSError, TimeoutError):
+        with orders_lock:
+            unsettled_lsns.discard(lsn)
+            rollback()
+        raise HTTPException(status_code=503, detail="訂單寫入失敗，請稍後再試")
+    with orders_lock:
+        unsettled_lsns.discard(lsn)
+        apply()
+
+def compact_order_journal():
+    """鎖內只記下 LSN 與各訂單當下狀態，序列化在鎖外進行；訂單除狀態外建立後不再變動。
+    LSN 取在第一筆未套用的記錄之前，該筆之後落盤的記錄由重播補上"""
+    with orders_lock:
+        lsn = (min(unsettled_lsns) if unsettled_lsns else journal.next_lsn) - 1
+        rows = [(o, o.status) for o in orders_db]
+        with journal.cond:
+            journal.roll = True
+    journal.wait(lsn)
+    journal.write_snapshot(lsn, [{**o.dict(), "status": status} for o, status in rows])
+
+async def compact_journal_loop():
+    while True:
+        await asyncio.sleep(JOURNAL_COMPACT_INTERVAL)
+        if journal.durable_lsn - journal.snapshot_lsn >= JOURNAL_COMPACT_RECORDS:
+            try:
+                await run_in_threadpool(compact_order_journal)
+            except Exception as e:
+                print(f"訂單日誌壓縮失敗：{e}")
+
+@app.on_event("startup")
+async def start_order_journal():
+    if not JOURNAL_ENABLED:
+        return
+    await run_in_threadpool(journal.recover, replay_order_record)
+    journal.start()
+    spawn(compact_journal_loop())
+
+@app.on_event("shutdown")
+def stop_order_journal():
+    journal.close()
+
 # ============== 訂單管理 ==============
 @app.post("/api/orders")
 def create_order(buyer_id: int = Form(...), seller_id: int = Form(...), payment_method: str = Form(...), shipping_address: str = Form(...)):
-    global cart_db
-    cart_items = [c for c in cart_db if c.buyer_id == buyer_id]
+    cart_items = buyer_cart(buyer_id)
     if not cart_items:
         raise HTTPException(status_code=400, detail="購物車為空")
     
-    items = []
-    total = 0
-    for c in cart_items:
-        for p in products_db:
-            if p.id == c.product_id:
-                items.append({"product_id": p.id, "name": p.name, "price": p.price, "quantity": c.quantity})
-                total += (p.price or 0) * c.quantity
+    # 以報價引擎計價；price 為成交單價，list_price 為定價
+    lines, total = pricing.quote(buyer_id, [(c.product_id, c.quantity) for c in cart_items])
+    missing = [c.product_id for c, line in zip(cart_items, lines) if line is None]
+    if missing:
+        raise HTTPException(status_code=409, detail=f"購物車內商品已不存在，請先移除: {missing}")
+    # 品名、品牌、類型隨明細保存，重播日誌時不依賴當下的商品資料
+    products = [products_by_id[line["product_id"]] for line in lines]
+    items = [{"product_id": line["product_id"], "name": p.name, "brand": p.brand, "category": p.category,
+              "price": line["unit_price"], "list_price": line["list_price"], "quantity": line["quantity"], "rule_id": line["rule_id"]}
+             for line, p in zip(lines, products)]
     
-    order = Order(
-        id=next_id["order"],
-        order_number=f"ORD{now().replace('-','').replace(':','')[2:14]}{next_id['order']}",
-        buyer_id=buyer_id, seller_id=seller_id, items=items, total_amount=total,
-        payment_method=payment_method, shipping_address=shipping_address,
-        status="pending", created_at=now()
-    )
-    orders_db.append(order)
-    next_id["order"] += 1
-    cart_db = [c for c in cart_db if c.buyer_id != buyer_id]
-    return {"message": "訂單建立成功", "order": order.dict()}
+    # 鎖內保留訂單編號並先扣庫存，落盤後才加入訂單；寫入失敗時補回庫存
+    with orders_lock:
+        order = OrderRecord.validated(
+            id=next_id["order"],
+            order_number=f"ORD{now().replace('-','').replace(':','')[2:14]}{next_id['order']}",
+            buyer_id=buyer_id, seller_id=seller_id, items=items, total_amount=total,
+            payment_method=payment_method, shipping_address=shipping_address,
+            status="pending", created_at=now()
+        )
+        data = order.dict()
+        lsn = append_journal({"op": "order", "order": data})
+        next_id["order"] += 1
+        touched = adjust_stock(items, -1)
+    commit_journal(lsn, lambda: apply_order(order), lambda: adjust_stock(items, 1))
+    stock_changed(touched)
+    for i in items:
+        suggester.record_sale(i["product_id"], i["quantity"])
+    record_change("order", order.id)
+    with carts_lock:
+        _drop_cart(buyer_id)
+    for c in cart_items:
+        record_change("cart", c.id, "delete", buyer_id)
+    return {"message": "訂單建立成功", "order": data}
 
 @app.get("/api/orders")
-def get_orders(buyer_id: int = None, seller_id: int = None):
-    result = orders_db
-    if buyer_id: result = [o for o in result if o.buyer_id == buyer_id]
-    if seller_id: result = [o for o in result if o.seller_id == seller_id]
-    return {"orders": [o.dict() for o in result]}
+def get_orders(buyer_id: int = None, seller_id: int = None, status: str = None,
+    date_from: str = None, date_to: str = None, page: int = 1, limit: int = None, include_items: bool = True):
+    """未指定 limit 時回傳全部符合的訂單（與未分頁前相同）；分頁時以 total / has_more 判斷是否還有下一頁"""
+    # 選擇最窄的索引：買家 > (賣家, 狀態) > 賣家全部狀態 > 全域狀態
+    match = None
+    if buyer_id:
+        slices = [_time_slice(orders_by_buyer.get(buyer_id) or SortedKeys(), date_from, date_to)]
+        if seller_id or status:
+            match = lambda o: (not seller_id or o.seller_id == seller_id) and (not status or o.status == status)
+    else:
+        by_status = orders_by_seller.get(seller_id, {}) if seller_id else orders_by_status
+        lists = [by_status.get(status) or SortedKeys()] if status else list(by_status.values())
+        slices = [_time_slice(keys, date_from, date_to) for keys in lists]
+
+    start = (max(page, 1) - 1) * limit if limit else 0
+    stop = start + limit if limit else None
+    if match is None and len(slices) == 1:
+        keys, lo, hi = slices[0]
+        total = hi - lo
+        page_keys = keys[lo + start:hi if stop is None else min(hi, lo + stop)]
+    else:
+        merged = heapq.merge(*[keys.irange(lo, hi) for keys, lo, hi in slices])
+        if match is None:
+            total = sum(hi - lo for _, lo, hi in slices)
+            page_keys = list(islice(merged, start, stop))
+        else:
+            hits = [k for k in merged if match(orders_by_id[k[1]])]
+            total = len(hits)
+            page_keys = hits[start:stop]
+    return {"orders": [_order_out(orders_by_id[oid], include_items) for _, oid in page_keys],
+            "total": total, "page": page, "limit": limit, "has_more": start + len(page_keys) < total}
+
+@app.put("/api/orders/{order_id}/status")
+def update_order_status(order_id: int, status: str = Form(...)):
+    o = orders_by_id.get(order_id)
+    if not o:
+        raise HTTPException(status_code=404, detail="訂單不存在")
+    if status not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail="無效的訂單狀態")
+    with orders_lock:
+        if o.id in settling_orders:
+            raise HTTPException(status_code=409, detail="訂單狀態更新中，請稍後再試")
+        changed, touched = status != o.status, []
+        if changed:
+            lsn = append_journal({"op": "status", "order_id": o.id, "status": status})
+            settling_orders.add(o.id)
+            # 取消後恢復先保留庫存；取消則落盤後才補回
+            if o.status == "cancelled":
+                touched = adjust_stock(o.items, -1)
+    if changed:
+        def apply():
+            settling_orders.discard(o.id)
+            if status == "cancelled":
+                touched.extend(adjust_stock(o.items, 1))
+            apply_order_status(o, status)
+
+        def rollback():
+            settling_orders.discard(o.id)
+            if touched:
+                adjust_stock(o.items, 1)
+
+        commit_journal(lsn, apply, rollback)
+        record_change("order", o.id)
+        stock_changed(touched)
+    return {"message": "訂單狀態已更新", "order": o.dict()}
 
 # ============== 訊息系統 ==============
 @app.post("/api/messages")
 def send_message(sender_id: int = Form(...), receiver_id: int = Form(...), content: str = Form(...)):
-    msg = Message(id=next_id["message"], sender_id=sender_id, receiver_id=receiver_id, content=content, read=False, created_at=now())
+    msg = MessageRecord.validated(id=next_id["message"], sender_id=sender_id, receiver_id=receiver_id, content=content, read=False, created_at=now())
     messages_db.append(msg)
     next_id["message"] += 1
     return {"message": "訊息已發送", "message_obj": msg.dict()}
@@ -321,18 +2412,149 @@ def get_messages(user_id: int):
             m.read = True
     return {"messages": [m.dict() for m in msgs]}
 
+# ============== 低庫存警示 ==============
+# 補貨點：商品的 reorder_level 優先，其次為分類門檻，最後為 LOW_STOCK_DEFAULT。
+# 庫存 <= 補貨點的上架商品以 (庫存 - 補貨點, product_id) 存放在排序清單，最缺貨的在前，查詢只取前 k 筆；
+# 商品跨越補貨點時寫入變更紀錄（kind "low_stock"），前端輪詢 /api/changes 即可收到通知
+LOW_STOCK_DEFAULT = int(os.environ.get("LOW_STOCK_DEFAULT", "2"))
+LOW_STOCK_MAX_LIMIT = 500
+
+class LowStockIndex:
+    def __init__(self):
+        self.category_levels: Dict[str, int] = {}
+        self.entries: List[tuple] = []               # (庫存 - 補貨點, product_id)
+        self.by_seller: Dict[int, List[tuple]] = {}
+        self.keys: Dict[int, tuple] = {}             # product_id -> 目前在清單中的鍵
+        self.inherits: Dict[str, set] = {}           # 分類 -> 未個別設定補貨點的 product_id
+        self.stats = {"updates": 0, "alerts": 0, "recovered": 0}
+        self.lock = threading.Lock()
+
+    def level(self, p: ProductRecord) -> int:
+        return p.reorder_level if p.reorder_level is not None else self.category_levels.get(p.category, LOW_STOCK_DEFAULT)
+
+    def update(self, p: ProductRecord, removed: bool = False):
+        """庫存、補貨點或上下架變動後呼叫；跨越補貨點時寫入變更紀錄"""
+        with self.lock:
+            members = self.inherits.setdefault(p.category, set())
+            if removed or p.reorder_level is not None:
+                members.discard(p.id)
+            else:
+                members.add(p.id)
+            level = self.level(p)
+            key = (p.stock - level, p.id) if not removed and p.status == "active" and p.stock <= level else None
+            old = self.keys.get(p.id)
+            self.stats["updates"] += 1
+            if key == old:
+                return
+            if old:
+                _remove_key(self.entries, old)
+                _remove_key(self.by_seller[p.seller_id], old)
+                del self.keys[p.id]
+            if key:
+                bisect.insort(self.entries, key)
+                bisect.insort(self.by_seller.setdefault(p.seller_id, []), key)
+                self.keys[p.id] = key
+            crossed = (old is None) != (key is None)
+            if crossed:
+                self.stats["alerts" if key else "recovered"] += 1
+        if crossed:
+            record_change("low_stock", p.id, "upsert" if key else "delete")
+
+    def set_category_level(self, category: str, level: Optional[int]) -> dict:
+        """只重新判斷沿用分類門檻的商品；回傳更新後的分類門檻"""
+        with self.lock:
+            if level is None:
+                self.category_levels.pop(category, None)
+            else:
+                self.category_levels[category] = level
+            members = list(self.inherits.get(category, ()))
+            levels = dict(self.category_levels)
+        for pid in members:
+            p = products_by_id.get(pid)
+            if p:
+                self.update(p)
+        return levels
+
+    def thresholds(self) -> dict:
+        with self.lock:
+            return dict(self.category_levels)
+
+    def lowest(self, limit: int, seller_id: int = None) -> tuple:
+        with self.lock:
+            entries = self.entries if seller_id is None else self.by_seller.get(seller_id, [])
+            return entries[:limit], len(entries)
+
+    def metrics(self) -> dict:
+        return {"low": len(self.entries), **self.stats}
+
+low_stock = LowStockIndex()
+
+def low_stock_item(p: ProductRecord) -> dict:
+    level = low_stock.level(p)
+    return {"product_id": p.id, "name": p.name, "seller_id": p.seller_id, "category": p.category, "stock": p.stock,
+            "reorder_level": level, "shortfall": level - p.stock}
+
+def adjust_stock(items: List[dict], sign: int) -> List[ProductRecord]:
+    """訂單成立扣庫存（sign=-1）、取消時補回（sign=1）；須持有 orders_lock，回傳異動的商品"""
+    touched = []
+    for i in items:
+        p = products_by_id.get(i["product_id"])
+        if p:
+            p.stock += sign * i["quantity"]
+            touched.append(p)
+    return touched
+
+def stock_changed(products: List[ProductRecord]):
+    for p in products:
+        low_stock.update(p)
+        record_change("stock", p.id)
+
 # ============== 庫存管理 ==============
 @app.get("/api/inventory")
 def get_inventory():
-    return {"inventory": [{"product_id": p.id, "name": p.name, "stock": p.stock, "status": p.status} for p in products_db]}
+    return {"inventory": [{"product_id": p.id, "name": p.name, "stock": p.stock, "reorder_level": low_stock.level(p),
+                           "status": p.status} for p in products_db]}
+
+@app.get("/api/inventory/low-stock")
+def get_low_stock(limit: int = 50, seller_id: int = None):
+    """庫存小於等於補貨點的上架商品，依缺口由大到小；seq 可作為 /api/changes?kinds=low_stock 的起點"""
+    seq = change_seq
+    keys, total = low_stock.lowest(min(max(limit, 1), LOW_STOCK_MAX_LIMIT), seller_id)
+    items = [low_stock_item(products_by_id[pid]) for _, pid in keys if pid in products_by_id]
+    return {"items": items, "total": total, "seq": seq}
+
+@app.get("/api/inventory/thresholds")
+def get_thresholds():
+    return {"default": LOW_STOCK_DEFAULT, "categories": low_stock.thresholds()}
+
+@app.put("/api/inventory/thresholds")
+def set_category_threshold(category: str = Form(...), reorder_level: int = Form(None)):
+    """設定分類補貨點；reorder_level 留空則改回預設值。未個別設定的商品重新判斷"""
+    if reorder_level is not None and reorder_level < 0:
+        raise HTTPException(status_code=400, detail="補貨點不可為負數")
+    levels = low_stock.set_category_level(category, reorder_level)
+    return {"message": "補貨點已更新", "default": LOW_STOCK_DEFAULT, "categories": levels}
+
+@app.put("/api/inventory/{product_id}/threshold")
+def set_product_threshold(product_id: int, reorder_level: int = Form(None)):
+    """設定商品補貨點；留空則改用分類門檻"""
+    p = products_by_id.get(product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    if reorder_level is not None and reorder_level < 0:
+        raise HTTPException(status_code=400, detail="補貨點不可為負數")
+    p.reorder_level = reorder_level
+    low_stock.update(p)
+    return {"message": "補貨點已更新", "product": p.dict()}
 
 @app.put("/api/inventory/{product_id}")
 def update_stock(product_id: int, stock: int = Form(...)):
-    for p in products_db:
-        if p.id == product_id:
-            p.stock = stock
-            return {"message": "庫存更新成功", "product": p.dict()}
-    raise HTTPException(status_code=404, detail="商品不存在")
+    p = products_by_id.get(product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    p.stock = stock
+    stock_changed([p])
+    return {"message": "庫存更新成功", "product": p.dict()}
 
 # ============== 帳務 ==============
 @app.get("/api/finance/summary")
@@ -340,6 +2562,69 @@ def get_finance_summary():
     total_sales = sum(o.total_amount for o in orders_db if o.status in ["paid", "shipped", "completed"])
     return {"total_sales": total_sales, "total_orders": len(orders_db), "pending_orders": len([o for o in orders_db if o.status == "pending"])}
 
+@app.get("/api/finance/analytics")
+def get_finance_analytics(seller_id: int = None, date_from: str = None, date_to: str = None, top: int = 10):
+    """營收依品牌、類型、月份、買家分組，熱銷商品與平均客單價；只計入已付款、出貨、完成的訂單"""
+    try:
+        cols, lo, hi = sales.snapshot(date_from, date_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式錯誤")
+    top = min(max(top, 1), 100)
+    # 以商品為最細粒度加總，品牌與類型再由商品彙整
+    if seller_id is not None:
+        rows = lo + np.flatnonzero(cols["seller"][lo:hi] == seller_id)
+        cols = {name: col[rows] for name, col in cols.items()}
+        by_product, qty_by_product, by_buyer = _bincounts(cols)
+    else:
+        by_product, qty_by_product, by_buyer = sales.grouped(cols, lo, hi)
+        cols = {name: col[lo:hi] for name, col in cols.items()}
+    net, first, day = cols["net"], cols["first"], cols["day"]
+
+    products = np.flatnonzero(by_product)
+    skus = [sales.skus.get(int(pid), (None, "未知", "未知")) for pid in products]
+    brands = sorted({s[1] for s in skus})
+    categories = sorted({s[2] for s in skus})
+    brand_codes = np.array([brands.index(s[1]) for s in skus], dtype=np.intp)
+    category_codes = np.array([categories.index(s[2]) for s in skus], dtype=np.intp)
+
+    # day 遞增，月份邊界以二分搜尋切段後 reduceat
+    months = []
+    if len(day):
+        start, end = date.fromordinal(int(day[0])), date.fromordinal(int(day[-1]))
+        month_keys = [(y, m) for y in range(start.year, end.year + 1) for m in range(1, 13)
+                      if (start.year, start.month) <= (y, m) <= (end.year, end.month)]
+        bounds = np.searchsorted(day, [date(y, m, 1).toordinal() for y, m in month_keys])
+        bounds[0] = 0
+        present = bounds < np.append(bounds[1:], len(day))
+        revenue = np.zeros(len(month_keys))
+        revenue[present] = np.add.reduceat(net, bounds[present])
+        ends = np.append(bounds[1:], len(day))
+        months = [{"month": f"{y}-{m:02d}", "revenue": round(float(r), 2), "orders": int(np.count_nonzero(first[lo:hi]))}
+                  for (y, m), r, lo, hi in zip(month_keys, revenue, bounds, ends)]
+
+    total = float(by_product.sum())
+    order_count = int(np.count_nonzero(first))
+    # 待付款訂單不在銷售欄位內，改由狀態索引以相同的日期區間切出
+    _, p_lo, p_hi = _time_slice((orders_by_seller.get(seller_id, {}) if seller_id is not None else orders_by_status)
+                                .get("pending") or SortedKeys(), date_from, date_to)
+    names = {u.id: u.company_name for u in users_db}
+    return {
+        "revenue": round(total, 2),
+        "orders": order_count,
+        "units": int(qty_by_product.sum()),
+        "average_order_value": round(total / order_count, 2) if order_count else 0,
+        "pending_orders": p_hi - p_lo,
+        "line_items": len(net),
+        "by_brand": _group(brands, brand_codes, by_product[products]),
+        "by_category": _group(categories, category_codes, by_product[products]),
+        "by_month": months,
+        "top_buyers": [{"buyer_id": int(b), "name": names.get(int(b), str(b)), "revenue": round(float(by_buyer[b]), 2)}
+                       for b in _top(by_buyer, top)],
+        "top_skus": [{"product_id": int(pid), "name": sales.skus.get(int(pid), (None,))[0],
+                      "revenue": round(float(by_product[pid]), 2), "quantity": int(qty_by_product[pid])}
+                     for pid in _top(by_product, top)],
+    }
+
 # ============== 評價 ==============
 @app.post("/api/reviews")
 def create_review(product_id: int = Form(...), buyer_id: int = Form(...), rating: int = Form(...), comment: str = Form(None)):
@@ -357,4 +2642,117 @@ def get_reviews(product_id: int = None):
 # ============== 分類 ==============
 @app.get("/api/categories")
 def get_categories():
-    return {"categories": ["Alto", "Tenor", "Soprano", "Baritone"], "brands": ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth", "其他"]}
+    return {"categories": PRODUCT_CATEGORIES, "brands": PRODUCT_BRANDS}
+
+# ============== 批次 API ==============
+# 機器用戶端一次送出多個操作：[{"op": "add_to_cart", "buyer_id": 3, "product_id": 1}, ...]，
+# Content-Type 為 application/json 或 application/msgpack，回應格式依 Accept（預設同請求）。
+# 各操作的欄位由對應表單端點的參數產生，整批一次驗證，任一筆不合法則整批不執行；
+# 執行時逐筆獨立，回傳 [[狀態碼, 結果或錯誤訊息], ...]，失敗不影響其他操作
+BATCH_MAX_OPS = 1000
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+BATCH_HANDLERS = {
+    "create_product": create_product, "update_product": update_product, "delete_product": delete_product,
+    "update_stock": update_stock, "add_to_cart": add_to_cart, "remove_from_cart": remove_from_cart,
+    "create_inquiry": create_inquiry, "create_order": create_order, "update_order_status": update_order_status,
+    "send_message": send_message, "create_review": create_review, "create_price_rule": create_price_rule,
+    "get_products": products_page, "get_product": product_detail,
+}
+
+def _op_model(op: str, handler):
+    """以端點簽章建立操作模型；Form(...) 為必填，UploadFile 參數不開放"""
+    fields = {"op": (Literal[op], ...)}
+    for name, param in inspect.signature(handler).parameters.items():
+        default = getattr(param.default, "default", param.default)
+        if "UploadFile" in str(param.annotation):
+            continue
+        if default is inspect.Parameter.empty or default is ...:
+            fields[name] = (param.annotation, ...)
+        else:
+            fields[name] = (Optional[param.annotation] if default is None else param.annotation, default)
+    return create_model(f"Batch_{op}", **fields)
+
+BATCH_MODELS = {op: _op_model(op, handler) for op, handler in BATCH_HANDLERS.items()}
+BATCH_PARAMS = {op: list(inspect.signature(handler).parameters) for op, handler in BATCH_HANDLERS.items()}
+BATCH_ASYNC = {op for op, handler in BATCH_HANDLERS.items() if inspect.iscoroutinefunction(handler)}
+batch_ops = TypeAdapter(List[Annotated[Union[tuple(BATCH_MODELS.values())], Field(discriminator="op")]])
+
+def _op_kwargs(op) -> dict:
+    return {name: getattr(op, name, None) for name in BATCH_PARAMS[op.op]}
+
+def _op_error(op, e: Exception) -> list:
+    """非預期的錯誤只記在該操作的位置，不中斷整批"""
+    print(f"Error: 批次操作 {op.op} 失敗：{e!r}")
+    return [500, "伺服器錯誤"]
+
+def _run_sync_ops(ops) -> list:
+    results = []
+    for op in ops:
+        try:
+            results.append([200, BATCH_HANDLERS[op.op](**_op_kwargs(op))])
+        except HTTPException as e:
+            results.append([e.status_code, e.detail])
+        except Exception as e:
+            results.append(_op_error(op, e))
+    return results
+
+async def _run_async_op(op) -> list:
+    try:
+        return [200, await BATCH_HANDLERS[op.op](**_op_kwargs(op))]
+    except HTTPException as e:
+        return [e.status_code, e.detail]
+    except Exception as e:
+        return _op_error(op, e)
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """邊讀邊計數，超過上限即停止讀取"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail=f"請求內容超過 {limit} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail=f"請求內容超過 {limit} bytes")
+    return bytes(body)
+
+def _batch_response(data, accept: str, request_msgpack: bool) -> Response:
+    if any(t in accept for t in MSGPACK_TYPES) or (request_msgpack and "application/json" not in accept):
+        return Response(content=msgpack.packb(data), media_type="application/msgpack")
+    return Response(content=json_body(data), media_type="application/json")
+
+@app.post("/api/batch")
+async def run_batch(request: Request):
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    is_msgpack = content_type in MSGPACK_TYPES
+    if not is_msgpack and content_type != "application/json":
+        raise HTTPException(status_code=415, detail="只接受 application/json 或 application/msgpack")
+    body = await _read_body(request, BATCH_MAX_BYTES)
+    try:
+        payload = msgpack.unpackb(body) if is_msgpack else json.loads(body)
+    except (ValueError, msgpack.UnpackException):
+        raise HTTPException(status_code=400, detail="無法解析請求內容")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="請求內容須為操作陣列")
+    if len(payload) > BATCH_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"單批最多 {BATCH_MAX_OPS} 個操作")
+    try:
+        ops = batch_ops.validate_python(payload)
+    except ValidationError as e:
+        errors = [{"index": err["loc"][0], "field": ".".join(str(x) for x in err["loc"][2:]) or None, "msg": err["msg"]}
+                  for err in e.errors(include_url=False, include_input=False)]
+        return JSONResponse(status_code=422, content={"detail": errors})
+    # 連續的同步操作合併成一次執行緒池呼叫；建立、更新商品為非同步端點，在事件迴圈上執行
+    results, i = [], 0
+    while i < len(ops):
+        if ops[i].op in BATCH_ASYNC:
+            results.append(await _run_async_op(ops[i]))
+            i += 1
+            continue
+        j = i
+        while j < len(ops) and ops[j].op not in BATCH_ASYNC:
+            j += 1
+        results += await run_in_threadpool(_run_sync_ops, ops[i:j])
+        i = j
+    return _batch_response({"results": results}, request.headers.get("accept", ""), is_msgpack)
@@ -0,0 +1,84 @@
+"""
+批次 API 與逐筆表單端點的吞吐量
+執行：python bench/batch_api.py [操作數] [repo 根目錄]
+啟動 uvicorn，單一用戶端依序送出 N 個操作（預設 20000，加入購物車與發送訊息交錯），
+比較逐筆 urlencoded 表單、multipart 表單，以及 /api/batch 以 JSON、MessagePack 每批 100 / 1000 個操作的每秒操作數。
+"""
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import subprocess
+from pathlib import Path
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+PORT = 8785
+BASE = f"http://127.0.0.1:{PORT}"
+
+import msgpack  # noqa: E402
+import requests  # noqa: E402
+
+def operations():
+    for i in range(N):
+        if i % 2:
+            yield "send_message", {"sender_id": 3, "receiver_id": 2, "content": f"請問第 {i} 批的交期？"}
+        else:
+            yield "add_to_cart", {"buyer_id": 3 + i % 50, "product_id": 1 + i % 20, "quantity": 1}
+
+PATHS = {"send_message": "/api/messages", "add_to_cart": "/api/cart"}
+
+def single(s, multipart):
+    for op, fields in operations():
+        if multipart:
+            r = s.post(BASE + PATHS[op], files={k: (None, str(v)) for k, v in fields.items()})
+        else:
+            r = s.post(BASE + PATHS[op], data=fields)
+        r.raise_for_status()
+
+def batched(s, size, packed):
+    ops = [{"op": op, **fields} for op, fields in operations()]
+    for i in range(0, len(ops), size):
+        chunk = ops[i:i + size]
+        if packed:
+            r = s.post(f"{BASE}/api/batch", data=msgpack.packb(chunk), headers={"Content-Type": "application/msgpack"})
+            results = msgpack.unpackb(r.content)["results"]
+        else:
+            r = s.post(f"{BASE}/api/batch", data=json.dumps(chunk), headers={"Content-Type": "application/json"})
+            results = r.json()["results"]
+        r.raise_for_status()
+        assert all(status == 200 for status, _ in results)
+
+def main():
+    env = dict(os.environ, JOURNAL_DIR=tempfile.mkdtemp(prefix="batch-journal-"))
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(PORT), "--log-level", "warning"],
+                              cwd=ROOT, env=env, start_new_session=True)
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"{BASE}/health")
+                break
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        s = requests.Session()
+        for name, fn in [("逐筆 urlencoded 表單", lambda: single(s, False)),
+                         ("逐筆 multipart 表單", lambda: single(s, True)),
+                         ("批次 JSON ×100", lambda: batched(s, 100, False)),
+                         ("批次 JSON ×1000", lambda: batched(s, 1000, False)),
+                         ("批次 MessagePack ×100", lambda: batched(s, 100, True)),
+                         ("批次 MessagePack ×1000", lambda: batched(s, 1000, True))]:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<22} {N:,} 個操作 {elapsed:6.2f}s   {N / elapsed:8.0f} ops/s")
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+購物車到期回收：時間輪的回收成本與購物車操作延遲
+執行：python bench/cart_expiry.py [買家數] [repo 根目錄]
+建立 N 個買家的購物車（預設 50 萬，每人 1–3 個商品），量測 add_to_cart / get_cart 延遲，對照原本掃描整個
+清單的做法；接著模擬時間流逝（以 CART_TTL 預設 7 天，每 60 秒呼叫一次 sweep_expired，共 1.4 個 TTL），其中 10% 買家
+在 TTL 過半時再次存取，量測每次回收的耗時、總回收時間與每筆回收成本，並確認只有閒置的購物車被回收；
+最後再推進一個 TTL，確認其餘購物車也被回收。回收逐筆取得 carts_lock，請求可在兩筆之間取得鎖。
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+BUYERS = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend import main  # noqa: E402
+
+STEP = 60.0
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def timed(fn, args):
+    samples = []
+    for a in args:
+        t = time.perf_counter()
+        fn(*a)
+        samples.append((time.perf_counter() - t) * 1000)
+    return percentiles(samples)
+
+def main_():
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for buyer in range(1, BUYERS + 1):
+        for _ in range(rng.randint(1, 3)):
+            main.add_to_cart(buyer_id=buyer, product_id=rng.randint(1, 5000), quantity=1)
+    items = len(main.carts_by_id)
+    print(f"{BUYERS:,} 個購物車、{items:,} 個項目，建立 {time.perf_counter() - start:.1f}s，TTL {main.CART_TTL / 86400:.0f} 天")
+
+    sample = [(rng.randint(1, BUYERS),) for _ in range(2000)]
+    p50, p99 = timed(lambda b: main.add_to_cart(buyer_id=b, product_id=rng.randint(1, 5000), quantity=1), sample)
+    print(f"add_to_cart          p50 {p50:.4f} ms   p99 {p99:.4f} ms")
+    p50, p99 = timed(lambda b: main.get_cart(buyer_id=b), sample)
+    print(f"get_cart             p50 {p50:.4f} ms   p99 {p99:.4f} ms")
+    flat = list(main.carts_by_id.values())
+    p50, p99 = timed(lambda b: [c for c in flat if c.buyer_id == b], sample[:50])
+    print(f"對照：掃描整個清單   p50 {p50:.4f} ms   p99 {p99:.4f} ms")
+
+    # 10% 買家在 TTL 過半時再次存取：直接改寫最後存取時間模擬時間流逝
+    t0 = time.monotonic()
+    active = set(rng.sample(range(1, BUYERS + 1), BUYERS // 10))
+    pauses, bursts, now, end = [], [], t0, t0 + main.CART_TTL * 1.4
+    retouched = False
+    start = time.perf_counter()
+    while now < end:
+        now += STEP
+        if not retouched and now >= t0 + main.CART_TTL / 2:
+            for buyer in active:
+                main.cart_expiry.touched[buyer] = now
+            retouched = True
+        before, t = main.cart_expiry.evicted, time.perf_counter()
+        main.sweep_expired(now)
+        pauses.append((time.perf_counter() - t) * 1000)
+        bursts.append(main.cart_expiry.evicted - before)
+    total = time.perf_counter() - start
+    evicted = main.cart_expiry.evicted
+    survivors = set(main.carts_by_buyer)
+    print(f"模擬 {main.CART_TTL * 1.4 / 86400:.1f} 天、{len(pauses):,} 次回收：回收 {evicted:,} 個購物車，剩 {len(survivors):,} 個"
+          f"（{'皆為' if survivors <= active else '含非'}半途存取的買家），剩餘項目 {len(main.carts_by_id):,}")
+    p50, p99 = percentiles(pauses)
+    worst = max(range(len(pauses)), key=pauses.__getitem__)
+    print(f"每次回收  p50 {p50:.3f} ms   p99 {p99:.3f} ms   最長 {pauses[worst]:.1f} ms（該次回收 {bursts[worst]:,} 個）   "
+          f"總計 {total:.2f}s，每個購物車 {total / max(evicted, 1) * 1e6:.1f} µs（含推進空刻）")
+
+    # 再經過一個 TTL，剩下的也應全部回收
+    before, t = main.cart_expiry.evicted, time.perf_counter()
+    main.sweep_expired(now + main.CART_TTL)
+    print(f"再過一個 TTL：回收 {main.cart_expiry.evicted - before:,} 個（{time.perf_counter() - t:.2f}s），剩 {len(main.carts_by_buyer)} 個購物車，時間輪上 {main.expiry_wheel.size} 個計時器")
+
+if __name__ == "__main__":
+    main_()
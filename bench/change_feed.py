@@ -0,0 +1,50 @@
+"""
+增量同步 vs 全量重抓：每次輪詢的傳輸量與伺服器 CPU
+執行：python bench/change_feed.py [商品數] [每輪異動數]
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fastapi.testclient import TestClient  # noqa: E402
+from backend import main  # noqa: E402
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+MUTATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+POLLS = 20
+THUMB = "data:image/jpeg;base64," + "A" * 20_000  # 約 20 KB 的縮圖
+
+def measure(client, requests):
+    cpu, size = time.process_time(), 0
+    for url, params in requests:
+        size += len(client.get(url, params=params).content)
+    return size, (time.process_time() - cpu) * 1000
+
+def main_():
+    random.seed(1)
+    for i in range(1, PRODUCTS + 1):
+        p = main.ProductRecord(id=i, name=f"Sax {i}", brand="Selmer", category="Alto", price=1000 + i, stock=10, images=[THUMB], created_at=main.now())
+        main.products_db.append(p)
+        main.products_by_id[i] = p
+    client = TestClient(main.app)
+    for pid in range(1, 21):
+        client.post("/api/cart", data={"buyer_id": 3, "product_id": pid})
+    seq = client.get("/api/changes", params={"since": 0}).json()["seq"]
+
+    full = [("/api/products", {"limit": PRODUCTS}), ("/api/inventory", None), ("/api/cart", {"buyer_id": 3})]
+    totals = {"full": [0, 0.0], "delta": [0, 0.0]}
+    for _ in range(POLLS):
+        for _ in range(MUTATIONS):
+            client.put(f"/api/inventory/{random.randint(1, PRODUCTS)}", data={"stock": random.randint(0, 20)})
+        for name, reqs in (("full", full), ("delta", [("/api/changes", {"since": seq, "buyer_id": 3})])):
+            size, cpu = measure(client, reqs)
+            totals[name][0] += size
+            totals[name][1] += cpu
+        seq = client.get("/api/changes", params={"since": seq}).json()["seq"]
+    for name, (size, cpu) in totals.items():
+        print(f"{name:>5}：每次輪詢 {size / POLLS / 1024:,.1f} KB，CPU {cpu / POLLS:.2f} ms")
+
+if __name__ == "__main__":
+    main_()
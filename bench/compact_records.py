@@ -0,0 +1,76 @@
+"""
+商品與訂單在記憶體中的大小：Pydantic 模型 vs 精簡紀錄
+執行：python bench/compact_records.py [筆數] [repo 根目錄]
+各以獨立子行程建立 N 筆（預設 100 萬）商品與 N 筆訂單，品牌、分類、狀態等字串每筆都是新物件
+（如同從表單解析而來），量測建立前後的 RSS 差額換算每筆位元組、建立時間，以及一頁 20 筆 dict() 的時間。
+"""
+import gc
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+
+BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth", "Cannonball", "P.Mauriat", "Jupiter", "Conn"]
+CATEGORIES = ["Alto", "Tenor", "Soprano", "Baritone"]
+MATERIALS = ["黃銅", "磷銅", "純銀", None]
+PAYMENTS = ["transfer", "credit_card", "cash_on_delivery"]
+ITEM_NAMES = [f"Sax {k}" for k in range(5002)]  # create_order 沿用商品的 name 物件，明細名稱不會重複配置
+
+def fresh(s):
+    """複製出新的字串物件"""
+    return None if s is None else (s + " ")[:-1]
+
+def rss():
+    gc.collect()
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def product(cls, i, now):
+    brand = BRANDS[i % len(BRANDS)]
+    return cls(id=i, name=f"{brand} Series {i % 97} #{i}", brand=fresh(brand), category=fresh(CATEGORIES[i % 4]),
+               seller_id=2 + i % 50, model=f"{brand[:2].upper()}-{i % 900}", year=1990 + i % 35,
+               material=fresh(MATERIALS[i % 4]), condition=fresh("New" if i % 3 else "Used"), price=float(1000 + i % 9000),
+               stock=i % 20, description=None, image_status=fresh("ready"), status=fresh("active"), created_at=now)
+
+def order(cls, i, now):
+    items = [{"product_id": i % 5000 + k, "name": ITEM_NAMES[i % 5000 + k], "price": 1000.0, "list_price": 1000.0,
+              "quantity": 1 + k, "rule_id": None} for k in range(2)]
+    return cls(id=i, order_number=f"ORD{i:012d}", buyer_id=3 + i % 2000, seller_id=2 + i % 50, items=items,
+               total_amount=3000.0, status=fresh("paid"), payment_method=fresh(PAYMENTS[i % 3]),
+               shipping_address=fresh("台北市信義區"), created_at=now)
+
+def child(kind, mode):
+    sys.path.insert(0, str(ROOT))
+    from backend import main
+    cls = {("product", "model"): main.Product, ("product", "record"): main.ProductRecord,
+           ("order", "model"): main.Order, ("order", "record"): main.OrderRecord}[kind, mode]
+    make = product if kind == "product" else order
+    base = rss()
+    start = time.perf_counter()
+    # 每筆時間都不同，與實際由 now() 產生的字串相同
+    rows = [make(cls, i, main.now()) for i in range(1, N + 1)]
+    build = time.perf_counter() - start
+    used = rss() - base
+    dump = cls.model_dump if mode == "model" else cls.dict
+    start = time.perf_counter()
+    for _ in range(100):
+        [dump(r) for r in rows[:20]]
+    page = (time.perf_counter() - start) * 10
+    print(f"{kind:<8} {cls.__name__:<14} {used / N:7.0f} B/筆   RSS +{used / 2**20:7.0f} MB（總 {rss() / 2**20:.0f} MB）   "
+          f"建立 {build:5.1f}s   一頁 dict() {page:.3f} ms")
+
+def main():
+    if len(sys.argv) > 3:
+        child(sys.argv[3], sys.argv[4])
+        return
+    print(f"{N:,} 筆")
+    for kind in ("product", "order"):
+        for mode in ("model", "record"):
+            subprocess.run([sys.executable, __file__, str(N), str(ROOT), kind, mode], check=True)
+
+if __name__ == "__main__":
+    main()
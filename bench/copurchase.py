@@ -0,0 +1,100 @@
+"""
+共購索引的更新成本與查詢延遲
+執行：python bench/copurchase.py [訂單數] [商品數] [repo 根目錄]
+以合成的歷史訂單（預設 500 萬筆、1 萬個商品，每筆 1–6 個商品，熱門度呈長尾，且每個商品有幾個常搭配的配件）
+逐筆餵入 CoPurchaseIndex，量測每筆訂單的更新時間、計數器總數，以及 /api/recommendations
+商品頁與購物車查詢的延遲；另對 200 個抽樣商品精確計數，檢查前 5 名推薦的召回率
+（只計入精確次數至少 MIN_SUPPORT 的配對，長尾商品次數 1 的並列不列入）。
+"""
+import sys
+import time
+from pathlib import Path
+
+ORDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+PRODUCTS = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+ROOT = Path(sys.argv[3]).resolve() if len(sys.argv) > 3 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+from backend import main  # noqa: E402
+
+CHUNK = 100_000
+SAMPLE = 200
+MIN_SUPPORT = 5
+
+def orders(rng):
+    """每筆訂單：一個長尾抽樣的主商品，加上 0–5 個配件（多半是主商品固定的搭配）或隨機商品"""
+    partners = rng.integers(1, PRODUCTS + 1, (PRODUCTS + 1, 4))
+    for _ in range(0, ORDERS, CHUNK):
+        heads = np.minimum(rng.zipf(1.3, CHUNK), PRODUCTS)
+        sizes = rng.integers(0, 6, CHUNK)
+        picks = partners[heads[:, None], rng.integers(0, 4, (CHUNK, 5))]
+        noise = rng.integers(1, PRODUCTS + 1, (CHUNK, 5))
+        extra = np.where(rng.random((CHUNK, 5)) < 0.7, picks, noise)
+        for head, size, row in zip(heads.tolist(), sizes.tolist(), extra.tolist()):
+            yield [head] + row[:size]
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def main_():
+    rng = np.random.default_rng(0)
+    for pid in range(1, PRODUCTS + 1):
+        p = main.ProductRecord(id=pid, name=f"Sax {pid}", brand="Selmer", category="Alto", price=1000.0, stock=10, created_at=main.now())
+        main.products_db.append(p)
+        main.products_by_id[pid] = p
+    sample = set(rng.choice(np.arange(1, PRODUCTS + 1), SAMPLE, replace=False).tolist()) | {1, 2, 3}
+    exact = {pid: {} for pid in sample}
+
+    index, timings, t0 = main.copurchase, [], time.perf_counter()
+    clock = time.perf_counter
+    for n, items in enumerate(orders(rng)):
+        if n % 50 == 0:
+            t = clock()
+            index.record(items)
+            timings.append((clock() - t) * 1e6)
+        else:
+            index.record(items)
+        for pid in sample.intersection(items):
+            counts = exact[pid]
+            for other in set(items):
+                if other != pid:
+                    counts[other] = counts.get(other, 0) + 1
+    elapsed = time.perf_counter() - t0
+    p50, p99 = percentiles(timings)
+    counters = sum(len(c) for c in index.counts.values())
+    print(f"{ORDERS:,} 筆訂單、{PRODUCTS:,} 個商品，容量 {index.capacity}/商品")
+    print(f"餵入總時間（含產生資料與精確計數）{elapsed:.1f}s")
+    print(f"每筆訂單更新  p50 {p50:6.1f} µs   p99 {p99:6.1f} µs")
+    print(f"計數器 {counters:,} 個（上限 {PRODUCTS * index.capacity:,}）")
+
+    hits = total = 0
+    for pid, counts in exact.items():
+        if not counts:
+            continue
+        truth = {other for other, n in sorted(counts.items(), key=lambda kv: -kv[1])[:5] if n >= MIN_SUPPORT}
+        got = {other for other, _ in index.ranked([pid])[:5]}
+        hits, total = hits + len(truth & got), total + len(truth)
+    print(f"前 5 名召回率（{len(exact)} 個抽樣商品、{total} 個次數 ≥ {MIN_SUPPORT} 的配對）{hits / max(total, 1):.3f}")
+
+    def timed(fn, repeat=2000):
+        samples = []
+        for _ in range(repeat):
+            t = clock()
+            fn()
+            samples.append((clock() - t) * 1000)
+        return percentiles(samples)
+
+    head, tail = 1, int(max(sample))
+    for name, fn in [("商品頁（熱門商品）", lambda: main.get_recommendations(product_id=head)),
+                     ("商品頁（長尾商品）", lambda: main.get_recommendations(product_id=tail))]:
+        p50, p99 = timed(fn)
+        print(f"{name:<14} p50 {p50:6.3f} ms   p99 {p99:6.3f} ms")
+    for pid in range(1, 11):
+        main.add_to_cart(buyer_id=3, product_id=pid, quantity=1)
+    p50, p99 = timed(lambda: main.get_recommendations(buyer_id=3))
+    print(f"{'購物車（10 個商品）':<14} p50 {p50:6.3f} ms   p99 {p99:6.3f} ms")
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,117 @@
+"""
+上架時的重複商品偵測：MinHash / LSH 索引的單筆成本與全站分群
+執行：python bench/duplicate_detection.py [商品數] [repo 根目錄]
+依序建立 N 個商品（預設 100 萬，2000 個賣家），其中 5% 是同一賣家既有商品稍作修改後重新上架
+（名稱加字、描述增刪片段、改價格），量測 duplicates.index 在目錄大小 1 萬 / 10 萬 / 100 萬附近的 p50 / p99、
+最長一次（含併入排序陣列，服務中由觸發的請求在鎖外執行），對照對同一賣家全部商品逐一比對簽章的成本；統計重新上架被標記的比例與
+原創商品被誤標的比例，最後量測全站分群時間與索引佔用的記憶體。
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+from backend import main  # noqa: E402
+
+SELLERS = 2000
+BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth", "Cannonball", "P.Mauriat", "Jupiter", "Conn"]
+CATEGORIES = ["Alto", "Tenor", "Soprano", "Baritone"]
+WORDS = ["黃銅", "金漆", "銀鍍", "霧面", "古銅", "手工雕花", "高音F#鍵", "學生款", "專業款", "演奏級", "復刻", "限量",
+         "附硬盒", "附軟袋", "原廠吹嘴", "全新", "二手", "保養過", "換新墊", "公司貨", "水貨", "日本製", "台灣製", "法國製"]
+CHECKPOINTS = (10_000, 100_000, N)
+WINDOW = 2000
+
+def listing(rng, i, seller):
+    brand = rng.choice(BRANDS)
+    model = f"{brand[:2].upper()}-{rng.randint(10, 9999)}"
+    words = rng.sample(WORDS, 6)
+    return main.ProductRecord(
+        id=i, name=f"{brand} {model} {rng.choice(CATEGORIES)} {' '.join(words[:2])}", brand=brand,
+        category=rng.choice(CATEGORIES), seller_id=seller, model=model, price=float(rng.randint(8, 300) * 1000),
+        stock=rng.randint(0, 20), description=f"{' '.join(words[2:])}，序號 {rng.randint(100000, 999999)}，{rng.randint(1960, 2024)} 年出廠",
+        status="active", created_at=main.now())
+
+def relist(rng, i, src):
+    """同一商品重新上架：名稱加註、描述增刪片段、價格改動"""
+    description = src.description + rng.choice(["，可議價", "，面交優先", "，歡迎試吹", ""])
+    return main.ProductRecord(
+        id=i, name=src.name + rng.choice([" 再上架", " 特價", "!", ""]), brand=src.brand, category=src.category,
+        seller_id=src.seller_id, model=src.model, price=src.price * rng.choice([0.9, 0.95, 1.0]), stock=src.stock,
+        description=description, status="active", created_at=main.now())
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def main_():
+    rng = random.Random(0)
+    by_seller = {}
+    planted = flagged_planted = originals = flagged_originals = 0
+    samples, worst, report = [], (0.0, 0), []
+    start = time.perf_counter()
+    for i in range(1, N + 1):
+        seller = rng.randint(2, SELLERS + 1)
+        mine = by_seller.setdefault(seller, [])
+        dup = mine and rng.random() < 0.05
+        p = relist(rng, i, main.products_by_id[rng.choice(mine)]) if dup else listing(rng, i, seller)
+        main.products_by_id[i] = p
+        t = time.perf_counter()
+        found = main.duplicates.index(p)
+        elapsed = (time.perf_counter() - t) * 1000
+        if dup:
+            planted += 1
+            flagged_planted += bool(found)
+        else:
+            originals += 1
+            flagged_originals += bool(found)
+        mine.append(i)
+        if elapsed > worst[0]:
+            worst = (elapsed, i)
+        if i > CHECKPOINTS[len(report)] - WINDOW:
+            samples.append(elapsed)
+            if i == CHECKPOINTS[len(report)]:
+                report.append((i, *percentiles(samples)))
+                samples = []
+                if len(report) == len(CHECKPOINTS):
+                    break
+    total = time.perf_counter() - start
+    print(f"{N:,} 個商品、{SELLERS} 個賣家，建立與索引共 {total:.1f}s")
+    for size, p50, p99 in report:
+        print(f"  目錄 {size:>9,} 筆附近  index() p50 {p50:.3f} ms   p99 {p99:.3f} ms")
+    m = main.duplicates.metrics()
+    print(f"  最長一次 {worst[0]:.1f} ms（第 {worst[1]:,} 筆），併入排序陣列 {m['merges']} 次共 {m['merge_ms'] / 1000:.2f}s、"
+          f"最長 {m['merge_max_ms']:.0f} ms（由觸發的請求在鎖外執行，不擋其他請求）")
+    print(f"重新上架 {planted:,} 筆被標記 {flagged_planted / planted:.1%}；原創 {originals:,} 筆被誤標 {flagged_originals / originals:.2%}")
+
+    # 對照：與同一賣家全部商品逐一比對簽章（不含取 shingle / MinHash）
+    d = main.duplicates
+    probes = [main.products_by_id[rng.randint(1, N)] for _ in range(200)]
+    times = []
+    for p in probes:
+        rows = np.array(by_seller[p.seller_id])
+        t = time.perf_counter()
+        (d.sigs[rows] == d.sigs[p.id]).mean(axis=1) >= main.DUPLICATE_SIMILARITY
+        times.append((time.perf_counter() - t) * 1000)
+    print(f"對照：逐一比對同一賣家約 {N // SELLERS} 筆  p50 {percentiles(times)[0]:.3f} ms")
+    times = []
+    for p in probes[:20]:
+        t = time.perf_counter()
+        (d.sigs == d.sigs[p.id]).mean(axis=1) >= main.DUPLICATE_SIMILARITY
+        times.append((time.perf_counter() - t) * 1000)
+    print(f"對照：逐一比對全站 {N:,} 筆  p50 {percentiles(times)[0]:.1f} ms")
+
+    t = time.perf_counter()
+    clusters = d.cluster()
+    elapsed = time.perf_counter() - t
+    print(f"全站分群 {elapsed:.2f}s：{len(clusters):,} 群、{sum(map(len, clusters)):,} 個商品，最大一群 {len(clusters[0]) if clusters else 0} 個")
+    index_bytes = d.sigs.nbytes + d.alive.nbytes + d.keys.nbytes + d.key_rows.nbytes
+    print(f"索引陣列 {index_bytes / 2**20:.0f} MB（簽章 {d.sigs.nbytes / 2**20:.0f} MB、段鍵 {m['keys']:,} 個），"
+          f"待合併 dict {d.pending_keys:,} 個段鍵")
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,93 @@
+"""
+內嵌模式與 HTTP 模式的單次呼叫延遲
+執行：python bench/embedded_latency.py [次數] [遠端網址]
+以 app.py 的連線設定比較三種後端：
+  embedded   同一行程，requests 經 ASGIAdapter 直接呼叫 backend.main.app
+  localhost  uvicorn 子行程，keep-alive HTTP
+  remote     遠端部署（預設 https://sax-b2b-platform.zeabur.app），無法連線時略過
+每種模式量測 GET /health、GET /api/products?limit=20、POST /api/cart 的 p50 / p95。
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+REMOTE = sys.argv[2] if len(sys.argv) > 2 else "https://sax-b2b-platform.zeabur.app"
+PORT = 8774
+sys.path.insert(0, str(ROOT))
+logging.disable(logging.WARNING)
+
+import requests  # noqa: E402
+import app as frontend  # noqa: E402
+from backend import main as backend  # noqa: E402
+
+def session_for(mode):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=4))
+    if mode == "embedded":
+        session.mount("http://embedded", frontend.ASGIAdapter(backend.app))
+    return session
+
+def seed(session, base):
+    for i in range(200):
+        session.post(f"{base}/api/products", data={"name": f"Sax {i}", "brand": "Selmer", "category": "Alto", "price": 1000 + i, "stock": 5},
+                     timeout=frontend.POST_TIMEOUT)
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+def measure(mode, base, session, writes=True):
+    cases = [("GET /health", lambda: session.get(f"{base}/health", timeout=frontend.GET_TIMEOUT)),
+             ("GET /api/products", lambda: session.get(f"{base}/api/products", params={"limit": 20}, timeout=frontend.GET_TIMEOUT))]
+    if writes:
+        cases.append(("POST /api/cart", lambda: session.post(f"{base}/api/cart", data={"buyer_id": 3, "product_id": 1},
+                                                             timeout=frontend.POST_TIMEOUT)))
+    for name, call in cases:
+        call().raise_for_status()
+        samples = []
+        for _ in range(CALLS):
+            t = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - t) * 1000)
+        print(f"{mode:<10} {name:<18} p50 {percentile(samples, 0.5):8.2f} ms   p95 {percentile(samples, 0.95):8.2f} ms")
+
+def main():
+    session = session_for("embedded")
+    seed(session, "http://embedded")
+    measure("embedded", "http://embedded", session)
+
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(PORT), "--log-level", "warning"],
+                              cwd=ROOT, start_new_session=True)
+    try:
+        base, session = f"http://127.0.0.1:{PORT}", session_for("localhost")
+        for _ in range(100):
+            try:
+                session.get(f"{base}/health")
+                break
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        seed(session, base)
+        measure("localhost", base, session)
+    finally:
+        server.terminate()
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+
+    # 遠端只做讀取，不寫入正式資料
+    try:
+        session = session_for("remote")
+        session.get(f"{REMOTE}/health", timeout=3)
+        measure("remote", REMOTE, session, writes=False)
+    except requests.RequestException as e:
+        print(f"remote     無法連線（{type(e).__name__}），略過")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+上傳期間的事件迴圈卡頓量測
+執行：python bench/event_loop_stall.py [repo 根目錄] [上傳數] [圖片 MB]
+以 ASGI transport 在同一事件迴圈內同時上傳多張大圖，並以 sleep 探針記錄最大卡頓。
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+ROOT = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else Path(__file__).resolve().parent.parent
+UPLOADS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+MEGABYTES = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+from backend import main  # noqa: E402
+
+def make_jpeg(mb: int) -> bytes:
+    side = int((mb * 1024 * 1024 / 3) ** 0.5)
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+async def probe(stop, stalls, interval=0.005):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stalls.append((loop.time() - start - interval) * 1000)
+
+async def run():
+    blob = make_jpeg(MEGABYTES)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop, stalls = asyncio.Event(), []
+        probe_task = asyncio.create_task(probe(stop, stalls))
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client.post("/api/products", data={"name": f"P{i}", "brand": "Selmer", "category": "Alto"},
+                        files={"files": (f"p{i}.jpg", blob, "image/jpeg")})
+            for i in range(UPLOADS)
+        ])
+        accepted = time.perf_counter() - start
+        stop.set()
+        await probe_task
+    stalls.sort()
+    print(f"{UPLOADS} 張 {len(blob) / 1e6:.1f} MB 圖片，全部受理耗時 {accepted * 1000:.0f} ms")
+    print(f"事件迴圈卡頓 p50 {stalls[len(stalls) // 2]:.1f} ms / p99 {stalls[int(len(stalls) * 0.99)]:.1f} ms / max {stalls[-1]:.1f} ms")
+
+asyncio.run(run())
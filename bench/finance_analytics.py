@@ -0,0 +1,96 @@
+"""
+銷售分析彙總時間
+執行：python bench/finance_analytics.py [明細筆數] [repo 根目錄]
+直接填入欄式銷售明細（每筆訂單平均 3 筆明細、3 年、5000 商品、2000 買家、50 賣家），
+量測 /api/finance/analytics 全平台（首次與區塊快取後）與單一賣家的彙總時間；另以 Python 迴圈逐筆加總 orders_db
+的做法在 1/10 資料量上量測作為對照。
+"""
+import sys
+import time
+from pathlib import Path
+from datetime import date
+
+LINES = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+from backend import main  # noqa: E402
+
+BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth"]
+CATEGORIES = ["Alto", "Tenor", "Soprano", "Baritone"]
+
+def fill(n, rng):
+    sales = main.sales
+    sales._reserve(n)
+    start = date(2023, 1, 1).toordinal()
+    first = rng.random(n) < 1 / 3
+    first[0] = True
+    status = rng.integers(0, 5, first.sum())[np.cumsum(first) - 1]
+    recognized = (status >= 1) & (status <= 3)
+    quantity = rng.integers(1, 5, n)
+    price = rng.integers(100, 5000, n).astype(np.float64)
+    c = sales.cols
+    c["day"][:n] = np.sort(rng.integers(start, start + 3 * 365, n))
+    c["seller"][:n] = rng.integers(1, 51, n)
+    c["buyer"][:n] = rng.integers(1, 2001, n)
+    c["product"][:n] = rng.integers(1, 5001, n)
+    c["net"][:n] = np.where(recognized, price * quantity, 0)
+    c["net_qty"][:n] = np.where(recognized, quantity, 0)
+    c["first"][:n] = first & recognized
+    sales.size = n
+    for pid in range(1, 5001):
+        sales.skus[pid] = (f"Sax {pid}", BRANDS[pid % 4], CATEGORIES[pid // 4 % 4])
+
+def python_loop(orders):
+    """對照：逐筆訂單、逐筆明細的字典加總"""
+    by_brand, by_month, by_buyer, by_sku = {}, {}, {}, {}
+    revenue, count = 0.0, 0
+    for o in orders:
+        if o.status not in main.REVENUE_STATUSES:
+            continue
+        count += 1
+        month = o.created_at[:7]
+        for i in o.items:
+            amount = i["price"] * i["quantity"]
+            revenue += amount
+            brand = main.sales.skus[i["product_id"]][1]
+            by_brand[brand] = by_brand.get(brand, 0) + amount
+            by_month[month] = by_month.get(month, 0) + amount
+            by_buyer[o.buyer_id] = by_buyer.get(o.buyer_id, 0) + amount
+            by_sku[i["product_id"]] = by_sku.get(i["product_id"], 0) + amount
+    return revenue / count if count else 0, sorted(by_sku.items(), key=lambda kv: -kv[1])[:10]
+
+def timed(fn, repeat=5):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+def main_():
+    rng = np.random.default_rng(0)
+    t = time.perf_counter()
+    fill(LINES, rng)
+    print(f"填入 {LINES:,} 筆明細：{time.perf_counter() - t:.1f}s，"
+          f"欄位 {sum(c[:LINES].nbytes for c in main.sales.cols.values()) / 1e6:.0f} MB")
+    t = time.perf_counter()
+    main.get_finance_analytics()
+    print(f"全平台彙總（冷）  {(time.perf_counter() - t) * 1000:8.1f} ms")
+    print(f"全平台彙總        {timed(lambda: main.get_finance_analytics()):8.1f} ms")
+    print(f"全平台，近 12 個月 {timed(lambda: main.get_finance_analytics(date_from='2025-01-01')):8.1f} ms")
+    print(f"單一賣家          {timed(lambda: main.get_finance_analytics(seller_id=7)):8.1f} ms")
+
+    # 對照組：1/10 資料量的 OrderRecord 物件
+    n = LINES // 10
+    orders = []
+    for k in range(n // 3):
+        items = [{"product_id": int(pid), "name": "", "price": 1000.0, "quantity": 2} for pid in rng.integers(1, 5001, 3)]
+        orders.append(main.OrderRecord(id=k, order_number=str(k), buyer_id=int(rng.integers(1, 2001)), seller_id=1, items=items,
+                                 total_amount=6000.0, status=main.ORDER_STATUSES[k % 5], created_at="2024-05-01T00:00:00"))
+    print(f"Python 迴圈 {len(orders) * 3:,} 筆明細 {timed(lambda: python_loop(orders), 3):8.1f} ms")
+
+if __name__ == "__main__":
+    main_()
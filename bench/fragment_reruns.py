@@ -0,0 +1,153 @@
+"""
+每次互動的腳本執行次數與後端呼叫次數
+執行：python bench/fragment_reruns.py [repo 根目錄]
+啟動後端 uvicorn 與 Streamlit 伺服器，以 websocket 模擬瀏覽器送出點擊（fragment 內的元件帶上
+fragment_id，與瀏覽器行為相同），統計每個互動觸發的整頁重跑、fragment 重跑與後端請求數。
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+from pathlib import Path
+
+ROOT = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else Path(__file__).resolve().parent.parent
+API_PORT, APP_PORT = 8771, 8772
+
+import requests  # noqa: E402
+import websockets  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+
+backend_requests = []
+
+def tail_access_log(proc):
+    for line in proc.stdout:
+        if "HTTP/1.1" in line:
+            backend_requests.append(line)
+
+class Browser:
+    """只保留點擊需要的狀態：元件 id、所在 fragment、各次重跑"""
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}  # (種類, 標籤, 出現順序) -> (id, fragment_id)
+        self.runs = []     # 每次 new_session：fragment 重跑為 fragment id，整頁重跑為 None
+        self.running = False
+
+    async def pump(self):
+        async for raw in self.ws:
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                ids = list(msg.new_session.fragment_ids_this_run)
+                self.runs.append(ids[0] if ids else None)
+                self.running = True
+                if not ids:
+                    self.widgets.clear()
+            elif kind == "script_finished":
+                self.running = False
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                el = msg.delta.new_element
+                etype = el.WhichOneof("type")
+                widget = getattr(el, etype)
+                if hasattr(widget, "id") and hasattr(widget, "label") and widget.id:
+                    n = sum(1 for k in self.widgets if k[:2] == (etype, widget.label))
+                    key = next((k for k, v in self.widgets.items() if v[0] == widget.id), (etype, widget.label, n))
+                    self.widgets[key] = (widget.id, msg.delta.fragment_id)
+
+    def find(self, etype, label, nth=0):
+        return self.widgets[(etype, label, nth)]
+
+    async def send(self, values=(), click=None):
+        """values: [(種類, 標籤, 欄位, 值)]；click: (種類, 標籤, 順序) 觸發的按鈕"""
+        back = BackMsg()
+        state = back.rerun_script
+        state.SetInParent()
+        for etype, label, field, value in values:
+            w = state.widget_states.widgets.add()
+            w.id = self.find(etype, label)[0]
+            setattr(w, field, value)
+        if click:
+            wid, fragment_id = self.find(*click)
+            w = state.widget_states.widgets.add()
+            w.id, w.trigger_value = wid, True
+            state.fragment_id = fragment_id
+        await self.ws.send(back.SerializeToString())
+
+    async def settle(self):
+        """等到腳本停止且 0.5 秒內沒有新的重跑"""
+        await asyncio.sleep(0.2)
+        while True:
+            count = len(self.runs)
+            while self.running:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.5)
+            if len(self.runs) == count and not self.running:
+                return
+
+async def interaction(browser, name, values=(), click=None):
+    runs_before, calls_before = len(browser.runs), len(backend_requests)
+    await browser.send(values, click)
+    await browser.settle()
+    runs = browser.runs[runs_before:]
+    full, fragment = runs.count(None), len(runs) - runs.count(None)
+    calls = len(backend_requests) - calls_before
+    print(f"{name:<12} 整頁重跑 {full}  fragment 重跑 {fragment}  後端請求 {calls}")
+    return {"name": name, "full_runs": full, "fragment_runs": fragment, "backend_calls": calls}
+
+async def session():
+    url = f"ws://127.0.0.1:{APP_PORT}/_stcore/stream"
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+        browser = Browser(ws)
+        pump = asyncio.create_task(browser.pump())
+        await browser.send()
+        await browser.settle()
+        # 登入（不計）
+        await browser.send(click=("button", "🔐 登入", 0))
+        await browser.settle()
+        await browser.send([("text_input", "Email", "string_value", "buyer@sax.com"),
+                            ("text_input", "密碼", "string_value", "buyer123")], click=("button", "登入", 0))
+        await browser.settle()
+        print(f"app: {ROOT / 'app.py'}")
+        await interaction(browser, "切換到商品", click=("button", "🎷 商品", 0))
+        await interaction(browser, "加入購物車", click=("button", "加入購物車", 0))
+        await interaction(browser, "切換到購物車", click=("button", "🛒 購物車", 0))
+        await interaction(browser, "結帳", [("text_area", "收貨地址", "string_value", "台北市")], click=("button", "結帳", 0))
+        await interaction(browser, "切換到後台", click=("button", "⚙️ 後台", 0))
+        await interaction(browser, "新增商品", [("text_input", "商品名稱", "string_value", "Bench Alto")], click=("button", "建立", 0))
+        pump.cancel()
+
+def main():
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(API_PORT)],
+                           cwd=ROOT, start_new_session=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    threading.Thread(target=tail_access_log, args=(api,), daemon=True).start()
+    env = dict(os.environ, API_BASE_URL=f"http://127.0.0.1:{API_PORT}")
+    app = subprocess.Popen([sys.executable, "-m", "streamlit", "run", "app.py", "--server.port", str(APP_PORT),
+                            "--server.headless", "true", "--server.enableXsrfProtection", "false",
+                            "--browser.gatherUsageStats", "false"],
+                           cwd=ROOT, env=env, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for port in (API_PORT, APP_PORT):
+            for _ in range(100):
+                try:
+                    requests.get(f"http://127.0.0.1:{port}/health" if port == API_PORT else f"http://127.0.0.1:{port}/_stcore/health")
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.2)
+        # 先建立一筆商品供加入購物車
+        requests.post(f"http://127.0.0.1:{API_PORT}/api/products", data={"name": "Alto", "brand": "Selmer", "category": "Alto", "price": 100, "stock": 5})
+        del backend_requests[:]
+        asyncio.run(session())
+    finally:
+        for proc in (api, app):
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+
+if __name__ == "__main__":
+    main()
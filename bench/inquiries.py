@@ -0,0 +1,45 @@
+"""
+詢價收件匣效能測試：1M 筆詢價、5k 位賣家
+執行：python bench/inquiries.py [詢價數] [賣家數]
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from backend import main  # noqa: E402
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+SELLERS = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+
+def timed(fn, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+random.seed(1)
+t0 = time.perf_counter()
+for sid in range(1, SELLERS + 1):
+    p = main.ProductRecord(id=sid, name=f"P{sid}", brand="Selmer", category="Alto", seller_id=sid)
+    main.products_db.append(p)
+    main.products_by_id[sid] = p
+ts = main.now()
+for i in range(1, N + 1):
+    pid = random.randint(1, SELLERS)
+    q = main.Inquiry(id=i, product_id=pid, buyer_id=random.randint(1, 20_000), seller_id=pid, message="報價?", created_at=ts)
+    main.inquiries_db.append(q)
+    main.index_inquiry(q)
+print(f"建立 {N:,} 筆詢價 / {SELLERS:,} 位賣家：{time.perf_counter() - t0:.1f}s")
+
+sid = 42
+print(f"賣家收件匣（索引）：{timed(lambda: main.get_inquiries(seller_id=sid, status='pending', limit=50)):.3f} ms")
+print(f"賣家收件匣（全表掃描）：{timed(lambda: [q for q in main.inquiries_db if q.seller_id == sid and q.status == 'pending'], 5):.3f} ms")
+print(f"待回覆計數：{timed(lambda: main.get_open_inquiry_count(seller_id=sid), 10_000) * 1000:.2f} µs")
+
+ids = main.inquiries_by_seller[sid]["pending"][:]
+body = main.InquiryBulkUpdate(seller_id=sid, updates=[main.InquiryUpdate(id=i, reply="已報價") for i in ids])
+start = time.perf_counter()
+r = main.bulk_update_inquiries(body)
+print(f"批次回覆 {r['updated']} 筆：{(time.perf_counter() - start) * 1000:.2f} ms，剩餘待回覆 {r['open_count']}")
@@ -0,0 +1,101 @@
+"""
+低庫存警示：補貨點索引在大量庫存更新下的成本
+執行：python bench/low_stock.py [SKU 數] [repo 根目錄]
+建立 N 個商品（預設 100 萬，4 個分類、2000 個賣家，庫存 0–60，分類補貨點 3–8，1% 商品個別設定補貨點），
+單一執行緒與 8 個執行緒以 update_stock 連續送出 UPDATES 次更新（隨機增減，偶爾補滿），量測每秒更新數、
+單次 p50 / p99 與跨越補貨點的通知數；對照原本逐一掃描 products_db 找商品的 update_stock。
+接著量測 GET /api/inventory/low-stock 取前 50 筆（全站與單一賣家）的延遲，對照掃描全部商品後排序，
+並量測調整一個分類補貨點（約 N/4 個商品重新判斷）的時間。
+"""
+import sys
+import time
+import random
+import threading
+from pathlib import Path
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend import main  # noqa: E402
+
+UPDATES = 200_000
+THREADS = 8
+CATEGORIES = {"Alto": 5, "Tenor": 3, "Soprano": 8, "Baritone": 4}
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def next_stock(rng, stock):
+    return 60 if rng.random() < 0.05 else max(0, stock + rng.randint(-3, 2))
+
+def updater(seed, count, samples):
+    rng = random.Random(seed)
+    for _ in range(count):
+        pid = rng.randint(1, N)
+        stock = next_stock(rng, main.products_by_id[pid].stock)
+        t = time.perf_counter()
+        main.update_stock(product_id=pid, stock=stock)
+        samples.append((time.perf_counter() - t) * 1000)
+
+def main_():
+    rng = random.Random(0)
+    main.low_stock.category_levels.update(CATEGORIES)
+    categories = list(CATEGORIES)
+    start = time.perf_counter()
+    for i in range(1, N + 1):
+        p = main.ProductRecord(id=i, name=f"Sax {i}", brand="Yamaha", category=categories[i % 4], seller_id=2 + i % 2000,
+                               price=1000.0, stock=rng.randint(0, 60), reorder_level=rng.randint(0, 20) if i % 100 == 0 else None,
+                               status="active", created_at=main.now())
+        main.products_db.append(p)
+        main.products_by_id[i] = p
+        main.low_stock.update(p)
+    print(f"{N:,} 個 SKU 建立並索引 {time.perf_counter() - start:.1f}s，低於補貨點 {len(main.low_stock.entries):,} 個")
+
+    for threads in (1, THREADS):
+        alerts = main.low_stock.stats["alerts"] + main.low_stock.stats["recovered"]
+        samples = []
+        workers = [threading.Thread(target=updater, args=(threads * 100 + k, UPDATES // threads, samples)) for k in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        p50, p99 = percentiles(samples)
+        crossed = main.low_stock.stats["alerts"] + main.low_stock.stats["recovered"] - alerts
+        print(f"update_stock 執行緒 {threads}  {UPDATES / elapsed:8.0f} 次/秒   p50 {p50:.4f} ms   p99 {p99:.4f} ms   "
+              f"跨越補貨點 {crossed:,} 次（{crossed / UPDATES:.1%}）")
+
+    samples = []
+    for _ in range(20):
+        pid = rng.randint(1, N)
+        t = time.perf_counter()
+        next(p for p in main.products_db if p.id == pid)
+        samples.append((time.perf_counter() - t) * 1000)
+    print(f"對照：原本逐一掃描 products_db 找商品  p50 {percentiles(samples)[0]:.1f} ms")
+
+    for label, seller in (("全站", None), ("單一賣家", 2)):
+        samples = []
+        for _ in range(1000):
+            t = time.perf_counter()
+            result = main.get_low_stock(limit=50, seller_id=seller)
+            samples.append((time.perf_counter() - t) * 1000)
+        p50, p99 = percentiles(samples)
+        print(f"low-stock 前 50 筆（{label}，共 {result['total']:,} 筆）  p50 {p50:.4f} ms   p99 {p99:.4f} ms")
+    samples = []
+    for _ in range(5):
+        t = time.perf_counter()
+        low = [p for p in main.products_db if p.status == "active" and p.stock <= main.low_stock.level(p)]
+        low.sort(key=lambda p: (p.stock - main.low_stock.level(p), p.id))
+        samples.append((time.perf_counter() - t) * 1000)
+    print(f"對照：掃描全部商品後排序  p50 {percentiles(samples)[0]:.0f} ms（{len(low):,} 筆）")
+
+    t = time.perf_counter()
+    main.low_stock.set_category_level("Alto", 10)
+    print(f"Alto 補貨點 5 → 10：重新判斷 {time.perf_counter() - t:.2f}s，低於補貨點 {len(main.low_stock.entries):,} 個，"
+          f"變更紀錄序號 {main.change_seq:,}")
+
+if __name__ == "__main__":
+    main_()
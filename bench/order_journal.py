@@ -0,0 +1,147 @@
+"""
+訂單日誌對結帳吞吐量的影響
+執行：python bench/order_journal.py [每輪秒數] [repo 根目錄]
+分別以 JOURNAL=0（不寫日誌）、JOURNAL_FSYNC=0（只寫入作業系統快取）、JOURNAL_FSYNC=1（group commit fsync）
+啟動 uvicorn，1 個與 32 個買家同時重複「加入購物車 → 結帳」，量測每秒成交訂單數與結帳延遲 p50 / p99，
+以及 /api/metrics 的每次 fsync 平均合併筆數；最後重新啟動 fsync 模式的服務，確認重播後訂單數一致並記錄重播時間。
+另在同一行程內直接驅動 OrderJournal（不經 HTTP），量測 1 / 32 個寫入執行緒下每秒落盤筆數，
+以及重播 ORDERS 筆訂單（預設 10 萬）的時間。
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+ORDERS = 100_000
+PORT = 8784
+BASE = f"http://127.0.0.1:{PORT}"
+
+import requests  # noqa: E402
+
+def direct():
+    sys.path.insert(0, str(ROOT))
+    from backend import main
+    record = {"op": "order", "order": {"id": 1, "order_number": "ORD2401010000001", "buyer_id": 3, "seller_id": 2,
+              "items": [{"product_id": 1, "name": "Yamaha YAS-280", "price": 32000.0, "list_price": 32000.0,
+                         "quantity": 1, "rule_id": None}], "total_amount": 32000.0, "payment_method": "transfer",
+              "shipping_address": "台北市", "status": "pending", "created_at": "2024-01-01T00:00:00"}}
+    for fsync in (False, True):
+        for writers in (1, 32):
+            directory = tempfile.mkdtemp(prefix="order-journal-")
+            journal = main.OrderJournal(Path(directory), fsync)
+            journal.recover(lambda r: None)
+            journal.start()
+            deadline = time.perf_counter() + min(SECONDS, 5)
+
+            def write():
+                while time.perf_counter() < deadline:
+                    journal.wait(journal.append(record))
+
+            threads = [threading.Thread(target=write) for _ in range(writers)]
+            start_time = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start_time
+            m = journal.metrics()
+            journal.close()
+            shutil.rmtree(directory, ignore_errors=True)
+            print(f"直接寫入 fsync={int(fsync)} 執行緒 {writers:>2}  {m['records'] / elapsed:9.0f} 筆/秒   "
+                  f"每批平均 {m['avg_batch']} 筆（最多 {m['max_batch']}）")
+
+    directory = tempfile.mkdtemp(prefix="order-journal-")
+    journal = main.OrderJournal(Path(directory), False)
+    journal.recover(lambda r: None)
+    journal.start()
+    for i in range(1, ORDERS + 1):
+        order = dict(record["order"], id=i, status="pending")
+        journal.append({"op": "order", "order": order})
+        if i % 4 == 0:
+            journal.append({"op": "status", "order_id": i, "status": "paid"})
+    journal.wait(journal.next_lsn - 1)
+    journal.close()
+    replay = main.OrderJournal(Path(directory), False)
+    replay.recover(main.replay_order_record)
+    print(f"重播 {replay.stats['recovered']:,} 筆記錄（{ORDERS:,} 筆訂單）{replay.stats['recovery_ms']:.0f} ms，"
+          f"每筆 {replay.stats['recovery_ms'] * 1000 / replay.stats['recovered']:.1f} µs")
+    shutil.rmtree(directory, ignore_errors=True)
+
+def start(env):
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(PORT), "--log-level", "warning"],
+                              cwd=ROOT, env=dict(os.environ, **env), start_new_session=True)
+    for _ in range(100):
+        try:
+            requests.get(f"{BASE}/health")
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("服務未啟動")
+
+def stop(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+
+def checkout_loop(buyer_id, deadline, latencies):
+    s = requests.Session()
+    while time.perf_counter() < deadline:
+        s.post(f"{BASE}/api/cart", data={"buyer_id": buyer_id, "product_id": 1, "quantity": 1}).raise_for_status()
+        t = time.perf_counter()
+        r = s.post(f"{BASE}/api/orders", data={"buyer_id": buyer_id, "seller_id": 2, "payment_method": "transfer",
+                                               "shipping_address": "台北市"})
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - t) * 1000)
+
+def run(name, env, clients):
+    server = start(env)
+    try:
+        requests.post(f"{BASE}/api/products", data={"name": "Yamaha YAS-280", "brand": "Yamaha", "category": "Alto",
+                      "price": 32000, "stock": 1_000_000}).raise_for_status()
+        latencies, deadline = [], time.perf_counter() + SECONDS
+        threads = [threading.Thread(target=checkout_loop, args=(1000 + i, deadline, latencies)) for i in range(clients)]
+        start_time = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start_time
+        latencies.sort()
+        journal = requests.get(f"{BASE}/api/metrics").json()["journal"]
+        print(f"{name:<16} 買家 {clients:>2}  {len(latencies) / elapsed:7.1f} 單/秒   p50 {latencies[len(latencies) // 2]:6.1f} ms   "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:6.1f} ms   每批平均 {journal['avg_batch']} 筆（最多 {journal['max_batch']}）")
+        return len(latencies)
+    finally:
+        stop(server)
+
+def main():
+    direct()
+    for clients in (1, 32):
+        for name, env in [("不寫日誌", {"JOURNAL": "0"}), ("寫入不 fsync", {"JOURNAL_FSYNC": "0"}), ("group commit", {})]:
+            directory = tempfile.mkdtemp(prefix="order-journal-")
+            try:
+                env = dict(env, JOURNAL_DIR=directory)
+                orders = run(name, env, clients)
+                if name == "group commit" and clients == 32:
+                    server = start(env)
+                    try:
+                        journal = requests.get(f"{BASE}/api/metrics").json()["journal"]
+                        replayed = requests.get(f"{BASE}/api/orders", params={"limit": 1, "status": "pending"}).json()["total"]
+                        print(f"  重新啟動：重播 {journal['recovered']} 筆記錄 {journal['recovery_ms']} ms，"
+                              f"訂單 {replayed} / {orders}")
+                    finally:
+                        stop(server)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
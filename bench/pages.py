@@ -0,0 +1,262 @@
+"""
+Streamlit 頁面無頭效能量測
+執行：python bench/pages.py [--catalog 100,1000,10000] [--out results.json] [--baseline 舊結果.json] [--repo 根目錄]
+以 AppTest 逐一執行 app.py 與 frontend/app.py 的頁面函式，後端換成本地 stub（商品數可設定），
+每個頁面記錄冷啟動（清空快取）、重跑與互動三種情境的：
+  script_ms    整支腳本執行時間（AppTest 量得）
+  page_ms      頁面函式本身的執行時間
+  calls/bytes  打到後端的請求數與回應位元組數
+  elements     畫面產生的元素數
+結果以 JSON 輸出；指定 --baseline 時與前一版逐項比較，有退步則以狀態碼 1 結束。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth"]
+CATEGORIES = ["Alto", "Tenor", "Soprano", "Baritone"]
+
+# ============== Stub 後端 ==============
+class StubBackend:
+    """回應前端用到的端點，資料依商品數生成；記錄每個請求的路徑與回應大小"""
+    def __init__(self, catalog):
+        self.products = [{
+            "id": i, "name": f"Sax {i}", "brand": BRANDS[i % 4], "category": CATEGORIES[i // 4 % 4],
+            "model": f"M{i}", "year": 2020, "material": "Brass", "condition": "New", "price": 1000.0 + i,
+            "stock": i % 20, "description": "", "images": [], "image_status": "ready", "image_variants": [],
+            "seller_id": 2, "status": "active", "created_at": "2024-01-01T00:00:00",
+        } for i in range(1, catalog + 1)]
+        self.log = []
+        self.lock = threading.Lock()
+
+    def get(self, path, query):
+        arg = lambda name, default=None: query.get(name, [default])[0]
+        if path == "/health":
+            return {"status": "healthy"}
+        if path == "/api/products":
+            page, limit = int(arg("page", 1)), int(arg("limit", 20))
+            rows = [p for p in self.products if p["status"] == arg("status", "active")
+                    and arg("category") in (None, p["category"]) and arg("brand") in (None, p["brand"])]
+            return {"products": rows[(page - 1) * limit:page * limit], "total": len(rows), "page": page, "limit": limit}
+        if path.startswith("/api/products/"):
+            return self.products[int(path.rsplit("/", 1)[1]) - 1]
+        if path == "/api/cart":
+            items = [{"product_id": p["id"], "quantity": 1, "product": p} for p in self.products[:5]]
+            return {"items": items, "total": sum(p["price"] for p in self.products[:5])}
+        if path == "/api/quote":
+            items = [{"cart_id": p["id"], "product_id": p["id"], "quantity": 1, "list_price": p["price"], "unit_price": p["price"],
+                      "subtotal": p["price"], "rule_id": None, "product": p} for p in self.products[:5]]
+            return {"buyer_id": 3, "items": items, "total": sum(p["price"] for p in self.products[:5])}
+        if path == "/api/recommendations":
+            return {"recommendations": [{"product": p, "count": 10 - i} for i, p in enumerate(self.products[5:9])]}
+        if path == "/api/inventory":
+            return {"inventory": [{"product_id": p["id"], "name": p["name"], "stock": p["stock"]} for p in self.products]}
+        if path == "/api/finance/summary":
+            return {"total_sales": 123456.0, "total_orders": 42, "pending_orders": 3}
+        if path == "/api/finance/analytics":
+            top = sorted(self.products, key=lambda p: -p["price"])[:10]
+            return {"revenue": 123456.0, "orders": 42, "units": 80, "average_order_value": 2939.43, "pending_orders": 3,
+                    "line_items": 120, "by_brand": [{"name": b, "revenue": 30864.0} for b in BRANDS],
+                    "by_category": [{"name": c, "revenue": 30864.0} for c in CATEGORIES],
+                    "by_month": [{"month": f"2024-{m:02d}", "revenue": 10288.0, "orders": 3} for m in range(1, 13)],
+                    "top_buyers": [{"buyer_id": 3, "name": "音樂教室", "revenue": 123456.0}],
+                    "top_skus": [{"product_id": p["id"], "name": p["name"], "revenue": p["price"], "quantity": 1} for p in top]}
+        if path == "/api/orders":
+            return {"orders": [], "total": 0}
+        return None
+
+    def post(self, path):
+        if path == "/api/auth/login":
+            return {"message": "登入成功", "user": {"id": 3, "email": "buyer@sax.com", "company_name": "音樂教室", "role": "buyer"}}
+        if path == "/api/cart":
+            return {"message": "已加入購物車"}
+        if path == "/api/orders":
+            return {"message": "訂單建立成功", "order": {"id": 1}}
+        if path == "/api/products":
+            return {"message": "商品建立成功", "product": self.products[0]}
+        return None
+
+    def serve(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, data):
+                body = json.dumps(data if data is not None else {"detail": "Not Found"}).encode()
+                self.send_response(200 if data is not None else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub.lock:
+                    stub.log.append((self.command, self.path, len(body)))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.reply(stub.get(url.path, parse_qs(url.query)))
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.reply(stub.post(urlparse(self.path).path))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+# ============== 頁面情境 ==============
+USER = {"id": 3, "email": "buyer@sax.com", "company_name": "音樂教室", "role": "buyer"}
+
+def button(label=None, key=None):
+    def act(at):
+        target = next(b for b in at.button if (key and b.key == key) or (label and b.label == label))
+        target.click().run()
+    return act
+
+def fill_and_submit(fields, submit):
+    def act(at):
+        for kind, label, value in fields:
+            next(w for w in getattr(at, kind) if w.label == label).input(value)
+        button(submit)(at)
+    return act
+
+def select_radio(value):
+    def act(at):
+        at.radio[0].set_value(value).run()
+    return act
+
+# (檔案, 頁面函式, 初始 session_state, [(互動名稱, 動作)])
+SCENARIOS = [
+    ("app.py", "page_home", {}, []),
+    ("app.py", "page_products", {"user": USER}, [
+        ("add_to_cart", button(key="add_1")),
+        ("next_page", button(key="products_next")),
+    ]),
+    ("app.py", "page_cart", {"user": USER}, [
+        ("checkout", fill_and_submit([("text_area", "收貨地址", "台北市")], "結帳")),
+    ]),
+    ("app.py", "page_admin", {"user": USER}, [
+        ("refresh_products", button(key="refresh_admin_products")),
+        ("create_product", fill_and_submit([("text_input", "商品名稱", "Bench Alto")], "建立")),
+    ]),
+    ("app.py", "page_login", {}, [
+        ("login", fill_and_submit([("text_input", "Email", "buyer@sax.com"), ("text_input", "密碼", "buyer123")], "登入")),
+    ]),
+    ("frontend/app.py", "render_home", {"language": "en"}, []),
+    ("frontend/app.py", "render_sidebar", {"language": "en"}, [
+        ("switch_language", select_radio("ja")),
+    ]),
+]
+
+# 每次執行都重新載入頁面模組（等同 Streamlit 重跑整支腳本），但只呼叫指定的頁面函式
+SCRIPT = '''
+import time
+import runpy
+import streamlit as st
+ns = runpy.run_path({path!r}, run_name="bench_page")
+start = time.perf_counter()
+ns[{func!r}]()
+st.session_state["_bench_page_ms"] = (time.perf_counter() - start) * 1000
+'''
+
+def count_elements(node):
+    children = getattr(node, "children", None) or {}
+    return 1 + sum(count_elements(child) for child in children.values())
+
+def measure(stub, at, step, action=None):
+    stub.log.clear()
+    start = time.perf_counter()
+    if action:
+        action(at)
+    else:
+        at.run()
+    script_ms = (time.perf_counter() - start) * 1000
+    return {
+        "step": step,
+        "script_ms": round(script_ms, 2),
+        "page_ms": round(at.session_state["_bench_page_ms"], 2) if "_bench_page_ms" in at.session_state else None,
+        "calls": len(stub.log),
+        "bytes": sum(size for _, _, size in stub.log),
+        "requests": [f"{method} {path}" for method, path, _ in stub.log],
+        "elements": count_elements(at._tree),
+        "exception": [e.value for e in at.exception] or None,
+    }
+
+def run(repo, catalogs):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # 略過 AppTest 的 ScriptRunContext、空 label 等警告
+    logging.disable(logging.WARNING)
+
+    results = []
+    for catalog in catalogs:
+        stub = StubBackend(catalog)
+        server = stub.serve()
+        os.environ["API_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+        for path, func, state, interactions in SCENARIOS:
+            # 清空跨 session 的快取與連線池，冷啟動才可比較
+            st.cache_resource.clear()
+            st.cache_data.clear()
+            at = AppTest.from_string(SCRIPT.format(path=str(repo / path), func=func), default_timeout=120)
+            for key, value in state.items():
+                at.session_state[key] = value
+            steps = [measure(stub, at, "cold"), measure(stub, at, "rerun")]
+            steps += [measure(stub, at, name, action) for name, action in interactions]
+            for step in steps:
+                results.append({"catalog": catalog, "file": path, "page": func, **step})
+                print(f"{catalog:>6} {path:<16} {func:<15} {step['step']:<17} {step['script_ms']:>9.1f} ms "
+                      f"{step['calls']:>3} calls {step['bytes'] / 1024:>9.1f} KB {step['elements']:>5} el"
+                      f"{'  EXC' if step['exception'] else ''}", file=sys.stderr)
+        server.shutdown()
+    return results
+
+def regressions(baseline, results, tolerance):
+    """同一 (商品數, 檔案, 頁面, 情境) 下，時間超過容許比例，或請求數、位元組、元素數增加即視為退步"""
+    old = {(r["catalog"], r["file"], r["page"], r["step"]): r for r in baseline["results"]}
+    found = []
+    for r in results:
+        before = old.get((r["catalog"], r["file"], r["page"], r["step"]))
+        if not before:
+            continue
+        for field in ("calls", "bytes", "elements"):
+            if r[field] > before[field]:
+                found.append((r, field, before[field], r[field]))
+        # 單次量測誤差大，至少差 50 ms 才算
+        if r["script_ms"] > before["script_ms"] * (1 + tolerance) and r["script_ms"] - before["script_ms"] > 50:
+            found.append((r, "script_ms", before["script_ms"], r["script_ms"]))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", type=Path, default=Path(__file__).resolve().parent.parent)
+    parser.add_argument("--catalog", default="100,1000,10000", help="逗號分隔的商品數")
+    parser.add_argument("--out", type=Path, help="JSON 輸出檔；未指定時輸出到 stdout")
+    parser.add_argument("--baseline", type=Path, help="前一版的 JSON 結果")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="執行時間容許增加比例")
+    args = parser.parse_args()
+
+    results = run(args.repo.resolve(), [int(n) for n in args.catalog.split(",")])
+    report = json.dumps({"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, ensure_ascii=False, indent=1)
+    if args.out:
+        args.out.write_text(report, encoding="utf-8")
+    else:
+        print(report)
+    if args.baseline:
+        found = regressions(json.loads(args.baseline.read_text(encoding="utf-8")), results, args.tolerance)
+        for r, field, before, after in found:
+            print(f"退步：{r['catalog']} {r['file']} {r['page']} {r['step']} {field} {before} -> {after}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
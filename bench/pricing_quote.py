@@ -0,0 +1,111 @@
+"""
+批次報價與規則重編譯時間
+執行：python bench/pricing_quote.py [商品數] [repo 根目錄]
+建立商品（20 個品牌）、每個商品 3 個數量級距、每個品牌一條折扣，以及一位買家 2000 個 SKU 的合約價與
+一條品牌合約折扣；量測 500 行購物車的報價（引擎與 POST /api/quote 處理函式），對照逐行套用規則的做法，
+並量測新增單一商品規則、品牌規則時的重編譯時間。
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend import main  # noqa: E402
+
+BRANDS = [f"Brand{i}" for i in range(20)]
+CONTRACT_BUYER = 3
+
+def seed(rng):
+    for pid in range(1, PRODUCTS + 1):
+        p = main.ProductRecord(id=pid, name=f"Sax {pid}", brand=BRANDS[pid % len(BRANDS)], category="Alto",
+                         price=float(rng.randint(100, 5000)), stock=100, created_at=main.now())
+        main.products_db.append(p)
+        main.products_by_id[pid] = p
+    main.next_id["product"] = PRODUCTS + 1
+    t = time.perf_counter()
+    main.pricing.refresh(range(1, PRODUCTS + 1))
+    compile_empty = time.perf_counter() - t
+
+    def rule(**kw):
+        r = main.PriceRule(id=main.next_id["price_rule"], created_at=main.now(), **kw)
+        main.next_id["price_rule"] += 1
+        return r
+
+    # 直接放入索引後一次全量編譯，避免逐條 add_rule 的重複編譯
+    book = main.pricing
+    for pid in range(1, PRODUCTS + 1):
+        for min_qty, discount in ((5, 3), (20, 8), (100, 15)):
+            r = rule(product_id=pid, min_qty=min_qty, discount=discount)
+            book.rules[r.id] = r
+            book.by_product.setdefault(pid, []).append(r.id)
+    for brand in BRANDS:
+        r = rule(brand=brand, min_qty=50, discount=10)
+        book.rules[r.id] = r
+        book.by_brand.setdefault(brand, []).append(r.id)
+    for pid in rng.sample(range(1, PRODUCTS + 1), min(2000, PRODUCTS)):
+        r = rule(product_id=pid, buyer_id=CONTRACT_BUYER, price=round(main.products_by_id[pid].price * 0.8, 2))
+        book.rules[r.id] = r
+        book.by_product[pid].append(r.id)
+    r = rule(brand=BRANDS[0], buyer_id=CONTRACT_BUYER, discount=12)
+    book.rules[r.id] = r
+    book.by_brand[BRANDS[0]].append(r.id)
+    t = time.perf_counter()
+    book.refresh(range(1, PRODUCTS + 1))
+    return compile_empty, time.perf_counter() - t
+
+def per_line(buyer_id, lines):
+    """對照：每行即時收集並套用所有適用規則"""
+    out, total = [], 0.0
+    for pid, qty in lines:
+        p = main.products_by_id[pid]
+        base = unit = p.price or 0
+        for rid in main.pricing.by_product.get(pid, []) + main.pricing.by_brand.get(p.brand, []):
+            r = main.pricing.rules[rid]
+            if r.min_qty <= qty and r.buyer_id in (None, buyer_id):
+                unit = min(unit, r.price if r.price is not None else base * (1 - r.discount / 100))
+        cents = round(unit * 100)
+        total += cents * qty
+        out.append({"product_id": pid, "quantity": qty, "list_price": base, "unit_price": cents / 100, "subtotal": cents * qty / 100})
+    return out, total / 100
+
+def timed(fn, repeat=200):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+def main_():
+    rng = random.Random(0)
+    compile_empty, compile_all = seed(rng)
+    print(f"{PRODUCTS:,} 商品、{len(main.pricing.rules):,} 條規則")
+    print(f"全量編譯（無規則）  {compile_empty * 1000:8.1f} ms")
+    print(f"全量編譯            {compile_all * 1000:8.1f} ms")
+
+    lines = [(rng.randint(1, PRODUCTS), rng.choice((1, 2, 6, 25, 60, 120))) for _ in range(500)]
+    body = main.QuoteRequest(buyer_id=CONTRACT_BUYER, items=[{"product_id": pid, "quantity": q} for pid, q in lines])
+    assert main.pricing.quote(CONTRACT_BUYER, lines)[1] == per_line(CONTRACT_BUYER, lines)[1]
+    for name, fn in [("引擎 500 行（合約買家）", lambda: main.pricing.quote(CONTRACT_BUYER, lines)),
+                     ("引擎 500 行（一般買家）", lambda: main.pricing.quote(None, lines)),
+                     ("POST /api/quote 處理函式", lambda: main.quote_items(body)),
+                     ("對照：逐行套用規則", lambda: per_line(CONTRACT_BUYER, lines))]:
+        p50, p95 = timed(fn)
+        print(f"{name:<24} p50 {p50:7.3f} ms   p95 {p95:7.3f} ms")
+
+    for name, form in [("新增單一商品級距", dict(product_id=1, min_qty=500, discount=20)),
+                       ("新增品牌折扣", dict(brand=BRANDS[1], min_qty=200, discount=18)),
+                       ("新增品牌合約", dict(brand=BRANDS[2], buyer_id=7, discount=9))]:
+        t = time.perf_counter()
+        main.create_price_rule(**{"product_id": None, "brand": None, "buyer_id": None, "min_qty": 1,
+                                  "price": None, "discount": None, **form})
+        print(f"{name:<24} {(time.perf_counter() - t) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main_()
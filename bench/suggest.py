@@ -0,0 +1,109 @@
+"""
+搜尋建議前綴樹的查詢延遲與維護成本
+執行：python bench/suggest.py [商品數] [repo 根目錄]
+以合成目錄（預設 10 萬個商品，名稱約一半含中日韓文字、品牌 40 個、型號各異）建立前綴樹，
+量測 /api/suggest 處理函式在隨機前綴（1–10 字，拉丁與 CJK 各半）上的 p50 / p99，
+以及建立、售出、刪除商品時的樹維護時間。
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend import main  # noqa: E402
+
+BRANDS = ["Selmer", "Yamaha", "Yanagisawa", "Keilwerth", "Cannonball", "P.Mauriat", "Jupiter", "Conn"] + \
+         [f"Brand{i}" for i in range(32)]
+SERIES = ["Super Action", "Reference", "Mark VI", "Custom", "Professional", "Student", "Vintage", "Signature",
+          "Series II", "Series III", "Elite", "Classic"]
+CATEGORIES_EN = ["Alto Saxophone", "Tenor Saxophone", "Soprano Saxophone", "Baritone Saxophone"]
+CATEGORIES_ZH = ["中音薩克斯風", "次中音薩克斯風", "高音薩克斯風", "上低音薩克斯風", "アルトサックス", "테너 색소폰"]
+FINISHES = ["金漆", "銀鍍", "黑鎳", "古銅", "Gold Lacquer", "Silver Plated", "Black Nickel", "Unlacquered"]
+
+def product(pid, rng):
+    brand = rng.choice(BRANDS)
+    if rng.random() < 0.5:
+        name = f"{brand} {rng.choice(SERIES)} {rng.choice(CATEGORIES_EN)} {rng.choice(FINISHES)} #{pid}"
+    else:
+        name = f"{brand} {rng.choice(CATEGORIES_ZH)}{rng.choice(FINISHES)} {rng.choice(SERIES)} {pid}號"
+    model = f"{brand[:2].upper()}-{rng.randint(10, 999)}{rng.choice('ABCDEFGH')}"
+    return main.ProductRecord(id=pid, name=name, brand=brand, category="Alto", model=model, price=1000.0, status="active",
+                        created_at=main.now())
+
+def prefixes(names, rng, count):
+    """從名稱的單字或 CJK 字元起點取 1–10 字前綴"""
+    out = []
+    while len(out) < count:
+        key = main.normalize_text(rng.choice(names))
+        starts = main._word_starts(key)
+        cjk = [i for i in starts if main._is_cjk(key[i])]
+        start = rng.choice(cjk) if cjk and len(out) % 2 else rng.choice(starts)
+        out.append(key[start:start + rng.randint(1, 10)])
+    return out
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], samples[-1]
+
+def count_nodes(node):
+    stack, n = [node], 0
+    while stack:
+        node = stack.pop()
+        n += 1
+        stack.extend((node.children or {}).values())
+    return n
+
+def main_():
+    rng = random.Random(0)
+    catalog = [product(pid, rng) for pid in range(1, PRODUCTS + 1)]
+    t = time.perf_counter()
+    for p in catalog:
+        main.products_db.append(p)
+        main.products_by_id[p.id] = p
+        main.suggester.index_product(p)
+    build = time.perf_counter() - t
+    print(f"{PRODUCTS:,} 商品，{len(main.suggester.terms):,} 個詞，{count_nodes(main.suggester.root):,} 個節點，建立 {build:.1f}s")
+
+    # 模擬銷售讓熱門度有差異
+    for _ in range(200_000):
+        main.suggester.record_sale(rng.randint(1, PRODUCTS), rng.randint(1, 5))
+
+    clock = time.perf_counter
+    queries = prefixes([p.name for p in catalog] + [p.model for p in catalog], rng, 20_000)
+    samples, empty = [], 0
+    for q in queries:
+        t = clock()
+        result = main.get_suggestions(q=q, limit=8)
+        samples.append((clock() - t) * 1000)
+        empty += not result["suggestions"]
+    p50, p99, worst = percentiles(samples)
+    print(f"查詢 {len(queries):,} 個前綴  p50 {p50:.3f} ms   p99 {p99:.3f} ms   最慢 {worst:.3f} ms   無結果 {empty}")
+    for q in ["s", "sel", "selmer super", "薩", "薩克斯", "次中音", "テ", "테너", "mark vi"]:
+        texts = [s["text"] for s in main.get_suggestions(q=q, limit=3)["suggestions"]]
+        print(f"  {q!r:<16} {texts}")
+
+    def timed(fn, args):
+        samples = []
+        for a in args:
+            t = clock()
+            fn(*a)
+            samples.append((clock() - t) * 1000)
+        return percentiles(samples)
+
+    fresh = [product(pid, rng) for pid in range(PRODUCTS + 1, PRODUCTS + 2001)]
+    for p in fresh:
+        main.products_by_id[p.id] = p
+    for name, fn, args in [
+        ("建立商品", main.suggester.index_product, [(p,) for p in fresh]),
+        ("售出", main.suggester.record_sale, [(rng.randint(1, PRODUCTS), 3) for _ in range(2000)]),
+        ("刪除商品", main.suggester.remove_product, [(pid,) for pid in rng.sample(range(1, PRODUCTS + 1), 2000)]),
+    ]:
+        p50, p99, worst = timed(fn, args)
+        print(f"{name:<8} p50 {p50:.3f} ms   p99 {p99:.3f} ms   最慢 {worst:.3f} ms")
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,110 @@
+"""
+同一商品的瞬間大量讀取（thundering herd）
+執行：python bench/thundering_herd.py [同時請求數] [repo 根目錄]
+分別以 SINGLEFLIGHT=0 與 SINGLEFLIGHT=1 啟動 uvicorn，建立一個含圖片（WebP 與縮圖 data URI）的商品，
+先建立所有連線，再同時送出 GET /api/products/1，量測全部完成時間、單一請求 p50 / p99、
+後端 CPU 時間，以及 /api/metrics 的合併統計。
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import resource
+import subprocess
+from pathlib import Path
+
+HERD = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+ROOT = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else Path(__file__).resolve().parent.parent
+PORT = 8783
+
+import requests  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def seed(base):
+    # 平滑漸層加線條，壓縮後大小接近一般商品照
+    size = (1600, 1200)
+    img = Image.merge("RGB", [Image.radial_gradient("L").resize(size), Image.linear_gradient("L").resize(size),
+                              Image.new("L", size, 90)])
+    draw = ImageDraw.Draw(img)
+    for i in range(40):
+        x, y = i * 37 % 1500, i * 53 % 1100
+        draw.ellipse((x, y, x + 120, y + 90), outline=(200, 160, 40), width=6)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    r = requests.post(f"{base}/api/products", data={"name": "Selmer Supreme Alto", "brand": "Selmer", "category": "Alto",
+                      "price": 9800, "stock": 3, "description": "首頁主打商品"},
+                      files=[("files", ("hero.jpg", buf.getvalue(), "image/jpeg"))])
+    r.raise_for_status()
+    for _ in range(200):
+        p = requests.get(f"{base}/api/products/1").json()
+        if p["image_status"] != "processing":
+            return len(json.dumps(p))
+        time.sleep(0.1)
+    raise RuntimeError("圖片處理逾時")
+
+async def herd(n):
+    request = f"GET /api/products/1 HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode()
+    conns = []
+    for i in range(0, n, 500):
+        conns += await asyncio.gather(*[asyncio.open_connection("127.0.0.1", PORT) for _ in range(min(500, n - i))])
+
+    async def one(reader, writer):
+        start = time.perf_counter()
+        writer.write(request)
+        data = await reader.read()
+        writer.close()
+        return time.perf_counter() - start, data.split(b" ", 2)[1]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[one(r, w) for r, w in conns])
+    return time.perf_counter() - start, results
+
+def run(mode):
+    env = dict(os.environ, SINGLEFLIGHT=mode)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(PORT), "--log-level", "warning",
+                               "--backlog", str(HERD * 2), "--limit-concurrency", str(HERD * 2)],
+                              cwd=ROOT, env=env, start_new_session=True)
+    base = f"http://127.0.0.1:{PORT}"
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"{base}/health")
+                break
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        size = seed(base)
+        cpu_before = cpu_seconds(server.pid)
+        wall, results = asyncio.run(herd(HERD))
+        cpu = cpu_seconds(server.pid) - cpu_before
+        latencies = sorted(r[0] * 1000 for r in results)
+        statuses = {}
+        for _, status in results:
+            statuses[status.decode()] = statuses.get(status.decode(), 0) + 1
+        metrics = requests.get(f"{base}/api/metrics").json()["singleflight"]
+        print(f"SINGLEFLIGHT={mode}  回應 {size / 1024:.0f} KB × {HERD}  全部完成 {wall:.2f}s  "
+              f"p50 {latencies[len(latencies) // 2]:.0f} ms  p99 {latencies[int(len(latencies) * 0.99)]:.0f} ms  "
+              f"後端 CPU {cpu:.2f}s  狀態 {statuses}")
+        print(f"  metrics: {metrics}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+
+def main():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, HERD * 2 + 100)), hard))
+    for mode in ("0", "1"):
+        run(mode)
+
+if __name__ == "__main__":
+    main()
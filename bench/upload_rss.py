@@ -0,0 +1,96 @@
+"""
+並行多圖上傳的伺服器記憶體量測
+執行：python bench/upload_rss.py [repo 根目錄] [賣家數] [每人張數] [每張 MB]
+啟動 uvicorn 子行程，讓每位賣家以一個請求上傳多張真正的 JPEG（雜訊影像，約指定 MB；舊版單檔 API 則逐張上傳），
+回應後讀取伺服器行程的 VmHWM（上傳期間峰值 RSS），再等圖片轉檔全部完成後讀取 VmRSS。
+注意：轉檔完成後商品仍把原圖、WebP 與縮圖以 base64 data URI 存在記憶體，
+因此轉檔後的 RSS 會隨圖片數成長，另列出每個商品保留的 data URI 大小。
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else Path(__file__).resolve().parent.parent
+SELLERS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+PER_SELLER = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+MEGABYTES = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+PORT = 8765
+
+import io  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+def rss_kb(pid: int, field: str) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith(field):
+            return int(line.split()[1])
+    return 0
+
+async def seller(client, blob, multi: bool):
+    data = {"name": "Sax", "brand": "Selmer", "category": "Alto"}
+    if multi:
+        files = [("files", (f"{i}.jpg", blob, "image/jpeg")) for i in range(PER_SELLER)]
+        r = await client.post("/api/products", data=data, files=files)
+        return [r.status_code]
+    return [(await client.post("/api/products", data=data, files={"files": ("0.jpg", blob, "image/jpeg")})).status_code
+            for _ in range(PER_SELLER)]
+
+def jpeg(megabytes: int) -> bytes:
+    """雜訊影像壓成 JPEG，品質 95 時約每像素 1.2 bytes"""
+    side = int((megabytes * 1024 * 1024 / 1.2) ** 0.5)
+    pixels = np.random.default_rng(0).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+async def run(pid: int):
+    blob = jpeg(MEGABYTES)
+    multi = "List[UploadFile]" in (ROOT / "backend" / "main.py").read_text()
+    before = rss_kb(pid, "VmRSS")
+    limits = httpx.Limits(max_connections=SELLERS)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        codes = sum(await asyncio.gather(*[seller(client, blob, multi) for _ in range(SELLERS)]), [])
+        elapsed = time.perf_counter() - start
+    print(f"{'多檔單一請求' if multi else '單檔逐張請求'}：{SELLERS} 賣家 × {PER_SELLER} 張 × {len(blob) / 2**20:.1f} MB JPEG，"
+          f"{elapsed:.1f}s，狀態碼 {sorted(set(codes))}")
+    print(f"伺服器 RSS：起始 {before / 1024:.0f} MB，上傳期間峰值 {rss_kb(pid, 'VmHWM') / 1024:.0f} MB")
+    start = time.perf_counter()
+    while True:
+        jobs = httpx.get(f"http://127.0.0.1:{PORT}/api/metrics").json().get("image_jobs", {})
+        if not jobs.get("pending"):
+            break
+        time.sleep(1)
+    # 只取一個商品估計：整頁商品的 data URI 可達數 GB
+    product = httpx.get(f"http://127.0.0.1:{PORT}/api/products/1", timeout=600).json()
+    kept = sum(len(u) for u in product["images"]) + len(str(product.get("image_variants", "")))
+    print(f"轉檔 {time.perf_counter() - start:.1f}s 後完成 {jobs.get('done', '?')} 個、失敗 {jobs.get('failed', '?')} 個；"
+          f"RSS {rss_kb(pid, 'VmRSS') / 1024:.0f} MB（峰值 {rss_kb(pid, 'VmHWM') / 1024:.0f} MB），"
+          f"每個商品保留 data URI 約 {kept / 2**20:.1f} MB")
+
+with tempfile.TemporaryDirectory() as upload_dir:
+    env = dict(os.environ, UPLOAD_DIR=upload_dir, JOURNAL_DIR=upload_dir, MAX_IMAGE_BYTES=str((MEGABYTES + 1) * 1024 * 1024),
+               MAX_UPLOAD_BYTES=str((MEGABYTES + 1) * PER_SELLER * 1024 * 1024), IMAGE_QUEUE_LIMIT="100000")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(PORT), "--log-level", "warning"],
+                              cwd=ROOT, env=env, start_new_session=True)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{PORT}/health")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        asyncio.run(run(server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+        try:
+            os.killpg(server.pid, signal.SIGKILL)  # 清掉仍在轉檔的子行程
+        except ProcessLookupError:
+            pass
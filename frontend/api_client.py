@@ -0,0 +1,49 @@
+"""
+前端共用的 HTTP 元件：斷路器與帶重試的連線池
+app.py 與 frontend/app.py 各自以 st.cache_resource 包裝成跨 session 共用的實例
+"""
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class CircuitBreaker:
+    """連續失敗達門檻即斷路，冷卻期間直接失敗；冷卻後放行一個探測請求"""
+    def __init__(self, threshold=2, cooldown=20):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.time() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+def new_session():
+    """keep-alive 連線池；GET 連線失敗或 502/503/504 時以退避加抖動重試"""
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, status=2, backoff_factor=0.3, backoff_jitter=0.3,
+                  status_forcelist=[502, 503, 504], allowed_methods=["GET"], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -4,12 +4,22 @@
 import streamlit as st
 import requests
 import os
+import csv
+import time
+import bisect
+import ipaddress
 from pathlib import Path
+from api_client import CircuitBreaker, new_session
 
 # ============== API 設定 ==============
 # 後端 API 位址（Zeabur）
 API_BASE_URL = os.environ.get("API_BASE_URL", "https://sax-b2b-platform.zeabur.app")
 
+# 搜尋建議：顯示筆數、快取秒數、(連線, 讀取) 逾時
+SUGGEST_LIMIT = 8
+SUGGEST_CACHE_TTL = 60
+SUGGEST_TIMEOUT = (1, 2)
+
 # ============== 語系配置 ==============
 LANGUAGES = {
     "zh-TW": "繁體中文",
@@ -133,49 +143,123 @@ TRANSLATIONS = {
     }
 }
 
+# ============== HTTP 連線 ==============
+@st.cache_resource
+def http_session():
+    """共用 keep-alive 連線池，重試設定見 api_client.new_session"""
+    session = new_session()
+    return session
+
+@st.cache_resource
+def backend_breaker():
+    return CircuitBreaker()
+
 # ============== 語系偵測 ==============
-def get_client_ip():
-    """取得客戶端IP"""
-    try:
-        # 嘗試從請求頭取得
-        headers = {
-            'User-Agent': 'Streamlit'
-        }
-        response = requests.get('https://api.ipify.org?format=json', headers=headers, timeout=5)
-        return response.json().get('ip', '8.8.8.8')
-    except:
-        return '8.8.8.8'
+# 本地 IP 區段→國碼對照表（DB-IP Lite 等 CSV：start,end,country），不存在時略過 IP 偵測
+IP_COUNTRY_CSV = os.environ.get("IP_COUNTRY_CSV", str(Path(__file__).parent / "ip_country.csv"))
+IP_CACHE_TTL = 3600
+
+# Accept-Language 前綴對應語系（先比對完整標籤再比對主語言）
+ACCEPT_LANGUAGE_MAP = {
+    "zh-tw": "zh-TW", "zh-hk": "zh-TW", "zh-mo": "zh-TW", "zh-hant": "zh-TW",
+    "zh-cn": "zh-CN", "zh-sg": "zh-CN", "zh-hans": "zh-CN", "zh": "zh-CN",
+    "ja": "ja", "ko": "ko", "en": "en",
+}
 
-def get_country_from_ip(ip):
-    """從IP取得國碼"""
+@st.cache_resource
+def ip_country_table():
+    """載入 IP 區段表一次，回傳 (v4 起點, v4 區段), (v6 起點, v6 區段)；依起點排序供二分搜尋"""
+    tables = {4: [], 6: []}
     try:
-        # 使用免費的 ipapi
-        response = requests.get(f'https://ipapi.co/{ip}/json/', timeout=5)
-        if response.status_code == 200:
-            return response.json().get('country_code', 'US')
-    except:
+        with open(IP_COUNTRY_CSV, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                try:
+                    lo, hi = ipaddress.ip_address(row[0].strip()), ipaddress.ip_address(row[1].strip())
+                except ValueError:
+                    continue
+                tables[lo.version].append((int(lo), int(hi), row[2].strip().upper()))
+    except OSError:
         pass
-    return 'US'
+    result = {}
+    for version, ranges in tables.items():
+        ranges.sort()
+        result[version] = ([r[0] for r in ranges], ranges)
+    return result
+
+@st.cache_resource
+def ip_country_cache():
+    """IP → (國碼, 到期時間)，跨 session 共用"""
+    return {}
+
+def lookup_country(ip):
+    """本地查詢 IP 國碼，查無回傳 None"""
+    cache = ip_country_cache()
+    hit = cache.get(ip)
+    if hit and hit[1] > time.time():
+        return hit[0]
+    country = None
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        addr = None
+    if addr is not None and addr.is_global:
+        starts, ranges = ip_country_table()[addr.version]
+        i = bisect.bisect_right(starts, int(addr)) - 1
+        if i >= 0 and ranges[i][1] >= int(addr):
+            country = ranges[i][2]
+    if len(cache) > 10000:
+        cache.clear()
+    cache[ip] = (country, time.time() + IP_CACHE_TTL)
+    return country
+
+def language_from_accept(header):
+    """解析 Accept-Language（含 q 值），回傳第一個支援的語系"""
+    candidates = []
+    for i, part in enumerate(header.split(",")):
+        tag, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if tag and q > 0:
+            candidates.append((-q, i, tag.lower().replace("_", "-")))
+    for _, _, tag in sorted(candidates):
+        subtags = tag.split("-")
+        for n in range(len(subtags), 0, -1):
+            lang = ACCEPT_LANGUAGE_MAP.get("-".join(subtags[:n]))
+            if lang:
+                return lang
+    return None
+
+def get_client_ip():
+    """取得客戶端IP（反向代理的 X-Forwarded-For 優先）"""
+    headers = getattr(st.context, "headers", None) or {}
+    forwarded = headers.get("X-Forwarded-For", "")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return getattr(st.context, "ip_address", None)
 
 def detect_language():
-    """自動偵測語系"""
-    # 檢查 session_state 是否有已儲存的偏好
-    if 'language' not in st.session_state:
-        st.session_state.language = 'en'
-    
-    # 檢查 URL 參數
-    params = st.query_params
-    if 'lang' in params:
-        lang = params['lang']
-        if lang in LANGUAGES:
-            st.session_state.language = lang
-            return
-    
-    # 檢查 Cookie
-    # 如果都沒有，則依 IP 偵測
-    ip = get_client_ip()
-    country = get_country_from_ip(ip)
-    lang = IP_LANGUAGE_MAP.get(country, 'en')
+    """自動偵測語系：URL 參數 > 瀏覽器語言 > 本地 IP 對照 > 英文；每個 session 只偵測一次"""
+    lang = st.query_params.get('lang')
+    if lang in LANGUAGES:
+        st.session_state.language = lang
+        return
+    # 已偵測或使用者已選擇，不再覆寫
+    if 'language' in st.session_state:
+        return
+
+    headers = getattr(st.context, "headers", None) or {}
+    lang = language_from_accept(headers.get("Accept-Language", "") or getattr(st.context, "locale", None) or "")
+    if not lang:
+        ip = get_client_ip()
+        lang = IP_LANGUAGE_MAP.get(lookup_country(ip) if ip else None, 'en')
     st.session_state.language = lang
 
 def set_language(lang):
@@ -193,15 +277,53 @@ def t(key):
 # ============== API 測試 ==============
 def test_api_connection():
     """測試 API 連線"""
+    breaker = backend_breaker()
+    if not breaker.allow():
+        return False, "後端暫時無法連線（斷路中，稍後自動重試）"
     try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=5)
+        response = http_session().get(f"{API_BASE_URL}/health", timeout=(3.05, 5))
         if response.status_code == 200:
+            breaker.success()
             return True, response.json()
         else:
+            breaker.failure()
             return False, f"Status: {response.status_code}"
     except Exception as e:
+        breaker.failure()
         return False, str(e)
 
+# ============== 搜尋建議 ==============
+@st.cache_data(ttl=SUGGEST_CACHE_TTL, max_entries=4096, show_spinner=False)
+def fetch_suggestions(query):
+    """後端前綴建議；失敗時拋出例外，不寫入快取"""
+    response = http_session().get(f"{API_BASE_URL}/api/suggest", params={"q": query, "limit": SUGGEST_LIMIT},
+                                  timeout=SUGGEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json().get("suggestions", [])
+
+def search_suggestions(query):
+    breaker = backend_breaker()
+    if not query or not breaker.allow():
+        return []
+    try:
+        suggestions = fetch_suggestions(query)
+    except (requests.RequestException, ValueError):
+        breaker.failure()
+        return []
+    breaker.success()
+    return suggestions
+
+def pick_suggestion(key, text):
+    st.session_state[key] = text
+
+@st.fragment
+def search_box(key):
+    """搜尋框與建議清單；輸入與點選建議只重跑這個區塊"""
+    query = st.text_input("", key=key, placeholder=t('search_placeholder'), label_visibility="collapsed").strip()
+    for i, s in enumerate(search_suggestions(query)):
+        if s["text"] != query:
+            st.button(s["text"], key=f"{key}_suggest_{i}", on_click=pick_suggestion, args=(key, s["text"]), use_container_width=True)
+
 # ============== 頁面配置 ==============
 def set_page_config():
     st.set_page_config(
@@ -341,7 +463,7 @@ def render_sidebar():
         
         # 搜尋
         st.subheader(t('search_placeholder'))
-        search_query = st.text_input("", placeholder=t('search_placeholder'), label_visibility="collapsed")
+        search_box("sidebar_search")
         
         st.divider()
         
@@ -384,7 +506,7 @@ def render_home():
     # 搜尋列
     search_col1, search_col2, search_col3 = st.columns([2, 1, 1])
     with search_col1:
-        st.text_input("", placeholder=t('search_placeholder'), label_visibility="collapsed")
+        search_box("home_search")
     with search_col2:
         st.button("🔍 搜尋", use_container_width=True)
     